@@ -7,11 +7,45 @@ de procesamiento de imágenes y ejecutar un pipeline de procesamiento por lotes.
 procesadas se muestran en la interfaz de usuario y los resultados, incluidas las clasificaciones
 impulsadas por IA, están disponibles para descargar como un archivo CSV. Las imágenes
 procesadas también se guardan en el disco, organizadas en carpetas según su clasificación.
+
+Streamlit vuelve a ejecutar este script en cada interacción. El estado de la sesión
+(`src.session.Session`, en `st.session_state`) conserva entre ejecuciones los ficheros
+subidos y sus miniaturas, las clasificaciones y los resultados de cada combinación de
+imagen y filtros, así que cada clic en "Procesar" sólo calcula lo que cambió.
 """
+import threading
+
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-from src import pipeline, io_utils, ml
+from src import dedup, instrument, ml, registry, session, workers
+
+
+def parameter_widget(filter_name, parameter):
+    """
+    Muestra el control de un parámetro de un filtro y devuelve su valor.
+
+    Args:
+        filter_name (str): El nombre del filtro.
+        parameter (registry.Parameter): La declaración del parámetro.
+
+    Returns:
+        El valor elegido.
+    """
+    label = parameter.label or parameter.name
+    key = f"{filter_name}.{parameter.name}"
+    if parameter.type is bool:
+        return st.checkbox(label, value=parameter.default, key=key)
+    if parameter.choices is not None:
+        return st.select_slider(
+            label, options=list(parameter.choices), value=parameter.default, key=key
+        )
+    if parameter.minimum is not None and parameter.maximum is not None:
+        return st.slider(
+            label, parameter.minimum, parameter.maximum, parameter.default, key=key
+        )
+    return st.number_input(label, value=parameter.default, key=key)
+
 
 st.title("PhotoLab Express")
 
@@ -19,74 +53,121 @@ st.title("PhotoLab Express")
 uploaded_files = st.file_uploader("Elige las imágenes", accept_multiple_files=True)
 
 if uploaded_files:
-    # Save uploaded files to a temporary directory
-    temp_dir = Path("temp_images")
-    temp_dir.mkdir(exist_ok=True)
-    image_paths = []
+    # Start the persistent worker pool in the background while the user picks
+    # filters; it is reused by every later click of "Procesar".
+    pool = workers.get_pool()
+    if not pool.started:
+        pool.start()
+    # Likewise, load the CLIP model in the background on the first upload
+    if not ml.is_loaded():
+        threading.Thread(target=ml.warmup, daemon=True).start()
+
+    # Uploads, thumbnails and results survive reruns, keyed by file content: a file
+    # is written to temp_images/ and reduced to a thumbnail only the first time
+    if "session" not in st.session_state:
+        st.session_state.session = session.Session(Path("temp_images"))
+    state = st.session_state.session
+    files = {}
     for uploaded_file in uploaded_files:
-        image_path = temp_dir / uploaded_file.name
-        with open(image_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        image_paths.append(image_path)
+        entry = state.add(
+            uploaded_file.name,
+            uploaded_file.getbuffer(),
+            key=getattr(uploaded_file, "file_id", None),
+        )
+        files.setdefault(entry.digest, entry)
+    files = list(files.values())
 
     # --- 2. Display Thumbnails ---
+    readable = [entry for entry in files if entry.thumbnail is not None]
     st.image(
-        [str(p) for p in image_paths], width=100, caption=[p.name for p in image_paths]
+        [entry.thumbnail for entry in readable],
+        width=100,
+        caption=[entry.name for entry in readable],
+        channels="BGR",
     )
 
     # --- 3. Filter Selection ---
-    filter_options = ["Sobel", "Canny", "Gaussian Blur", "Sharpen", "Random Hue Shift"]
-    selected_filters = st.multiselect("Selecciona los filtros:", filter_options)
+    # The options and their parameter widgets come from the filter registry
+    selected_names = st.multiselect("Selecciona los filtros:", registry.names())
+    selected_filters = []
+    for name in selected_names:
+        params = {}
+        parameters = registry.get(name).parameters
+        if parameters:
+            with st.expander(f"Parámetros de {name}"):
+                params = {p.name: parameter_widget(name, p) for p in parameters}
+        selected_filters.append((name, params))
 
     # --- 4. Face Detection ---
     face_detection = st.checkbox("Detectar rostros")
 
-    # --- 5. Processing ---
-    if st.button("Procesar"):
-        with st.spinner("Procesando imágenes..."):
-            # --- Run Pipeline ---
-            results = pipeline.run_pipeline(
-                image_paths, selected_filters, face_detection
-            )
+    # --- 5. Near-duplicates ---
+    deduplicate = st.checkbox("Procesar una sola vez las imágenes casi duplicadas")
+    if deduplicate:
+        dedup_threshold = st.slider(
+            "Umbral de similitud (bits distintos de 64)", 0, 16, dedup.settings["threshold"]
+        )
 
-            # --- AI Classification ---
-            raw_images = [io_utils.load_image(p) for p in image_paths]
-            classifications = ml.classify_batch(raw_images)
+    # --- 6. Instrumentation ---
+    measure_stages = st.checkbox(
+        "Medir el tiempo de cada etapa", value=instrument.settings["enabled"]
+    )
 
-            # --- Display Results ---
+    # --- 7. Processing ---
+    if st.button("Procesar"):
+        with st.spinner("Procesando imágenes..."):
+            # --- Run Pipeline and Display Results as they finish ---
             st.header("Imágenes Procesadas")
+            progress = st.progress(0.0)
+            sections = {
+                True: (st.container(), "Imágenes con Rostros Detectados"),
+                False: (st.container(), "Imágenes sin Rostros Detectados"),
+            }
+            started_sections = set()
+
+            def show(entry, processed):
+                section, title = sections[processed.faces_detected]
+                if processed.faces_detected not in started_sections:
+                    section.subheader(title)
+                    started_sections.add(processed.faces_detected)
+                section.image(processed.thumbnail, width=200, caption=entry.name, channels="BGR")
+
+            # Only the (image, filter chain) combinations not computed on an earlier
+            # click are processed; the others are shown right away
+            key = state.chain_key(selected_filters, face_detection)
+            todo = state.pending(files, key)
+            for entry in files:
+                processed = state.result(entry, key)
+                if processed is not None:
+                    show(entry, processed)
 
-            images_with_faces = []
-            images_without_faces = []
-            processed_images_for_saving = []
-
-            for img, faces_detected in results:
-                processed_images_for_saving.append(img)
-                if faces_detected:
-                    images_with_faces.append(img)
-                else:
-                    images_without_faces.append(img)
-
-            if images_with_faces:
-                st.subheader("Imágenes con Rostros Detectados")
-                st.image(
-                    [io_utils.cv2_to_pil(img) for img in images_with_faces], width=200
-                )
-
-            if images_without_faces:
-                st.subheader("Imágenes sin Rostros Detectados")
-                st.image(
-                    [io_utils.cv2_to_pil(img) for img in images_without_faces],
-                    width=200,
-                )
+            output_dir = Path("output")
+            failed = []
+
+            # Filters, classification and saving overlap (see Session.process); with
+            # deduplication, only one image per group is filtered and classified
+            deduplicator = dedup.Deduplicator(dedup_threshold) if deduplicate else None
+            report = instrument.Report() if measure_stages else None
+            results = state.process(
+                todo, key, selected_filters, face_detection, output_dir, deduplicator, report
+            )
+            for done, (entry, processed) in enumerate(results, 1):
+                progress.progress(done / len(todo))
+                if isinstance(processed, Exception):
+                    failed.append(entry.name)
+                    st.warning(f"No se pudo procesar {entry.name}: {processed}")
+                    continue
+                show(entry, processed)
+            progress.progress(1.0)
 
             # --- Export CSV ---
             st.info(
-                "Nota: La clasificación por IA se basa en el modelo CLIP de OpenAI. Las etiquetas son más precisas pero aún pueden producir resultados inesperados."
+                "Nota: La clasificación por IA se basa en el modelo CLIP de OpenAI. Las "
+                "etiquetas son más precisas pero aún pueden producir resultados inesperados."
             )
             metrics = {
-                "filename": [p.name for p in image_paths],
-                "classification": [c[0] for c in classifications],
+                "filename": [entry.name for entry in files],
+                "classification": [state.labels.get(entry.digest) for entry in files],
             }
             df = pd.DataFrame(metrics)
             st.dataframe(df)
@@ -98,18 +179,34 @@ if uploaded_files:
                 mime="text/csv",
             )
 
-            # --- Save filtered images ---
-            output_dir = Path("output")
-            output_dir.mkdir(exist_ok=True)
-            for i, img in enumerate(processed_images_for_saving):
-                classification = (
-                    classifications[i][0]
-                    .replace("a photo of a ", "")
-                    .replace("an ", "")
-                    .replace("a ", "")
+            # --- Stage timings ---
+            if report is not None:
+                st.subheader("Tiempo por etapa")
+                st.dataframe(pd.DataFrame(report.summary()))
+                st.download_button(
+                    label="Descargar medidas como JSON",
+                    data=report.to_json(),
+                    file_name="photolab_express_stages.json",
+                    mime="application/json",
+                )
+                st.download_button(
+                    label="Descargar traza de Chrome",
+                    data=report.to_chrome_trace(),
+                    file_name="photolab_express_trace.json",
+                    mime="application/json",
                 )
-                category_dir = output_dir / classification
-                category_dir.mkdir(exist_ok=True)
-                io_utils.save_image(img, category_dir / image_paths[i].name)
 
+            if deduplicator is not None:
+                stats = deduplicator.stats
+                st.info(
+                    f"{stats['duplicates']} de {stats['images']} imágenes eran casi "
+                    f"duplicados de otra y no se procesaron de nuevo "
+                    f"({stats['hash_seconds']:.2f} s para agruparlas)."
+                )
+            st.caption(
+                f"{len(files) - len(todo)} resultados reutilizados de esta sesión, "
+                f"{len(todo)} imágenes procesadas."
+            )
+            if failed:
+                st.error(f"{len(failed)} imágenes no se pudieron procesar.")
             st.success("¡Procesamiento completo!")
@@ -0,0 +1,82 @@
+"""
+Benchmark de las claves de caché de `cache.memoize`.
+
+Compara el esquema anterior, en el que la clave era la tupla
+`(func.__name__, args, frozenset(kwargs.items()))` con el array completo dentro,
+contra las claves por contenido actuales. Para cada resolución mide la latencia de
+un fallo (clave + función + escritura), de un acierto, y el tamaño de la base de
+datos resultante.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_cache_keys
+"""
+import inspect
+import os
+import tempfile
+
+from diskcache import Cache
+
+from project.src import filters
+from project.src.cache import _MISSING, function_name, make_key
+from project.profiling.common import RESOLUTIONS, measure, print_table, synthetic_image
+
+# The undecorated filter, so that only the caching layer differs between schemes
+sobel = filters.apply_sobel.__wrapped__
+
+
+def legacy_lookup(store, image):
+    """Replica la lógica de `memoize` anterior a las claves por contenido."""
+    key = (sobel.__name__, (image,), frozenset())
+    if key in store:
+        return store[key]
+    result = sobel(image)
+    store[key] = result
+    return result
+
+
+def digest_lookup(store, image):
+    """Replica la lógica actual de `memoize`."""
+    key = make_key(function_name(sobel), "bench", inspect.signature(sobel), (image,), {})
+    result = store.get(key, default=_MISSING)
+    if result is not _MISSING:
+        return result
+    result = sobel(image)
+    store[key] = result
+    return result
+
+
+def database_size(directory):
+    """Devuelve el tamaño en bytes de los ficheros SQLite de la caché."""
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.startswith("cache.db")
+    )
+
+
+def run(repeat=5):
+    rows = []
+    for label, (width, height) in RESOLUTIONS.items():
+        images = [synthetic_image(width, height, seed=i) for i in range(repeat + 1)]
+        for scheme, lookup in (("legacy", legacy_lookup), ("digest", digest_lookup)):
+            with tempfile.TemporaryDirectory() as directory:
+                with Cache(directory) as store:
+                    pending = iter(images)
+                    miss = measure(lambda: lookup(store, next(pending)), repeat=repeat)
+                    hit = measure(lambda: lookup(store, images[0]), repeat=repeat)
+                    rows.append(
+                        {
+                            "resolution": label,
+                            "scheme": scheme,
+                            "miss_ms": miss["median_ms"],
+                            "hit_ms": hit["median_ms"],
+                            "db_kb": database_size(directory) / 1024,
+                        }
+                    )
+    print_table(rows, ["resolution", "scheme", "miss_ms", "hit_ms", "db_kb"])
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,95 @@
+"""
+Benchmark de la ejecución fusionada de cadenas de filtros.
+
+Compara, para cadenas de 1 a 5 filtros, la aplicación filtro a filtro de
+`filters.py` con `chain`, tanto sin caché (sólo cómputo) como con la caché fría
+(cada iteración usa una imagen nueva, así que se paga el cómputo más el guardado de
+cada resultado en la caché).
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_chain
+"""
+import itertools
+import tempfile
+
+import numpy as np
+
+from project.src import cache, chain, filters
+from project.profiling.common import measure, print_table, synthetic_image
+
+CHAIN = ["Gaussian Blur", "Sobel", "Sharpen", "Canny", "Gaussian Blur"]
+
+FILTERS = {
+    "Sobel": filters.apply_sobel,
+    "Canny": filters.apply_canny,
+    "Gaussian Blur": filters.apply_gaussian_blur,
+    "Sharpen": filters.apply_sharpen,
+}
+
+RESOLUTIONS = {"FullHD": (1920, 1080), "12MP": (4000, 3000)}
+
+
+def sequential(image, filter_names, cached):
+    for name in filter_names:
+        function = FILTERS[name] if cached else FILTERS[name].__wrapped__
+        image = function(image)
+    return image
+
+
+def fused(image, filter_names, cached):
+    if cached:
+        return chain.apply_chain(image, filter_names)
+    return chain.run_plan(image, chain.plan(filter_names))
+
+
+def variants(image, first, count):
+    """
+    Devuelve copias de la imagen desplazadas en brillo, todas distintas entre sí
+    (un cambio de un solo píxel suele desaparecer tras el primer desenfoque, y las
+    etapas siguientes acertarían en la caché).
+    """
+    return [np.add(image, (first + offset) % 256, dtype=np.uint8) for offset in range(count)]
+
+
+def run(repeat=3):
+    previous = dict(cache.settings)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        cache.configure(directory=directory, memory_limit=0)
+        try:
+            for label, (width, height) in RESOLUTIONS.items():
+                seeds = itertools.count()
+                base = synthetic_image(width, height)
+                for length in range(1, len(CHAIN) + 1):
+                    names = CHAIN[:length]
+                    row = {"resolution": label, "filters": length}
+                    for engine, function in (("sequential", sequential), ("fused", fused)):
+                        compute = measure(lambda: function(base, names, False), repeat)
+                        # A new image on every call, so every lookup is a miss
+                        pending = iter(variants(base, next(seeds) * (repeat + 1), repeat + 1))
+                        cold = measure(lambda: function(next(pending), names, True), repeat)
+                        row[f"{engine}_ms"] = compute["median_ms"]
+                        row[f"{engine}_cold_ms"] = cold["median_ms"]
+                    row["speedup"] = row["sequential_cold_ms"] / row["fused_cold_ms"]
+                    rows.append(row)
+        finally:
+            cache.configure(**previous)
+
+    print_table(
+        rows,
+        [
+            "resolution",
+            "filters",
+            "sequential_ms",
+            "fused_ms",
+            "sequential_cold_ms",
+            "fused_cold_ms",
+            "speedup",
+        ],
+    )
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,68 @@
+"""
+Benchmark de la clasificación CLIP por tamaño de micro-lote.
+
+Clasifica un lote de imágenes sintéticas con `ml.ClipClassifier` para varios
+tamaños de micro-lote y mide el throughput (imágenes por segundo) y el pico de
+memoria residente (RSS). Cada tamaño se mide en un subproceso nuevo, porque el pico
+de RSS de un proceso sólo puede crecer. La fila `sin micro-lotes` corresponde al
+comportamiento anterior: todo el lote en una sola pasada del modelo.
+
+Uso (desde la raíz del repositorio; descarga el modelo la primera vez):
+
+    python -m project.profiling.bench_clip
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+from project.profiling.common import print_table, synthetic_image
+
+IMAGES = 128
+BATCH_SIZES = (1, 8, 16, 32, 64, IMAGES)
+
+
+def classify(batch_size, count):
+    """Clasifica `count` imágenes en este proceso y devuelve (imágenes/s, pico MiB)."""
+    from project.src import ml
+
+    images = [synthetic_image(640, 480, seed=index) for index in range(count)]
+    classifier = ml.ClipClassifier(*ml.load_model(), batch_size=batch_size, cache_size=0)
+    start = time.perf_counter()
+    labels = classifier.classify(images)
+    elapsed = time.perf_counter() - start
+    assert len(labels) == count
+    # ru_maxrss is reported in KiB on Linux
+    return count / elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(count=IMAGES):
+    rows = []
+    for batch_size in BATCH_SIZES:
+        output = subprocess.run(
+            [sys.executable, "-m", __spec__.name, "--child", str(batch_size), str(count)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        images_per_s, peak = map(float, output.stdout.strip().splitlines()[-1].split())
+        rows.append(
+            {
+                "batch_size": "sin micro-lotes" if batch_size >= count else batch_size,
+                "images_per_s": images_per_s,
+                "peak_mib": peak,
+            }
+        )
+    print_table(rows, ["batch_size", "images_per_s", "peak_mib"])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", nargs=2, type=int, metavar=("BATCH_SIZE", "IMAGES"))
+    args = parser.parse_args()
+    if args.child:
+        print(*classify(*args.child))
+    else:
+        run()
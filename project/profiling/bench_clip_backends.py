@@ -0,0 +1,100 @@
+"""
+Benchmark de los backends de inferencia de CLIP (`ml.BACKENDS`).
+
+Para cada backend, sobre un conjunto fijo de fotos sintéticas, mide:
+
+- El tiempo de preparar la torre de visión (cuantizar, trazar o exportar).
+- El throughput en micro-lotes de `BATCH_SIZE` imágenes y la latencia de una imagen
+  sola (mediana).
+- La fidelidad frente al modelo float32 ("eager"): la similitud coseno mínima entre
+  los embeddings y la fracción de imágenes con la misma etiqueta más probable
+  (`LABELS`).
+
+Con `--random-weights` se usa la arquitectura de `openai/clip-vit-base-patch32` con
+pesos aleatorios, sin descargar nada: los tiempos son los mismos, pero la
+concordancia de etiquetas no tiene sentido y no se muestra.
+
+Uso (desde la raíz del repositorio; descarga el modelo la primera vez):
+
+    python -m project.profiling.bench_clip_backends [--threads N] [--random-weights]
+"""
+import argparse
+import time
+
+import numpy as np
+from PIL import Image
+
+from project.src import ml
+from project.profiling.common import measure, print_table, synthetic_photo
+
+IMAGES = 64
+BATCH_SIZE = 16
+
+
+def load(random_weights):
+    """Devuelve (modelo, preprocesador de imágenes, embeddings de las etiquetas o None)."""
+    if random_weights:
+        import torch
+        from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel
+
+        torch.manual_seed(0)
+        return CLIPModel(CLIPConfig()).eval(), CLIPImageProcessor(), None
+    model, processor = ml.load_model()
+    text = ml.ClipClassifier(model, processor, cache_size=0).text_embeddings.numpy()
+    return model, processor, text
+
+
+def encode_all(encode, pixels):
+    return np.concatenate(
+        [encode(pixels[start : start + BATCH_SIZE]) for start in range(0, len(pixels), BATCH_SIZE)]
+    )
+
+
+def run(count=IMAGES, random_weights=False):
+    model, processor, text = load(random_weights)
+    images = [synthetic_photo(640, 480, seed) for seed in range(count)]
+    pixels = processor(
+        images=[Image.fromarray(image) for image in images], return_tensors="pt"
+    )["pixel_values"]
+
+    rows = []
+    reference = None
+    for backend in ml.BACKENDS:
+        start = time.perf_counter()
+        try:
+            encode = ml.image_encoder(model, backend)
+        except ImportError as error:
+            print(f"{backend}: {error}")
+            continue
+        prepare = time.perf_counter() - start
+        embeddings = encode_all(encode, pixels)
+        batch = measure(lambda: encode_all(encode, pixels), repeat=3)
+        single = measure(lambda: encode(pixels[:1]), repeat=10)
+        if reference is None:
+            reference = embeddings
+        row = {
+            "backend": backend,
+            "prepare_s": prepare,
+            "images_per_s": count / batch["median_ms"] * 1000,
+            "latency_ms": single["median_ms"],
+            "cos_min": float((embeddings * reference).sum(axis=1).min()),
+        }
+        if text is not None:
+            agree = (embeddings @ text.T).argmax(axis=1) == (reference @ text.T).argmax(axis=1)
+            row["top1_agree"] = float(agree.mean())
+        rows.append(row)
+
+    columns = ["backend", "prepare_s", "images_per_s", "latency_ms", "cos_min"]
+    print_table(rows, columns + ([] if text is None else ["top1_agree"]))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=IMAGES)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop-threads", type=int, default=None)
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+    ml.set_threads(args.threads, args.interop_threads)
+    run(args.images, args.random_weights)
@@ -0,0 +1,53 @@
+"""
+Benchmark de la extracción de colores dominantes.
+
+Mide, para cada resolución y cada modo de `detect.get_dominant_colors`, el tiempo
+de cálculo (sin caché) y el error de cuantización relativo al modo exacto: el
+cociente entre la distancia cuadrática media de cada píxel a su color dominante más
+cercano y la del resultado exacto (1.0 es igual de preciso).
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_colors
+"""
+import numpy as np
+
+from project.src import detect
+from project.profiling.common import RESOLUTIONS, measure, print_table, synthetic_image
+
+K = 5
+
+
+def quantization_error(image, colors):
+    """Distancia cuadrática media de cada píxel a su color dominante más cercano."""
+    pixels = image.reshape(-1, 3).astype(np.float32)
+    best = np.full(len(pixels), np.inf, dtype=np.float32)
+    for color in colors.astype(np.float32):
+        np.minimum(best, ((pixels - color) ** 2).sum(axis=1), out=best)
+    return float(best.mean())
+
+
+def run(repeat=3):
+    dominant_colors = detect.get_dominant_colors.__wrapped__
+    rows = []
+    for label, (width, height) in RESOLUTIONS.items():
+        image = synthetic_image(width, height)
+        exact_error = None
+        for mode in detect.COLOR_MODES:
+            timing = measure(lambda: dominant_colors(image, K, mode), repeat=repeat, warmup=0)
+            error = quantization_error(image, dominant_colors(image, K, mode))
+            exact_error = exact_error or error
+            rows.append(
+                {
+                    "resolution": label,
+                    "mode": mode,
+                    "median_ms": timing["median_ms"],
+                    "relative_error": error / exact_error,
+                }
+            )
+    print_table(rows, ["resolution", "mode", "median_ms", "relative_error"])
+    return rows
+
+
+if __name__ == "__main__":
+    run()
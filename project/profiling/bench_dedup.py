@@ -0,0 +1,99 @@
+"""
+Benchmark de la deduplicación.
+
+Mide, para colecciones de distinto tamaño (fotos sintéticas, cada una con variantes
+casi duplicadas):
+
+- El tiempo de agrupar los hashes con `dedup.MultiIndex` frente a comparar todos
+  los pares.
+- El tiempo de hashear la colección desde disco y, con el índice guardado, en una
+  segunda ejecución.
+- La fracción de imágenes que el pipeline se ahorra.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_dedup
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+
+from project.src import dedup
+from project.profiling.common import near_duplicates, print_table, synthetic_photo
+
+SIZES = (1000, 4000, 16000)
+
+THRESHOLD = 6
+
+
+def make_hashes(count):
+    """Hashes de `count` imágenes: originales seguidos de sus variantes."""
+    images = []
+    seed = 0
+    while len(images) < count:
+        original = synthetic_photo(160, 120, seed)
+        images += [original] + near_duplicates(original)
+        seed += 1
+    return [int(value) for value in dedup.dhash(images[:count])]
+
+
+def pairwise(hashes, threshold):
+    """Agrupa comparando cada hash con todos los representantes (O(n²))."""
+    representatives = []
+    for value in hashes:
+        if not any(dedup.hamming(value, other) <= threshold for other in representatives):
+            representatives.append(value)
+    return len(representatives)
+
+
+def multi_index(hashes, threshold):
+    """Agrupa con el índice multi-tramo, como `Deduplicator.clusters`."""
+    index = dedup.MultiIndex(threshold)
+    for value in hashes:
+        if not index.search(value):
+            index.add(value, None)
+    return len(index)
+
+
+def hashing(count, directory):
+    """Tiempo de hashear `count` imágenes desde disco, sin y con el índice."""
+    paths = []
+    for seed in range(count):
+        path = Path(directory) / f"photo_{seed}.jpg"
+        cv2.imwrite(str(path), synthetic_photo(1920, 1080, seed))
+        paths.append(path)
+    index = Path(directory) / "index.json"
+    timings = {}
+    for run in ("cold", "indexed"):
+        start = time.perf_counter()
+        dedup.Deduplicator(THRESHOLD, index=str(index)).clusters(paths)
+        timings[run] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def run():
+    rows = []
+    for count in SIZES:
+        hashes = make_hashes(count)
+        row = {"images": count}
+        for label, function in (("pairwise_ms", pairwise), ("multi_index_ms", multi_index)):
+            start = time.perf_counter()
+            unique = function(hashes, THRESHOLD)
+            row[label] = (time.perf_counter() - start) * 1000
+        row["skipped"] = f"{1 - unique / count:.0%}"
+        rows.append(row)
+    print_table(rows, ["images", "pairwise_ms", "multi_index_ms", "skipped"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        timings = hashing(100, directory)
+    print(
+        f"\nHashear 100 JPEG FullHD: {timings['cold']:.0f} ms; "
+        f"con el índice guardado: {timings['indexed']:.0f} ms"
+    )
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,105 @@
+"""
+Benchmark del almacén de embeddings (`embeddings.EmbeddingStore`).
+
+Para colecciones de 10 000 y 100 000 embeddings de dimensión 512 (vectores
+sintéticos agrupados alrededor de unas direcciones, como los de fotos parecidas),
+mide:
+
+- El tiempo de añadirlos al almacén (en lotes de 1 000) y su tamaño en disco.
+- La búsqueda exacta de los 10 más parecidos: una consulta sola y por consulta en
+  un lote de 32.
+- El índice aproximado: el tiempo de entrenarlo, el de una consulta y el recall@10
+  frente a la búsqueda exacta.
+- Volver a etiquetar toda la colección con 4 etiquetas.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_embeddings
+"""
+import tempfile
+import time
+
+import numpy as np
+
+from project.src import embeddings
+from project.profiling.common import measure, print_table
+
+SIZES = (10000, 100000)
+
+DIM = 512
+
+K = 10
+
+
+def clustered_vectors(count, seed=0, centers=256):
+    """Vectores unitarios repartidos alrededor de `centers` direcciones."""
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(centers, DIM)).astype(np.float32)
+    vectors = directions[rng.integers(0, centers, count)] + rng.normal(
+        scale=0.6, size=(count, DIM)
+    ).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench(count):
+    vectors = clustered_vectors(count)
+    queries = clustered_vectors(32, seed=1)
+    with tempfile.TemporaryDirectory() as directory:
+        store = embeddings.EmbeddingStore(directory)
+        start = time.perf_counter()
+        for offset in range(0, count, 1000):
+            block = vectors[offset : offset + 1000]
+            store.add([str(offset + i) for i in range(len(block))], block)
+        append = time.perf_counter() - start
+        size = store.matrix.nbytes / 2**20
+
+        exact = [
+            {name for name, _ in result} for result in store.search(queries, K, approximate=False)
+        ]
+        single = measure(lambda: store.search(queries[0], K, approximate=False))
+        batch = measure(lambda: store.search(queries, K, approximate=False))
+
+        start = time.perf_counter()
+        store.search(queries[0], K, approximate=True)  # trains the index
+        train = time.perf_counter() - start
+        approximate = measure(lambda: store.search(queries[0], K, approximate=True))
+        results = store.search(queries, K, approximate=True)
+        found = [{name for name, _ in result} for result in results]
+        recall = np.mean([len(a & b) / K for a, b in zip(found, exact)])
+
+        text = clustered_vectors(4, seed=2)
+        relabel = measure(lambda: store.classify(text, ["a", "b", "c", "d"]), repeat=3)
+    return {
+        "vectors": count,
+        "mib": size,
+        "append_s": append,
+        "exact_ms": single["median_ms"],
+        "exact_batch_ms": batch["median_ms"] / len(queries),
+        "ivf_train_s": train,
+        "ivf_ms": approximate["median_ms"],
+        "recall@10": recall,
+        "relabel_ms": relabel["median_ms"],
+    }
+
+
+def run():
+    rows = [bench(count) for count in SIZES]
+    print_table(
+        rows,
+        [
+            "vectors",
+            "mib",
+            "append_s",
+            "exact_ms",
+            "exact_batch_ms",
+            "ivf_train_s",
+            "ivf_ms",
+            "recall@10",
+            "relabel_ms",
+        ],
+    )
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,50 @@
+"""
+Benchmark de la detección de rostros por resolución de trabajo.
+
+Genera fotos sintéticas con rostros esquemáticos de tamaños conocidos y mide, para
+cada resolución de la foto y cada configuración de `detect.find_faces`, la latencia
+(sin caché) y el recall: la fracción de rostros encontrados con un IoU de al menos
+0.5. La primera configuración es la detección original (resolución completa,
+`scaleFactor=1.1`, `minNeighbors=4`).
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_faces
+"""
+from project.src import detect
+from project.profiling.common import RESOLUTIONS, measure, print_table
+from project.tests.faces import recall, synthetic_faces
+
+CONFIGURATIONS = {
+    "original": {},
+    "max_side=1024": {"max_side": 1024},
+    "max_side=640": {"max_side": 640},
+    "max_side=1024, scale=1.2": {"max_side": 1024, "scale_factor": 1.2},
+}
+
+# Face sides as a fraction of the shorter side of the photo
+FACE_FRACTIONS = (0.08, 0.12, 0.18, 0.25, 0.35)
+
+
+def run(repeat=3):
+    find_faces = detect.find_faces.__wrapped__
+    rows = []
+    for label, (width, height) in RESOLUTIONS.items():
+        sizes = [int(min(width, height) * fraction) for fraction in FACE_FRACTIONS]
+        image, truth = synthetic_faces(width, height, sizes)
+        for name, options in CONFIGURATIONS.items():
+            timing = measure(lambda: find_faces(image, **options), repeat=repeat)
+            rows.append(
+                {
+                    "resolution": label,
+                    "configuration": name,
+                    "median_ms": timing["median_ms"],
+                    "recall": recall(find_faces(image, **options), truth),
+                }
+            )
+    print_table(rows, ["resolution", "configuration", "median_ms", "recall"])
+    return rows
+
+
+if __name__ == "__main__":
+    run()
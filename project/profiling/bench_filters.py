@@ -0,0 +1,87 @@
+"""
+Micro-benchmark de cada filtro por backend.
+
+Mide, para cada resolución y cada filtro, el tiempo (mediana), la memoria reservada
+por llamada (pico de `tracemalloc`, que incluye los arrays de NumPy y las salidas de
+OpenCV) y la reservada además de la imagen de salida, de estas implementaciones:
+
+- `filters`: las funciones de `filters.py`, sin caché.
+- `exact`: la cadena fusionada de `chain` con el backend exacto.
+- `fast`: la cadena fusionada con el backend rápido (`fast_filters`).
+- `tiled`: los filtros teselables por teselas (`tiling`, teselas de `TILE_SIZE`),
+  para comprobar que su memoria no crece con la resolución más allá de la salida.
+
+En las dos últimas los buffers del workspace ya están creados (estado estacionario
+de un lote), así que la memoria medida es la de la imagen de salida y los temporales.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_filters
+"""
+import tracemalloc
+
+from project.src import chain, filters, registry, tiling
+from project.profiling.common import RESOLUTIONS, measure, print_table, synthetic_image
+
+FILTERS = {
+    "Sobel": filters.apply_sobel,
+    "Canny": filters.apply_canny,
+    "Gaussian Blur": filters.apply_gaussian_blur,
+    "Sharpen": filters.apply_sharpen,
+    "Random Hue Shift": filters.apply_random_hue_shift,
+}
+
+# Side of the tiles of the `tiled` rows, small enough to tile every resolution
+TILE_SIZE = 256
+
+
+def allocated(func):
+    """Pico de memoria reservada por una llamada, en MiB."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def implementations(name):
+    function = getattr(FILTERS[name], "__wrapped__", FILTERS[name])
+    steps = chain.plan([name])
+    functions = {
+        "filters": lambda image: function(image),
+        "exact": lambda image: chain.run_plan(image, steps, backend="exact"),
+        "fast": lambda image: chain.run_plan(image, steps, backend="fast"),
+    }
+    if registry.get(name).tileable:
+        functions["tiled"] = lambda image: tiling.apply_tiled(image, name, TILE_SIZE)
+    return functions
+
+
+def run(repeat=5):
+    rows = []
+    for label, (width, height) in RESOLUTIONS.items():
+        image = synthetic_image(width, height)
+        output_mib = image.nbytes / 2**20
+        for name in FILTERS:
+            for backend, function in implementations(name).items():
+                timing = measure(lambda: function(image), repeat=repeat)
+                peak = allocated(lambda: function(image))
+                rows.append(
+                    {
+                        "resolution": label,
+                        "filter": name,
+                        "backend": backend,
+                        "median_ms": timing["median_ms"],
+                        "allocated_mib": peak,
+                        "working_mib": peak - output_mib,
+                    }
+                )
+    print_table(
+        rows, ["resolution", "filter", "backend", "median_ms", "allocated_mib", "working_mib"]
+    )
+    return rows
+
+
+if __name__ == "__main__":
+    run()
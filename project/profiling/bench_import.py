@@ -0,0 +1,81 @@
+"""
+Benchmark del tiempo de importación de los módulos de `src`.
+
+Importa cada módulo en un intérprete nuevo con `python -X importtime` y suma el
+tiempo acumulado de las importaciones de primer nivel. Cada módulo tiene un
+presupuesto: el script termina con error si alguno lo supera o si importa alguna
+de las dependencias pesadas (`torch`, `transformers`, `sklearn`), que sólo deben
+cargarse en el primer uso.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_import
+"""
+import re
+import subprocess
+import sys
+
+from project.profiling.common import print_table
+
+# Import budget of each module, in milliseconds
+BUDGETS_MS = {
+    "project.src.cache": 400,
+    "project.src.filters": 500,
+    "project.src.chain": 500,
+    "project.src.detect": 500,
+    "project.src.pipeline": 600,
+    "project.src.ml": 800,
+}
+
+HEAVY_MODULES = ("torch", "transformers", "sklearn")
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(module):
+    """
+    Importa un módulo en un intérprete nuevo.
+
+    Returns:
+        tuple: (milisegundos acumulados, conjunto de módulos importados).
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    imported = set()
+    for line in output.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.add(name)
+        # Top-level imports (one space of indentation) add up to the full cost
+        if len(indent) == 1:
+            total_us += cumulative
+    return total_us / 1000, imported
+
+
+def run():
+    rows = []
+    for module, budget in BUDGETS_MS.items():
+        elapsed, imported = import_profile(module)
+        heavy = sorted(name for name in HEAVY_MODULES if name in imported)
+        rows.append(
+            {
+                "module": module,
+                "import_ms": elapsed,
+                "budget_ms": budget,
+                "heavy": ", ".join(heavy) or "-",
+                "ok": elapsed <= budget and not heavy,
+            }
+        )
+    print_table(rows, ["module", "import_ms", "budget_ms", "heavy", "ok"])
+    return rows
+
+
+if __name__ == "__main__":
+    sys.exit(0 if all(row["ok"] for row in run()) else 1)
@@ -0,0 +1,126 @@
+"""
+Benchmark de la lectura y escritura de imágenes.
+
+Mide tres cosas:
+
+- La decodificación de la entrada del clasificador: decodificar el JPEG completo y
+  reducirlo frente a `io_utils.load_preview`, que decodifica directamente a
+  resolución reducida.
+- La escritura de un lote: `save_image` en serie frente a `io_utils.ImageWriter`.
+- El lote completo tal y como lo hace la aplicación, sin contar la inferencia de
+  CLIP: antes, el pipeline, una segunda lectura de cada original para el
+  clasificador y la escritura en serie; ahora, el pipeline con previsualizaciones
+  (`preview_size`) y la escritura en segundo plano.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_io [--images 200]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+
+from project.src import io_utils, ml, pipeline, workers
+from project.profiling.common import RESOLUTIONS, measure, print_table, synthetic_image
+
+FILTERS = ["Gaussian Blur", "Sharpen"]
+
+
+def make_batch(directory, count, width=1920, height=1080):
+    """Escribe `count` JPEG sintéticos distintos y devuelve sus rutas."""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = Path(directory) / f"image_{index:04d}.jpg"
+        cv2.imwrite(str(path), synthetic_image(width, height, seed=index))
+        paths.append(path)
+    return paths
+
+
+def decode_rows(directory):
+    rows = []
+    for label, (width, height) in RESOLUTIONS.items():
+        (path,) = make_batch(directory, 1, width, height)
+        full = measure(
+            lambda: io_utils.make_preview(io_utils.load_image(path), ml.PREVIEW_SIZE)
+        )
+        reduced = measure(lambda: io_utils.load_preview(path, ml.PREVIEW_SIZE))
+        rows.append(
+            {
+                "resolution": label,
+                "full_decode_ms": full["median_ms"],
+                "load_preview_ms": reduced["median_ms"],
+                "speedup": full["median_ms"] / reduced["median_ms"],
+            }
+        )
+    return rows
+
+
+def batch_old(paths, output):
+    for result in pipeline.iter_pipeline(paths, FILTERS, False):
+        io_utils.make_preview(io_utils.load_image(result.path), ml.PREVIEW_SIZE)
+        io_utils.save_image(result.image, output / result.path.name)
+
+
+def batch_new(paths, output):
+    results = pipeline.iter_pipeline(paths, FILTERS, False, preview_size=ml.PREVIEW_SIZE)
+    with io_utils.ImageWriter() as writer:
+        for result in results:
+            writer.write(result.image, output / result.path.name)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def write_serial(images, output):
+    output.mkdir()
+    for index, image in enumerate(images):
+        io_utils.save_image(image, output / f"{index}.png")
+
+
+def write_background(images, output):
+    with io_utils.ImageWriter() as writer:
+        for index, image in enumerate(images):
+            writer.write(image, output / f"{index}.png")
+
+
+def run(count=200):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        print_table(
+            decode_rows(directory / "decode"),
+            ["resolution", "full_decode_ms", "load_preview_ms", "speedup"],
+        )
+
+        paths = make_batch(directory, count)
+        images = [io_utils.load_image(path) for path in paths[:50]]
+        (directory / "old").mkdir()
+        workers.get_pool().warmup()
+        rows = [
+            {
+                "stage": f"write {len(images)} PNG",
+                "before_s": timed(write_serial, images, directory / "serial"),
+                "after_s": timed(write_background, images, directory / "writer"),
+            },
+            {
+                "stage": f"batch of {count} images",
+                "before_s": timed(batch_old, paths, directory / "old"),
+                "after_s": timed(batch_new, paths, directory / "new"),
+            },
+        ]
+        for row in rows:
+            row["speedup"] = row["before_s"] / row["after_s"]
+        print_table(rows, ["stage", "before_s", "after_s", "speedup"])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la lectura y escritura de imágenes.")
+    parser.add_argument("--images", type=int, default=200)
+    run(parser.parse_args().images)
@@ -0,0 +1,81 @@
+"""
+Benchmark de memoria del proceso padre del pipeline.
+
+Genera lotes de imágenes sintéticas y mide el pico de memoria residente (RSS) del
+proceso padre al consumir los resultados con `run_pipeline` (lista completa) y con
+`iter_pipeline` (un resultado a la vez). Cada medición se hace en un subproceso
+nuevo, porque el pico de RSS de un proceso sólo puede crecer.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_pipeline_memory
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+
+from project.profiling.common import print_table, synthetic_image
+
+BATCH_SIZES = (50, 200, 500)
+FILTERS = ["Gaussian Blur", "Sharpen"]
+
+
+def make_batch(directory, count, width=1920, height=1080):
+    """Escribe `count` imágenes sintéticas distintas y devuelve sus rutas."""
+    paths = []
+    for index in range(count):
+        path = Path(directory) / f"image_{index:04d}.png"
+        cv2.imwrite(str(path), synthetic_image(width, height, seed=index))
+        paths.append(path)
+    return paths
+
+
+def consume(mode, paths):
+    """Procesa el lote en este proceso y devuelve el pico de RSS en MiB."""
+    from project.src import pipeline
+
+    if mode == "list":
+        results = pipeline.run_pipeline(paths, FILTERS, False)
+        count = len(results)
+    else:
+        count = sum(1 for _ in pipeline.iter_pipeline(paths, FILTERS, False))
+    assert count == len(paths)
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run():
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_batch(directory, max(BATCH_SIZES))
+        for count in BATCH_SIZES:
+            batch = [str(path) for path in paths[:count]]
+            row = {"images": count}
+            for mode in ("list", "stream"):
+                output = subprocess.run(
+                    [sys.executable, "-m", __spec__.name, "--child", mode],
+                    input=json.dumps(batch),
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                row[f"{mode}_peak_mib"] = float(output.stdout.strip().splitlines()[-1])
+            rows.append(row)
+    print_table(rows, ["images", "list_peak_mib", "stream_peak_mib"])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", choices=["list", "stream"])
+    args = parser.parse_args()
+    if args.child:
+        print(consume(args.child, json.loads(sys.stdin.read())))
+    else:
+        run()
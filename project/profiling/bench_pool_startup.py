@@ -0,0 +1,71 @@
+"""
+Benchmark del arranque del pool de workers.
+
+Mide el tiempo hasta el primer resultado y el tiempo total de varios lotes
+consecutivos con un pool nuevo por lote (el comportamiento anterior de
+`run_pipeline`) y con el pool persistente de `workers`.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_pool_startup
+"""
+import tempfile
+import time
+
+from project.src import pipeline, workers
+from project.profiling.bench_pipeline_memory import make_batch
+from project.profiling.common import print_table
+
+BATCHES = 3
+IMAGES_PER_BATCH = 8
+FILTERS = ["Gaussian Blur", "Sobel"]
+
+
+def time_batch(paths, pool):
+    """Devuelve (tiempo hasta el primer resultado, tiempo total) en milisegundos."""
+    start = time.perf_counter()
+    first = None
+    for _ in pipeline.iter_pipeline(paths, FILTERS, True, pool=pool):
+        if first is None:
+            first = time.perf_counter() - start
+    return first * 1000, (time.perf_counter() - start) * 1000
+
+
+def run():
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_batch(directory, IMAGES_PER_BATCH, width=1280, height=720)
+        for start_method in ("fork", "spawn"):
+            # Before: a new pool for every batch
+            for batch in range(BATCHES):
+                pool = workers.WorkerPool(start_method=start_method)
+                first, total = time_batch(paths, pool)
+                pool.shutdown()
+                rows.append(
+                    {
+                        "pool": f"por lote ({start_method})",
+                        "batch": batch + 1,
+                        "first_result_ms": first,
+                        "total_ms": total,
+                    }
+                )
+
+            # After: one persistent pool reused by every batch
+            pool = workers.WorkerPool(start_method=start_method)
+            for batch in range(BATCHES):
+                first, total = time_batch(paths, pool)
+                rows.append(
+                    {
+                        "pool": f"persistente ({start_method})",
+                        "batch": batch + 1,
+                        "first_result_ms": first,
+                        "total_ms": total,
+                    }
+                )
+            pool.shutdown()
+    print_table(rows, ["pool", "batch", "first_result_ms", "total_ms"])
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,139 @@
+"""
+Benchmark del solapamiento de etapas (`scheduler.Scheduler`).
+
+Procesa un lote como lo hace la aplicación, de dos maneras:
+
+- En serie: el pipeline termina todos los filtros, después CLIP clasifica las
+  previsualizaciones por lotes y al final se guardan las imágenes una a una.
+- Con el planificador: filtros (pool de procesos), clasificación (decodificación
+  reducida propia y micro-lotes en su propio hilo, sin esperar a los filtros) y
+  escritura (hilos de E/S) a la vez.
+
+Además del tiempo total, muestra el tiempo ocupado de cada etapa: con el
+solapamiento, el total debería acercarse al de la etapa más lenta, siempre que
+haya núcleos para todas.
+
+Con `--random-weights` se usa la arquitectura de `openai/clip-vit-base-patch32` con
+pesos aleatorios (el coste es el mismo; las etiquetas no significan nada), para
+medir sin descargar el modelo.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_scheduler [--images 64] [--random-weights]
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from project.src import io_utils, ml, pipeline, scheduler, workers
+from project.profiling.bench_io import make_batch
+from project.profiling.common import print_table
+
+FILTERS = ["Gaussian Blur", "Sharpen"]
+
+BATCH_SIZE = 16
+
+
+def load_classifier(random_weights):
+    """Devuelve una función que clasifica una lista de previsualizaciones."""
+    if not random_weights:
+        return lambda previews: [labels[0] for labels in ml.classify_batch(previews)]
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel
+
+    ml.set_threads()
+    model = CLIPModel(CLIPConfig()).eval()
+    processor = CLIPImageProcessor()
+    encode = ml.image_encoder(model)
+    text = np.random.default_rng(0).standard_normal((len(ml.LABELS), 512), dtype=np.float32)
+
+    def classify(previews):
+        pixels = processor(images=[image[..., ::-1] for image in previews], return_tensors="pt")
+        best = (encode(pixels["pixel_values"]) @ text.T).argmax(axis=1)
+        return [ml.LABELS[index] for index in best]
+
+    return classify
+
+
+def sequential(paths, output, classify):
+    busy = {"pipeline": 0.0, "classify": 0.0, "save": 0.0}
+    start = time.perf_counter()
+    results = list(pipeline.iter_pipeline(paths, FILTERS, False, preview_size=ml.PREVIEW_SIZE))
+    busy["pipeline"] = time.perf_counter() - start
+    labels = []
+    for first in range(0, len(results), BATCH_SIZE):
+        batch = results[first : first + BATCH_SIZE]
+        start = time.perf_counter()
+        labels += classify([result.preview for result in batch])
+        busy["classify"] += time.perf_counter() - start
+    start = time.perf_counter()
+    for result, label in zip(results, labels):
+        destination = output / ml.category(label) / result.path.name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        io_utils.save_image(result.image, destination)
+    busy["save"] = time.perf_counter() - start
+    return busy
+
+
+def overlapped(paths, output, classify):
+    def save(index, inputs):
+        result = inputs["filters"]
+        destination = output / ml.category(inputs["classify"]) / result.path.name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        io_utils.save_image(result.image, destination)
+
+    stages = scheduler.Scheduler()
+    results = pipeline.iter_pipeline(paths, FILTERS, False)
+    stages.add_stream("filters", ((result.index, result) for result in results))
+    stages.add(
+        "preview", lambda index, inputs: io_utils.load_preview(paths[index], ml.PREVIEW_SIZE)
+    )
+    stages.add(
+        "classify",
+        lambda batch: classify([inputs["preview"] for _, inputs in batch]),
+        after=("preview",),
+        batch_size=BATCH_SIZE,
+    )
+    stages.add("save", save, after=("filters", "classify"), workers=2)
+    for outcome in stages.run((index, path) for index, path in enumerate(paths)):
+        assert outcome.error is None, outcome.error
+    # The filters run in the process pool, overlapped with the other stages
+    busy = {name: stats["busy_s"] for name, stats in stages.stats.items()}
+    busy["classify"] += busy.pop("preview")
+    return busy
+
+
+def run(count=64, random_weights=False):
+    classify = load_classifier(random_weights)
+    classify([np.zeros((ml.PREVIEW_SIZE, ml.PREVIEW_SIZE, 3), np.uint8)])  # warmup
+    workers.get_pool().warmup()
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_batch(Path(directory) / "input", count)
+        for name, flow in (("en serie", sequential), ("solapado", overlapped)):
+            output = Path(directory) / name
+            start = time.perf_counter()
+            busy = flow(paths, output, classify)
+            elapsed = time.perf_counter() - start
+            rows.append(
+                {
+                    "flow": name,
+                    "total_s": elapsed,
+                    "images_per_s": count / elapsed,
+                    **{f"{stage}_s": seconds for stage, seconds in busy.items()},
+                }
+            )
+    print(f"{count} imágenes FullHD, {os.cpu_count()} núcleos")
+    print_table(rows, ["flow", "total_s", "images_per_s", "pipeline_s", "classify_s", "save_s"])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+    run(args.images, args.random_weights)
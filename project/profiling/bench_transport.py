@@ -0,0 +1,79 @@
+"""
+Benchmark del transporte de imágenes entre los workers y el proceso padre.
+
+Cada tarea genera en un worker una imagen del tamaño pedido y la devuelve al padre
+con cada transporte (`copy`, `shm`, `mmap`). Se mide el tiempo desde el envío de la
+tarea hasta tener el array en el padre, descontando el tiempo de generación, y el
+throughput resultante.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_transport
+"""
+import time
+
+import numpy as np
+
+from project.src import transport, workers
+from project.profiling.common import print_table
+
+SIZES = {
+    "VGA": (480, 640, 3),
+    "FullHD": (1080, 1920, 3),
+    "12MP": (3000, 4000, 3),
+    "24MP": (4000, 6000, 3),
+}
+
+
+def produce(shape, shared):
+    """Genera una imagen en el worker y la devuelve por el transporte pedido."""
+    start = time.perf_counter()
+    image = np.full(shape, 7, dtype=np.uint8)
+    generation = time.perf_counter() - start
+    if shared is not None:
+        image = transport.export_image(image, *shared)
+    return image, generation
+
+
+def transfer(pool, shape, mode):
+    """Devuelve los segundos de transporte de una imagen de un worker al padre."""
+    shared = None
+    if mode != "copy":
+        shared = (str(transport.directory_for(mode)), transport.owner_prefix())
+    start = time.perf_counter()
+    image, generation = pool.submit(produce, shape, shared).result()
+    if mode != "copy":
+        image = transport.import_image(image)
+    elapsed = time.perf_counter() - start - generation
+    assert image.shape == shape
+    return elapsed
+
+
+def run(repeat=5):
+    pool = workers.WorkerPool(max_workers=1)
+    pool.warmup()
+    rows = []
+    try:
+        for label, shape in SIZES.items():
+            megabytes = np.prod(shape) / 2**20
+            for mode in transport.TRANSPORTS:
+                transfer(pool, shape, mode)
+                samples = sorted(transfer(pool, shape, mode) for _ in range(repeat))
+                median = samples[len(samples) // 2]
+                rows.append(
+                    {
+                        "size": label,
+                        "transport": mode,
+                        "mib": megabytes,
+                        "ms": median * 1000,
+                        "mib_per_s": megabytes / median,
+                    }
+                )
+    finally:
+        pool.shutdown()
+    print_table(rows, ["size", "transport", "mib", "ms", "mib_per_s"])
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,83 @@
+"""
+Benchmark del modo vídeo (`video.process_video`).
+
+Genera un clip sintético (un rostro que se desplaza sobre un fondo con textura),
+lo procesa con varias configuraciones y mide los fotogramas por segundo y el pico
+de memoria de numpy (`tracemalloc`) para dos duraciones del clip: con la memoria
+acotada, el pico no crece con la duración.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.bench_video [--width 1280 --height 720]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from project.src import video
+from project.profiling.common import print_table
+from project.tests.faces import synthetic_faces
+
+DURATIONS = (120, 360)
+
+FILTERS = ["Gaussian Blur", "Sharpen"]
+
+CONFIGS = [
+    ("sólo decodificar y codificar", dict(selected_filters=[], face_detection=False)),
+    ("filtros, 1 hilo", dict(workers=1)),
+    ("filtros + rostros, 1 hilo", dict(face_detection=True, workers=1)),
+    ("filtros + rostros", dict(face_detection=True)),
+    ("filtros + rostros cada 5", dict(face_detection=True, detect_every=5)),
+    ("filtros + rostros, 1 de cada 2", dict(face_detection=True, step=2)),
+]
+
+
+def make_clip(path, width, height, frames):
+    """Escribe un clip de `frames` fotogramas con un rostro que se mueve."""
+    image, _ = synthetic_faces(width, height, [height // 4])
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height))
+    for index in range(frames):
+        writer.write(np.roll(image, 3 * index, axis=1))
+    writer.release()
+
+
+def run(width=1280, height=720):
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        clips = {}
+        for frames in DURATIONS:
+            clips[frames] = Path(directory) / f"clip_{frames}.mp4"
+            make_clip(clips[frames], width, height, frames)
+        for name, options in CONFIGS:
+            options = {"selected_filters": FILTERS, **options}
+            row = {"config": name}
+            for frames, clip in clips.items():
+                tracemalloc.start()
+                start = time.perf_counter()
+                summary = video.process_video(clip, Path(directory) / "out.mp4", **options)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+                row[f"fps_{frames}"] = summary["frames"] / elapsed
+                row[f"peak_mib_{frames}"] = peak
+            rows.append(row)
+    columns = ["config"]
+    for frames in DURATIONS:
+        columns += [f"fps_{frames}", f"peak_mib_{frames}"]
+    print(f"{width}x{height}, {os.cpu_count()} núcleos")
+    print_table(rows, columns)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+    run(args.width, args.height)
@@ -0,0 +1,132 @@
+"""
+Utilidades compartidas por los scripts de benchmark.
+
+Los benchmarks generan sus propias imágenes sintéticas para no depender de
+datasets externos, y miden tiempos con `time.perf_counter`.
+"""
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+# Common working resolutions (width, height)
+RESOLUTIONS = {
+    "VGA": (640, 480),
+    "FullHD": (1920, 1080),
+    "12MP": (4000, 3000),
+}
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Genera una imagen BGR sintética con bordes, gradientes y ruido.
+
+    Args:
+        width (int): El ancho de la imagen.
+        height (int): La altura de la imagen.
+        seed (int, optional): La semilla del generador aleatorio. Por defecto es 0.
+
+    Returns:
+        numpy.ndarray: Una imagen `uint8` de forma (height, width, 3).
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x * 255 // max(width - 1, 1)).astype(np.uint8)
+    image[..., 1] = (y * 255 // max(height - 1, 1)).astype(np.uint8)
+    image[..., 2] = (((x // 32) + (y // 32)) % 2 * 255).astype(np.uint8)
+    noise = rng.integers(0, 32, size=image.shape, dtype=np.uint8)
+    np.add(image, noise, out=image, casting="unsafe")
+    return image
+
+
+def measure(func, repeat=5, warmup=1):
+    """
+    Mide el tiempo de ejecución de una función.
+
+    Args:
+        func (function): La función sin argumentos a medir.
+        repeat (int, optional): El número de repeticiones medidas. Por defecto es 5.
+        warmup (int, optional): El número de ejecuciones previas descartadas.
+
+    Returns:
+        dict: La mediana, el mínimo y el máximo en milisegundos.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+    }
+
+
+def print_table(rows, columns):
+    """
+    Imprime una lista de diccionarios como una tabla de texto.
+
+    Args:
+        rows (list): Las filas a imprimir.
+        columns (list): Las claves a mostrar, en orden.
+    """
+    widths = {
+        col: max([len(col)] + [len(_fmt(row.get(col))) for row in rows])
+        for col in columns
+    }
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    print("  ".join("-" * widths[col] for col in columns))
+    for row in rows:
+        print("  ".join(_fmt(row.get(col)).ljust(widths[col]) for col in columns))
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def synthetic_photo(width, height, seed=0):
+    """
+    Genera una "foto" sintética: manchas de color suaves y distintas para cada semilla,
+    más un poco de ruido (a diferencia de `synthetic_image`, dos semillas dan
+    imágenes con estructuras distintas).
+
+    Args:
+        width (int): El ancho de la imagen.
+        height (int): La altura de la imagen.
+        seed (int, optional): La semilla del generador aleatorio.
+
+    Returns:
+        numpy.ndarray: Una imagen BGR `uint8` de forma (height, width, 3).
+    """
+    rng = np.random.default_rng(seed)
+    blobs = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    image = cv2.resize(blobs, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.add(image, rng.integers(0, 16, image.shape, dtype=np.uint8))
+
+
+def near_duplicates(image):
+    """
+    Devuelve variantes casi duplicadas de una imagen, como las de una reexportación
+    o una ráfaga: recompresión JPEG, más brillo, menor resolución y un desplazamiento.
+
+    Args:
+        image (numpy.ndarray): La imagen original.
+
+    Returns:
+        list: Las variantes, todas distintas byte a byte del original.
+    """
+    height, width = image.shape[:2]
+    _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return [
+        cv2.imdecode(encoded, cv2.IMREAD_COLOR),
+        cv2.add(image, 12),
+        cv2.resize(image, (width // 2, height // 2), interpolation=cv2.INTER_AREA),
+        np.roll(image, width // 80, axis=1),
+    ]
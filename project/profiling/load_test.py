@@ -0,0 +1,186 @@
+"""
+Prueba de carga del servicio HTTP (`service`).
+
+Sube fotos sintéticas JPEG (distintas en cada petición y en cada ejecución, para
+no medir la caché) con varios niveles de concurrencia: cada cliente concurrente
+mantiene una conexión abierta y encadena peticiones; si recibe un 429, reintenta
+tras una breve espera.
+Para cada nivel muestra el rendimiento (peticiones atendidas por segundo), los
+percentiles 50 y 99 de la latencia vista por el cliente (reintentos incluidos),
+las respuestas 429 y, si se clasifica, el tamaño medio de los micro-lotes de CLIP.
+
+Sin `--url`, arranca el servicio en este mismo proceso (en un hilo, con el pool de
+workers compartido). Con `--random-weights` la clasificación usa la arquitectura de
+CLIP con pesos aleatorios (ver `bench_scheduler`), para medir sin descargar el
+modelo.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.load_test [--concurrency 1 4 16 64] [--classify --random-weights]
+    python -m project.profiling.load_test --url http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import quote, urlsplit
+
+import cv2
+import numpy as np
+
+from project.src import service, workers
+from project.profiling.bench_scheduler import load_classifier
+from project.profiling.common import print_table, synthetic_photo
+
+FILTERS = ["Gaussian Blur", "Sharpen"]
+
+# Seconds a client waits before retrying a rejected request
+BACKOFF = 0.1
+
+
+async def send(reader, writer, method, target, body=b"", host="localhost"):
+    """Envía una petición por una conexión abierta y devuelve el código y el cuerpo."""
+    head = (
+        f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/octet-stream\r\nContent-Length: {len(body)}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def get_json(host, port, target):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, body = await send(reader, writer, "GET", target, host=host)
+        return json.loads(body)
+    finally:
+        writer.close()
+
+
+async def level(host, port, target, bodies, concurrency):
+    """Envía cada cuerpo una vez con `concurrency` clientes y mide cada petición."""
+    latencies = []
+    statuses = []
+    pending = list(reversed(bodies))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while pending:
+                body = pending.pop()
+                start = time.perf_counter()
+                while True:
+                    status, _ = await send(reader, writer, "POST", target, body, host)
+                    statuses.append(status)
+                    if status != 429:
+                        break
+                    await asyncio.sleep(BACKOFF)
+                if status == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            writer.close()
+
+    before = (await get_json(host, port, "/metrics"))["batches"]
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    after = (await get_json(host, port, "/metrics"))["batches"]
+    batches = after["batches"] - before["batches"]
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (None, None)
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "rejected": statuses.count(429),
+        "errors": len(bodies) - len(latencies),
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "mean_batch": (after["items"] - before["items"]) / batches if batches else None,
+    }
+
+
+async def run_levels(host, port, target, bodies, levels, total):
+    rows = []
+    for concurrency in levels:
+        count = max(total, concurrency)
+        rows.append(await level(host, port, target, bodies[:count], concurrency))
+        del bodies[:count]
+    return rows
+
+
+def run(
+    url=None,
+    levels=(1, 4, 16, 64),
+    total=64,
+    width=640,
+    height=480,
+    classify=False,
+    random_weights=False,
+):
+    # Fresh seeds on every run, so that no image is in the service's cache yet
+    first = int(time.time())
+    count = 2 + sum(max(total, concurrency) for concurrency in levels)
+    bodies = [
+        cv2.imencode(".jpg", synthetic_photo(width, height, seed))[1].tobytes()
+        for seed in range(first, first + count)
+    ]
+    query = "&".join(f"filters={quote(name)}" for name in FILTERS) + "&colors=5"
+    if classify:
+        query += "&classify=1"
+    target = f"/process?{query}"
+
+    app = None
+    if url is None:
+        app = service.Service(classify=load_classifier(True) if random_weights else None)
+        app.pool.warmup()
+        host, port = "127.0.0.1", app.start_in_thread("127.0.0.1", 0)
+    else:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+    try:
+        # Warms up the workers' imports and, if it classifies, the model
+        asyncio.run(run_levels(host, port, target, bodies, [1], 2))
+        rows = asyncio.run(run_levels(host, port, target, bodies, levels, total))
+    finally:
+        if app is not None:
+            app.stop()
+            workers.shutdown()
+    print(
+        f"{total} peticiones por nivel, {width}x{height} JPEG, filtros {', '.join(FILTERS)}"
+        f"{', clasificación' if classify else ''}; {os.cpu_count()} núcleos"
+    )
+    print_table(
+        rows,
+        ["concurrency", "ok", "rejected", "errors", "requests_per_s", "p50_ms", "p99_ms",
+         "mean_batch"],
+    )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Un servicio ya en marcha (por defecto, uno propio).")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64, help="Peticiones por nivel.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--classify", action="store_true")
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+    run(
+        args.url,
+        args.concurrency,
+        args.requests,
+        args.width,
+        args.height,
+        args.classify,
+        args.random_weights,
+    )
@@ -0,0 +1,390 @@
+"""
+Suite de benchmarks con resultados en JSON y comparación contra una línea base.
+
+Reúne en una sola ejecución las métricas de las rutas críticas, con imágenes
+sintéticas (no hace falta descargar datasets):
+
+- `filters/<función>/<resolución>`: cada función de `filters.py`, sin caché.
+- `detect/<función>/<resolución>`: `find_faces`, `draw_faces` y
+  `get_dominant_colors` (en cada modo) de `detect.py`, sin caché. `detect_faces` y
+  las variantes por lotes sólo encadenan estas funciones.
+- `cache/<ruta>`: una llamada memoizada con la caché fría (cómputo y guardado), con
+  acierto en disco y con acierto en memoria.
+- `pipeline/workers=<n>`: imágenes por segundo de `run_pipeline` con 1 a N workers,
+  cada vez sobre imágenes nuevas (sin aciertos de caché).
+
+Cada métrica guarda su valor, su unidad y si es mejor más baja (tiempos) o más alta
+(throughput). El JSON incluye la información de la máquina, porque sólo tiene
+sentido comparar resultados de la misma máquina.
+
+Uso (desde la raíz del repositorio):
+
+    python -m project.profiling.suite run --output baseline.json
+    python -m project.profiling.suite run --output current.json --baseline baseline.json
+    python -m project.profiling.suite compare baseline.json current.json --threshold 0.15
+
+`compare` (y `run` con `--baseline`) termina con código 1 si alguna métrica empeora
+más que el umbral relativo. Las diferencias de menos de `--min-delta-ms` en los
+tiempos se consideran ruido.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from project.src import cache, detect, filters, pipeline, workers
+from project.profiling.common import RESOLUTIONS, measure, print_table, synthetic_image
+
+SECTIONS = ("filters", "detect", "cache", "pipeline")
+
+# Relative change past which a metric counts as a regression
+DEFAULT_THRESHOLD = 0.15
+
+# Timing differences below this are noise, whatever their relative size
+DEFAULT_MIN_DELTA_MS = 0.1
+
+FILTER_FUNCTIONS = {
+    "apply_sobel": filters.apply_sobel,
+    "apply_canny": filters.apply_canny,
+    "apply_gaussian_blur": filters.apply_gaussian_blur,
+    "apply_sharpen": filters.apply_sharpen,
+    "apply_random_hue_shift": filters.apply_random_hue_shift,
+}
+
+# Images per pipeline run, and their resolution
+PIPELINE_IMAGES = 24
+PIPELINE_RESOLUTION = (1280, 720)
+PIPELINE_FILTERS = ["Gaussian Blur", "Sobel"]
+
+
+def machine_info():
+    """
+    Describe la máquina y el entorno en que se ejecutan los benchmarks.
+
+    Returns:
+        dict: Sistema, procesador, CPUs, versiones de Python, NumPy y OpenCV, y el
+              commit de git (si lo hay).
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "commit": commit,
+    }
+
+
+def _metric(value, unit="ms", better="lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def _unwrapped(function):
+    # Memoized functions keep the original in __wrapped__
+    return getattr(function, "__wrapped__", function)
+
+
+def bench_filters(resolutions, repeat):
+    metrics = {}
+    for label, (width, height) in resolutions.items():
+        image = synthetic_image(width, height)
+        for name, function in FILTER_FUNCTIONS.items():
+            function = _unwrapped(function)
+            timing = measure(lambda: function(image), repeat=repeat)
+            metrics[f"filters/{name}/{label}"] = _metric(timing["median_ms"])
+    return metrics
+
+
+def bench_detect(resolutions, repeat):
+    metrics = {}
+    find_faces = _unwrapped(detect.find_faces)
+    dominant_colors = _unwrapped(detect.get_dominant_colors)
+    options = dict(detect.settings)
+    detect.warmup()
+    for label, (width, height) in resolutions.items():
+        image = synthetic_image(width, height)
+        boxes = np.array([[width // 4, height // 4, width // 2, height // 2]] * 4)
+        timings = {
+            "find_faces": measure(lambda: find_faces(image, **options), repeat=repeat),
+            "draw_faces": measure(lambda: detect.draw_faces(image, boxes), repeat=repeat),
+        }
+        for mode in detect.COLOR_MODES:
+            timings[f"get_dominant_colors[{mode}]"] = measure(
+                lambda: dominant_colors(image, mode=mode), repeat=repeat
+            )
+        for name, timing in timings.items():
+            metrics[f"detect/{name}/{label}"] = _metric(timing["median_ms"])
+    return metrics
+
+
+def bench_cache(repeat):
+    """
+    Mide una llamada memoizada (el desenfoque Gaussiano de una imagen FullHD) con la
+    caché fría, con acierto en disco y con acierto en memoria, en una caché temporal.
+    """
+    previous = dict(cache.settings)
+    image = synthetic_image(*RESOLUTIONS["FullHD"])
+    # A different image on every cold call, so every lookup is a miss
+    variants = iter([np.add(image, i + 1, dtype=np.uint8) for i in range(repeat + 1)])
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            cache.configure(directory=directory, memory_limit=0)
+            cold = measure(lambda: filters.apply_gaussian_blur(next(variants)), repeat=repeat)
+            disk = measure(lambda: filters.apply_gaussian_blur(image), repeat=repeat)
+            cache.configure(memory_limit=previous["memory_limit"] or cache.DEFAULT_MEMORY_LIMIT)
+            memory = measure(lambda: filters.apply_gaussian_blur(image), repeat=repeat)
+        finally:
+            cache.configure(**previous)
+    compute = measure(lambda: _unwrapped(filters.apply_gaussian_blur)(image), repeat=repeat)
+    metrics["cache/compute"] = _metric(compute["median_ms"])
+    metrics["cache/cold"] = _metric(cold["median_ms"])
+    metrics["cache/warm_disk"] = _metric(disk["median_ms"])
+    metrics["cache/warm_memory"] = _metric(memory["median_ms"])
+    return metrics
+
+
+def bench_pipeline(max_workers, images=PIPELINE_IMAGES):
+    """
+    Mide el throughput de `run_pipeline` con 1 a `max_workers` workers.
+
+    Los workers usan una caché temporal (heredan `PHOTOLAB_CACHE_DIR`) y cada número
+    de workers procesa imágenes nuevas, así que no hay aciertos de caché; el pool se
+    arranca antes de medir.
+    """
+    counts = sorted({1, *[2**i for i in range(1, max_workers.bit_length())], max_workers})
+    previous_environment = os.environ.get("PHOTOLAB_CACHE_DIR")
+    previous_workers = workers.settings["max_workers"]
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["PHOTOLAB_CACHE_DIR"] = os.path.join(directory, "cache")
+        try:
+            for count in counts:
+                paths = []
+                for i in range(images):
+                    path = Path(directory) / f"workers{count}_{i}.png"
+                    image = synthetic_image(*PIPELINE_RESOLUTION, seed=count * images + i)
+                    cv2.imwrite(str(path), image)
+                    paths.append(path)
+                workers.configure(max_workers=count)
+                workers.get_pool().warmup()
+                start = time.perf_counter()
+                pipeline.run_pipeline(paths, PIPELINE_FILTERS, False)
+                elapsed = time.perf_counter() - start
+                metrics[f"pipeline/workers={count}"] = _metric(
+                    images / elapsed, "img/s", "higher"
+                )
+        finally:
+            workers.configure(max_workers=previous_workers)
+            if previous_environment is None:
+                os.environ.pop("PHOTOLAB_CACHE_DIR", None)
+            else:
+                os.environ["PHOTOLAB_CACHE_DIR"] = previous_environment
+    return metrics
+
+
+def run(sections=SECTIONS, resolutions=None, repeat=5, max_workers=None):
+    """
+    Ejecuta la suite.
+
+    Args:
+        sections (list, optional): Las secciones a ejecutar (ver `SECTIONS`).
+        resolutions (dict, optional): Las resoluciones de filtros y detección. Por
+            defecto son `common.RESOLUTIONS`.
+        repeat (int, optional): Las repeticiones medidas de cada tiempo.
+        max_workers (int, optional): El máximo de workers del pipeline. Por defecto
+            es `os.cpu_count()`.
+
+    Returns:
+        dict: Los resultados: `machine`, `created`, `config` y `metrics`.
+    """
+    resolutions = resolutions or RESOLUTIONS
+    max_workers = max_workers or os.cpu_count()
+    metrics = {}
+    if "filters" in sections:
+        metrics.update(bench_filters(resolutions, repeat))
+    if "detect" in sections:
+        metrics.update(bench_detect(resolutions, repeat))
+    if "cache" in sections:
+        metrics.update(bench_cache(repeat))
+    if "pipeline" in sections:
+        metrics.update(bench_pipeline(max_workers))
+    return {
+        "machine": machine_info(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "sections": list(sections),
+            "resolutions": {label: list(size) for label, size in resolutions.items()},
+            "repeat": repeat,
+            "max_workers": max_workers,
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Compara dos resultados de la suite métrica a métrica.
+
+    Args:
+        baseline (dict): Los resultados de referencia.
+        current (dict): Los resultados nuevos.
+        threshold (float, optional): El empeoramiento relativo tolerado (0.15 es un
+            15 %).
+        min_delta_ms (float, optional): Las diferencias de tiempo menores que esta,
+            en milisegundos, no cuentan como regresión.
+
+    Returns:
+        list: Una fila por métrica común, con `metric`, `baseline`, `current`,
+              `change` (relativo; positivo es peor) y `status` ("ok", "improved" o
+              "REGRESSION").
+    """
+    rows = []
+    for name, old in baseline["metrics"].items():
+        new = current["metrics"].get(name)
+        if new is None or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        if old["better"] == "higher":
+            change = -change
+        noise = old["unit"] == "ms" and abs(new["value"] - old["value"]) < min_delta_ms
+        if change > threshold and not noise:
+            status = "REGRESSION"
+        elif change < -threshold and not noise:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append(
+            {
+                "metric": name,
+                "unit": old["unit"],
+                "baseline": old["value"],
+                "current": new["value"],
+                "change": f"{change:+.1%}",
+                "status": status,
+            }
+        )
+    return rows
+
+
+def _report(baseline, current, threshold, min_delta_ms, allow_missing=False):
+    """
+    Imprime la comparación y devuelve el código de salida: 1 si hay regresiones o,
+    salvo con `allow_missing`, si faltan métricas de la línea base.
+    """
+    differences = {
+        key: (value, current["machine"].get(key))
+        for key, value in baseline["machine"].items()
+        if key != "commit" and current["machine"].get(key) != value
+    }
+    if differences:
+        print("Aviso: los resultados son de máquinas o entornos distintos:", file=sys.stderr)
+        for key, (old, new) in differences.items():
+            print(f"  {key}: {old} -> {new}", file=sys.stderr)
+    rows = compare(baseline, current, threshold, min_delta_ms)
+    print_table(rows, ["metric", "unit", "baseline", "current", "change", "status"])
+    missing = sorted(set(baseline["metrics"]) - set(current["metrics"]))
+    if missing:
+        print(f"\nSin medir en los resultados nuevos: {', '.join(missing)}")
+    regressions = [row["metric"] for row in rows if row["status"] == "REGRESSION"]
+    if regressions:
+        print(f"\n{len(regressions)} regresiones de más del {threshold:.0%}.")
+        return 1
+    if missing and not allow_missing:
+        print("Faltan métricas de la línea base (--allow-missing si es a propósito).")
+        return 1
+    print(f"\nSin regresiones de más del {threshold:.0%}.")
+    return 0
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as reader:
+        return json.load(reader)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de PhotoLab Express.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Ejecuta la suite y guarda los resultados.")
+    run_parser.add_argument("--output", help="El fichero JSON de resultados.")
+    run_parser.add_argument(
+        "--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS), metavar="SECCIÓN"
+    )
+    run_parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        choices=list(RESOLUTIONS),
+        default=list(RESOLUTIONS),
+        metavar="RESOLUCIÓN",
+    )
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--max-workers", type=int, help="Por defecto, os.cpu_count().")
+    run_parser.add_argument("--baseline", help="Compara los resultados con esta línea base.")
+
+    compare_parser = commands.add_parser("compare", help="Compara dos resultados.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for command in (run_parser, compare_parser):
+        command.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+        command.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+        command.add_argument(
+            "--allow-missing",
+            action="store_true",
+            help="No falla si faltan métricas de la línea base (p. ej. con --sections).",
+        )
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        return _report(
+            _load(args.baseline),
+            _load(args.current),
+            args.threshold,
+            args.min_delta_ms,
+            args.allow_missing,
+        )
+
+    results = run(
+        args.sections,
+        {label: RESOLUTIONS[label] for label in args.resolutions},
+        args.repeat,
+        args.max_workers,
+    )
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as writer:
+            json.dump(results, writer, indent=2)
+    if args.baseline:
+        return _report(
+            _load(args.baseline), results, args.threshold, args.min_delta_ms, args.allow_missing
+        )
+    rows = [{"metric": name, **metric} for name, metric in results["metrics"].items()]
+    print_table(rows, ["metric", "value", "unit"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
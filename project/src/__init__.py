@@ -0,0 +1,26 @@
+"""
+Paquete principal de PhotoLab Express.
+
+Importar el paquete o cualquiera de sus módulos es barato: los modelos, la cascada
+de Haar y el almacén de la caché se cargan la primera vez que se usan. `warmup`
+permite pagar ese costo por adelantado, p. ej. al arrancar la aplicación.
+"""
+
+
+def warmup(classifier=True, pool=False):
+    """
+    Carga por adelantado los recursos pesados del paquete.
+
+    Args:
+        classifier (bool, optional): Si se carga el modelo CLIP. Por defecto es True.
+        pool (bool, optional): Si se arrancan los workers del pipeline y se espera a
+            que estén listos. Por defecto es False.
+    """
+    from . import cache, detect, ml, workers
+
+    cache.get_store()
+    detect.warmup()
+    if classifier:
+        ml.warmup()
+    if pool:
+        workers.get_pool().warmup()
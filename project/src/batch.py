@@ -0,0 +1,492 @@
+"""
+Ejecución del pipeline por lotes desde la línea de comandos, sin la interfaz.
+
+Procesa directorios completos (decenas de miles de imágenes) con memoria acotada:
+
+- Las rutas se descubren de forma perezosa, directorio a directorio, a medida que
+  el pipeline tiene hueco (ver `iter_image_paths`).
+- Los resultados se clasifican con CLIP en micro-lotes, a partir de una
+  previsualización reducida que el pipeline obtiene de la misma decodificación, y se
+  escriben en `<salida>/<clasificación>/<ruta relativa>` con `io_utils.ImageWriter`
+  (un pool de hilos de escritura con una cola acotada).
+- Cada imagen terminada se apunta en un manifiesto (`.photolab-manifest.jsonl` en
+  el directorio de salida) en cuanto su fichero está escrito. Al relanzar el mismo
+  comando, las imágenes ya apuntadas se saltan, así que una ejecución interrumpida
+  continúa donde se quedó.
+- Con `--dedup`, las imágenes casi duplicadas (ráfagas, reexportaciones) se
+  agrupan antes del pipeline (ver `dedup`): cada grupo se procesa una vez y su
+  resultado se escribe para cada miembro, que el manifiesto marca con
+  `duplicate_of`. Para agruparlas hay que conocerlas todas, así que en este modo
+  las rutas pendientes se listan de antemano.
+- Con `--profile` o `--trace` (o `PHOTOLAB_INSTRUMENT=1`) se mide cada etapa de
+  cada imagen (ver `instrument`): al final se imprime un resumen por etapa y se
+  exporta como JSON o como traza de Chrome.
+- Con `--embeddings` (o `PHOTOLAB_EMBEDDINGS`) el embedding de CLIP de cada imagen
+  clasificada se guarda en un almacén en disco (ver `embeddings`), para buscar
+  imágenes parecidas o volver a etiquetar la colección sin el modelo.
+
+Uso (desde el directorio `project/`):
+
+    python -m src.batch fotos/ --output output --filters "Gaussian Blur" Sobel --faces
+    python -m src.batch "scans/**/*.tif" --no-classify
+    python -m src.batch fotos/ --filters "Canny:low_threshold=50,high_threshold=150"
+    python -m src.batch fotos/ --dedup 4
+    python -m src.batch fotos/ --filters Sobel --trace sobel.trace.json
+    python -m src.batch fotos/ --embeddings embeddings/
+"""
+import argparse
+import contextlib
+import functools
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from . import chain, dedup, instrument, io_utils, ml, pipeline, registry
+from . import embeddings as embedding_store
+
+# File extensions picked up when walking a directory
+IMAGE_EXTENSIONS = frozenset(
+    {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp", ".jp2", ".ppm", ".pgm"}
+)
+
+MANIFEST_NAME = ".photolab-manifest.jsonl"
+
+# Images classified together by CLIP
+CLASSIFY_BATCH_SIZE = 16
+
+# Processed images waiting to be written, per writer thread
+WRITE_QUEUE_PER_THREAD = 4
+
+
+def iter_image_paths(sources, extensions=IMAGE_EXTENSIONS):
+    """
+    Recorre de forma perezosa las imágenes de un conjunto de directorios o patrones.
+
+    Los directorios se recorren recursivamente y en orden alfabético, sin listar el
+    árbol completo de antemano. Las fuentes con comodines se expanden con `glob`
+    (`**` recorre subdirectorios) y los ficheros se entregan tal cual.
+
+    Args:
+        sources (list): Directorios, ficheros o patrones glob.
+        extensions (set, optional): Las extensiones (en minúsculas) que se consideran
+            imágenes al recorrer directorios.
+
+    Yields:
+        tuple: `(ruta, ruta relativa)`, donde la relativa es la ruta dentro de su
+               fuente y se usa para construir la ruta de salida.
+    """
+    for source in sources:
+        source = str(source)
+        if glob.has_magic(source):
+            prefix = source.split("*")[0].split("?")[0].split("[")[0]
+            root = Path(os.path.dirname(prefix))
+            for path in glob.iglob(source, recursive=True):
+                path = Path(path)
+                if path.is_file():
+                    yield path, path.relative_to(root)
+        elif os.path.isdir(source):
+            yield from _walk(Path(source), Path(source), extensions)
+        else:
+            yield Path(source), Path(Path(source).name)
+
+
+def _walk(root, directory, extensions):
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk(root, Path(entry.path), extensions)
+        elif os.path.splitext(entry.name)[1].lower() in extensions:
+            path = Path(entry.path)
+            yield path, path.relative_to(root)
+
+
+def _key(path):
+    # The same image, however its source was spelled
+    return str(Path(path).resolve())
+
+
+class Manifest:
+    """
+    Registro de las imágenes terminadas de una ejecución, para poder reanudarla.
+
+    Es un fichero JSON Lines de sólo añadir: cada línea describe una imagen
+    terminada (con éxito o con error) y se escribe en cuanto la imagen lo está.
+    Las imágenes se identifican por su ruta absoluta, así que una ejecución se
+    reanuda igual aunque sus fuentes se indiquen con rutas relativas o desde otro
+    directorio.
+
+    Args:
+        path (str): La ruta del manifiesto.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        self.failed = set()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as reader:
+                for line in reader:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by an interruption; that image is redone
+                        continue
+                    key = _key(entry["path"])
+                    self.done.add(key)
+                    if entry.get("error"):
+                        self.failed.add(key)
+                    else:
+                        self.failed.discard(key)
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def __contains__(self, path):
+        return _key(path) in self.done
+
+    def forget_failures(self):
+        """
+        Olvida las imágenes que fallaron, para que se vuelvan a intentar.
+        """
+        self.done -= self.failed
+
+    def record(self, path, **fields):
+        """
+        Apunta una imagen terminada.
+
+        Args:
+            path (str): La ruta de la imagen de entrada.
+            **fields: Otros datos de la imagen (salida, clasificación, error...).
+        """
+        key = _key(path)
+        line = json.dumps({"path": key, **fields}, ensure_ascii=False)
+        with self._lock:
+            if self._writer is None:
+                self._open()
+            self._writer.write(line.encode("utf-8") + b"\n")
+            self._writer.flush()
+            self.done.add(key)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = open(self.path, "a+b")
+        # Terminate a line cut short by an interruption before appending
+        if self._writer.tell() > 0:
+            self._writer.seek(-1, os.SEEK_END)
+            if self._writer.read(1) != b"\n":
+                self._writer.write(b"\n")
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+def run_batch(
+    sources,
+    output_dir,
+    selected_filters=(),
+    face_detection=False,
+    classify=True,
+    writers=None,
+    retry_failed=False,
+    log=None,
+    pool=None,
+    backend=None,
+    dedup_threshold=None,
+    report=None,
+    embeddings=None,
+):
+    """
+    Procesa por lotes un conjunto de imágenes y escribe los resultados en disco.
+
+    Args:
+        sources (list): Directorios, ficheros o patrones glob (ver `iter_image_paths`).
+        output_dir (str): El directorio de salida.
+        selected_filters (list, optional): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
+        face_detection (bool, optional): Si se debe realizar la detección de rostros.
+        classify (bool, optional): Si se clasifican las imágenes con CLIP para
+            repartirlas en subcarpetas. Por defecto es True.
+        writers (int, optional): Los hilos de escritura. Por defecto es `os.cpu_count()`.
+        retry_failed (bool, optional): Si se reintentan las imágenes que fallaron en
+            una ejecución anterior.
+        log (file, optional): Dónde escribir los errores.
+        pool (workers.WorkerPool, optional): El pool a usar. Por defecto es el pool
+            persistente compartido.
+        backend (str, optional): El backend de los filtros, "exact" o "fast". Por
+            defecto es `chain.settings["backend"]`.
+        dedup_threshold (int, optional): Si se indica, agrupa las imágenes casi
+            duplicadas con ese umbral (en bits, ver `dedup.Deduplicator`) y procesa
+            una sola por grupo.
+        report (instrument.Report, optional): Dónde acumular la medición de las
+            etapas de cada imagen, incluida la clasificación.
+        embeddings (str or embeddings.EmbeddingStore, optional): El almacén (o su
+            directorio) donde guardar el embedding de CLIP de cada imagen
+            clasificada, con su ruta como nombre. Por defecto es
+            `embeddings.settings["directory"]`, si está definido.
+
+    Returns:
+        dict: El resumen: imágenes procesadas, fallidas y ya hechas, segundos y
+              imágenes por segundo; con `dedup_threshold`, también las
+              estadísticas de la deduplicación en "dedup".
+    """
+    selected_filters = list(selected_filters)
+    registry.resolve_all(selected_filters)  # fail fast on unknown filters or parameters
+    output_dir = Path(output_dir)
+    manifest = Manifest(output_dir / MANIFEST_NAME)
+    if retry_failed:
+        manifest.forget_failures()
+
+    if embeddings is None and classify and embedding_store.settings["directory"]:
+        embeddings = embedding_store.settings["directory"]
+    if embeddings is not None and not isinstance(embeddings, embedding_store.EmbeddingStore):
+        embeddings = embedding_store.EmbeddingStore(embeddings, model=ml.settings["model"])
+
+    skipped = 0
+    relative_paths = {}  # pipeline index -> path relative to its source
+    indices = itertools.count()
+
+    def pending_paths():
+        nonlocal skipped
+        for path, relative in iter_image_paths(sources):
+            if path in manifest:
+                skipped += 1
+                continue
+            # iter_pipeline numbers the paths it receives from 0
+            relative_paths[next(indices)] = relative
+            yield path
+
+    writers = writers or os.cpu_count()
+    counts = {"processed": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def fail(path, error):
+        manifest.record(path, error=str(error))
+        _report(log, f"{path}: {error}")
+        with counts_lock:
+            counts["failed"] += 1
+
+    def written(path, destination, fields, future):
+        if future.exception() is not None:
+            fail(path, future.exception())
+            return
+        manifest.record(path, output=str(destination), **fields)
+        with counts_lock:
+            counts["processed"] += 1
+
+    start = time.perf_counter()
+    options = {
+        "pool": pool,
+        "preview_size": ml.PREVIEW_SIZE if classify else None,
+        "backend": backend,
+        "report": report,
+    }
+    deduplicator = None
+    if dedup_threshold is None:
+        results = pipeline.iter_pipeline(
+            pending_paths(), selected_filters, face_detection, **options
+        )
+    else:
+        deduplicator = dedup.Deduplicator(dedup_threshold)
+        paths = list(pending_paths())
+        results = deduplicator.iter_pipeline(paths, selected_filters, face_detection, **options)
+    # Bounded queue: write() waits while too many images are waiting to be written
+    writer = io_utils.ImageWriter(writers, writers * WRITE_QUEUE_PER_THREAD)
+    recording = instrument.recording(report) if report is not None else contextlib.nullcontext()
+    try:
+        with recording:
+            for batch in _batched(results, CLASSIFY_BATCH_SIZE):
+                labels = _classify(batch, embeddings) if classify else {}
+                for result in batch:
+                    relative = relative_paths.pop(result.index)
+                    if result.error is not None:
+                        fail(result.path, result.error)
+                        continue
+                    fields = {"faces_detected": bool(result.faces_detected)}
+                    if deduplicator is not None:
+                        representative = deduplicator.representative[result.index]
+                        if representative != result.index:
+                            fields["duplicate_of"] = str(paths[representative])
+                    destination = output_dir / relative
+                    if result.index in labels:
+                        fields["classification"] = labels[result.index]
+                        destination = output_dir / ml.category(labels[result.index]) / relative
+                    # Only the hand-off: the time spent waiting for room in the queue
+                    with instrument.stage("write", result.index, result.image.nbytes):
+                        future = writer.write(result.image, destination)
+                    future.add_done_callback(
+                        functools.partial(written, result.path, destination, fields)
+                    )
+    finally:
+        results.close()
+        writer.close()
+        manifest.close()
+
+    elapsed = time.perf_counter() - start
+    finished = counts["processed"] + counts["failed"]
+    summary = {
+        "processed": counts["processed"],
+        "failed": counts["failed"],
+        "skipped": skipped,
+        "seconds": elapsed,
+        "images_per_second": finished / elapsed if elapsed else 0.0,
+    }
+    if deduplicator is not None:
+        summary["dedup"] = dict(deduplicator.stats)
+    return summary
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _classify(batch, store=None):
+    """
+    Clasifica las previsualizaciones de un grupo de resultados correctos.
+
+    Los duplicados de una imagen comparten su previsualización, que se clasifica
+    una sola vez (y se guarda en `store` con la ruta de la primera).
+
+    Returns:
+        dict: La etiqueta de cada resultado, por índice.
+    """
+    previews = {}
+    names = {}
+    for result in batch:
+        if result.error is None:
+            previews.setdefault(id(result.preview), result.preview)
+            names.setdefault(id(result.preview), str(result.path))
+    if not previews:
+        return {}
+    size = sum(preview.nbytes for preview in previews.values())
+    with instrument.stage("classify", bytes_in=size):
+        labels = ml.classify_batch(
+            list(previews.values()), store=store, names=list(names.values())
+        )
+        labels = dict(zip(previews, labels))
+    return {
+        result.index: labels[id(result.preview)][0]
+        for result in batch
+        if result.error is None
+    }
+
+
+def _report(log, message):
+    if log is not None:
+        print(message, file=log, flush=True)
+
+
+def main(argv=None):
+    """
+    Punto de entrada de la herramienta.
+
+    Args:
+        argv (list, optional): Los argumentos de la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(
+        description="Procesa por lotes directorios de imágenes con el pipeline de PhotoLab Express."
+    )
+    parser.add_argument("sources", nargs="+", help="Directorios, ficheros o patrones glob.")
+    parser.add_argument("--output", default="output", help="El directorio de salida.")
+    parser.add_argument(
+        "--filters",
+        nargs="*",
+        default=[],
+        metavar="FILTRO",
+        help='Los filtros a aplicar, con parámetros opcionales: "Canny:low_threshold=50".',
+    )
+    parser.add_argument("--faces", action="store_true", help="Detecta y recuadra rostros.")
+    parser.add_argument(
+        "--no-classify", action="store_true", help="No clasifica las imágenes con CLIP."
+    )
+    parser.add_argument("--writers", type=int, help="Hilos de escritura.")
+    parser.add_argument(
+        "--backend",
+        choices=chain.BACKENDS,
+        help="El backend de los filtros (por defecto, PHOTOLAB_FILTER_BACKEND o exact).",
+    )
+    parser.add_argument(
+        "--dedup",
+        type=int,
+        nargs="?",
+        const=dedup.settings["threshold"],
+        metavar="UMBRAL",
+        help="Procesa una sola vez cada grupo de imágenes casi duplicadas; el umbral es "
+        "la distancia de Hamming máxima en bits (por defecto, PHOTOLAB_DEDUP_THRESHOLD o 6).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="JSON",
+        help="Mide cada etapa de cada imagen y guarda el resumen y las medidas en este fichero.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="JSON",
+        help="Mide cada etapa y guarda una traza de Chrome (chrome://tracing, Perfetto).",
+    )
+    parser.add_argument(
+        "--embeddings",
+        metavar="DIRECTORIO",
+        help="Guarda el embedding de CLIP de cada imagen en este almacén, para buscar "
+        "imágenes parecidas o volver a etiquetarlas sin el modelo (ver src.embeddings).",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Reintenta las imágenes que fallaron en una ejecución anterior.",
+    )
+    args = parser.parse_args(argv)
+    report = None
+    if args.profile or args.trace or instrument.settings["enabled"]:
+        report = instrument.Report()
+
+    try:
+        summary = run_batch(
+            args.sources,
+            args.output,
+            [registry.parse(text) for text in args.filters],
+            face_detection=args.faces,
+            classify=not args.no_classify,
+            writers=args.writers,
+            retry_failed=args.retry_failed,
+            log=sys.stderr,
+            backend=args.backend,
+            dedup_threshold=args.dedup,
+            report=report,
+            embeddings=args.embeddings,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+
+    print(
+        f"{summary['processed']} imágenes procesadas, {summary['failed']} con errores, "
+        f"{summary['skipped']} ya hechas en {summary['seconds']:.1f} s "
+        f"({summary['images_per_second']:.1f} imágenes/s)."
+    )
+    if "dedup" in summary:
+        stats = summary["dedup"]
+        print(
+            f"{stats['duplicates']} de {stats['images']} imágenes eran duplicados "
+            f"({stats['unique']} procesadas una vez; {stats['hashed']} hashes calculados, "
+            f"{stats['from_index']} del índice, {stats['hash_seconds']:.1f} s)."
+        )
+    if report is not None:
+        print(report.format())
+        if args.profile:
+            report.to_json(args.profile)
+        if args.trace:
+            report.to_chrome_trace(args.trace)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,37 +3,746 @@ Utilidades de caché para la aplicación.
 
 Este módulo proporciona un mecanismo de caché simple utilizando la biblioteca `diskcache`
 para memoizar los resultados de llamadas a funciones costosas.
+
+Las claves de caché se construyen a partir del contenido de los argumentos y no de
+los argumentos en sí: los arrays de numpy se reducen a su forma, dtype y un digest
+del buffer, de modo que la base de datos nunca guarda (ni compara) megabytes de
+píxeles en la columna de claves. Los parámetros pequeños (`kernel_size`, `k`, ...) se
+mantienen legibles y cada función lleva una etiqueta de versión que invalida sus
+entradas cuando cambia su código.
+
+La caché está acotada: tiene un tamaño máximo, una política de desalojo (LRU, LFU o
+TTL) y un límite para el tamaño de cada entrada. Por cada función memoizada se
+llevan contadores de aciertos, fallos, desalojos y bytes servidos, que pueden
+consultarse con `python -m src.cache_admin stats`.
+
+La memoización tiene dos niveles. Delante del almacén en disco hay un nivel LRU en
+memoria, acotado por el total de bytes de los resultados que guarda, que evita
+consultar SQLite y deserializar cuando el mismo proceso acaba de calcular o leer un
+valor. Los aciertos en disco se promueven a memoria. En disco, los arrays de numpy
+se guardan en formato `.npy` en lugar de serializarse con pickle.
+
+El almacén se abre en el primer uso, no al importar el módulo. Su directorio es
+`PHOTOLAB_CACHE_DIR` o, por defecto, `project/cache`, independientemente del
+directorio de trabajo.
+
+Con `ProcessPoolExecutor`, cada worker tiene su propio nivel en memoria (que
+empieza vacío, también cuando el worker se crea con `fork`) y todos comparten el
+nivel en disco.
 """
-from diskcache import Cache
+import atexit
+import functools
+import hashlib
+import inspect
+import os
+import os.path as op
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+from diskcache import Cache, Disk
+from diskcache.core import MODE_PICKLE
+
+from . import instrument
+from .io_utils import get_image_digest
+
+# Eviction policies exposed to users, mapped to their diskcache names
+EVICTION_POLICIES = {
+    "lru": "least-recently-used",
+    "lfu": "least-frequently-used",
+    "ttl": "least-recently-stored",
+}
+
+# Defaults, overridable through environment variables or `configure`
+DEFAULT_DIRECTORY = op.join(op.dirname(op.dirname(op.abspath(__file__))), "cache")
+DEFAULT_SIZE_LIMIT = 2**30  # 1 GiB
+DEFAULT_MAX_ENTRY_SIZE = 2**27  # 128 MiB
+DEFAULT_TTL = 7 * 24 * 3600  # one week, only used by the "ttl" policy
+DEFAULT_MEMORY_LIMIT = 2**28  # 256 MiB per process
+
+# How often (in seconds) the in-process counters are written to the stats store
+STATS_FLUSH_INTERVAL = 2.0
+
+# Subdirectory of the cache directory holding the per-function counters
+STATS_SUBDIRECTORY = "stats"
+
+settings = {
+    "directory": os.environ.get("PHOTOLAB_CACHE_DIR", DEFAULT_DIRECTORY),
+    "size_limit": int(os.environ.get("PHOTOLAB_CACHE_SIZE_LIMIT", DEFAULT_SIZE_LIMIT)),
+    "eviction_policy": os.environ.get("PHOTOLAB_CACHE_POLICY", "lru"),
+    "ttl": float(os.environ.get("PHOTOLAB_CACHE_TTL", DEFAULT_TTL)),
+    "max_entry_size": int(
+        os.environ.get("PHOTOLAB_CACHE_MAX_ENTRY_SIZE", DEFAULT_MAX_ENTRY_SIZE)
+    ),
+    "memory_limit": int(
+        os.environ.get("PHOTOLAB_CACHE_MEMORY_LIMIT", DEFAULT_MEMORY_LIMIT)
+    ),
+}
+
+# Current version of every memoized function, by qualified name
+registry = {}
+
+# The disk stores, opened on first use (see `get_store`)
+cache = None
+stats_store = None
+_open_lock = threading.RLock()
+
+# Sentinel used to tell a cached ``None`` apart from a cache miss
+_MISSING = object()
+
+# Plain values that are kept verbatim (via repr) in the cache key
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _describe(value):
+    """
+    Devuelve una representación compacta y estable de un argumento para la clave.
+
+    Args:
+        value: El valor del argumento.
+
+    Returns:
+        str: La representación del valor dentro de la clave.
+    """
+    if isinstance(value, np.ndarray):
+        shape = "x".join(str(dim) for dim in value.shape)
+        return f"ndarray[{shape},{value.dtype.str}]:{get_image_digest(value)}"
+    if isinstance(value, _SCALAR_TYPES):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        items = ", ".join(_describe(item) for item in value)
+        return f"({items})" if isinstance(value, tuple) else f"[{items}]"
+    if isinstance(value, dict):
+        items = ", ".join(
+            sorted(f"{_describe(k)}: {_describe(v)}" for k, v in value.items())
+        )
+        return "{" + items + "}"
+    if isinstance(value, np.generic):
+        return repr(value.item())
+
+    # Anything else is digested through its pickled form
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return f"{type(value).__name__}:{hashlib.blake2b(payload, digest_size=16).hexdigest()}"
+
+
+# diskcache stores values in modes 0-4; arrays written as .npy files use their own
+MODE_NDARRAY = 5
+
+
+class ArrayDisk(Disk):
+    """
+    Serializador de diskcache que guarda los arrays de numpy sin pickle.
+
+    Los arrays numéricos que superan `min_file_size` se escriben como ficheros
+    `.npy` y se leen con `numpy.load`, que copia el buffer directamente en lugar de
+    deserializar. Los demás valores grandes se serializan con pickle y se escriben
+    de una sola vez (`Disk._write` itera un `BytesIO` línea a línea, lo que con
+    datos binarios son millones de escrituras pequeñas). El resto se delega en
+    `diskcache.Disk`.
+    """
+
+    def store(self, value, read, key=None):
+        if type(value) is np.ndarray and not value.dtype.hasobject:
+            if value.nbytes >= self.min_file_size:
+                filename, full_path = self.filename(key, value)
+                with self._open_new(full_path) as writer:
+                    np.lib.format.write_array(writer, value, allow_pickle=False)
+                    size = writer.tell()
+                return size, MODE_NDARRAY, filename, None
+        elif not read and type(value) not in (str, int, float, bytes):
+            result = pickle.dumps(value, protocol=self.pickle_protocol)
+            if len(result) < self.min_file_size:
+                return 0, MODE_PICKLE, None, sqlite3.Binary(result)
+            filename, full_path = self.filename(key, value)
+            with self._open_new(full_path) as writer:
+                writer.write(result)
+            return len(result), MODE_PICKLE, filename, None
+        if key is None:
+            return super().store(value, read)
+        return super().store(value, read, key=key)
+
+    @staticmethod
+    def _open_new(full_path):
+        os.makedirs(op.dirname(full_path), exist_ok=True)
+        return open(full_path, "xb")
+
+    def fetch(self, mode, filename, value, read):
+        if mode == MODE_NDARRAY:
+            return np.load(op.join(self._directory, filename), allow_pickle=False)
+        return super().fetch(mode, filename, value, read)
+
+
+class MemoryTier:
+    """
+    Nivel de caché LRU en memoria acotado por bytes.
+
+    Guarda los resultados tal cual, sin serializarlos. Los arrays guardados se
+    marcan como de sólo lectura y quien consulta recibe una copia, de modo que
+    modificar un resultado (p. ej. dibujar rectángulos sobre él) no altera la caché.
+
+    Args:
+        max_bytes (int): El total de bytes que puede ocupar el nivel. Con 0 el
+            nivel queda desactivado.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Devuelve una copia del valor guardado y lo marca como usado recientemente.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+        return _thaw(entry[0])
+
+    def put(self, key, value, size=None):
+        """
+        Guarda un valor, desalojando los menos usados hasta que quepa.
+
+        Los valores más grandes que el nivel completo no se guardan. El valor debe
+        pertenecer a la caché (ver `_freeze`).
+        """
+        size = entry_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            while self._entries and self.nbytes + size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+            self._entries[key] = (value, size)
+            self.nbytes += size
+
+    def discard(self, prefix):
+        """
+        Borra todas las entradas cuya clave empieza por `prefix`.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self.nbytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Vacía el nivel.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+def _freeze(value, copy=True):
+    """
+    Prepara un resultado para el nivel en memoria: los arrays pasan a ser de sólo
+    lectura (copiándolos antes si `copy` es True, porque quien los calculó aún los usa).
+    """
+    if isinstance(value, np.ndarray):
+        if copy:
+            value = value.copy()
+        value.setflags(write=False)
+        return value
+    if isinstance(value, (tuple, list)):
+        return type(value)(_freeze(item, copy) for item in value)
+    return value
+
+
+def _thaw(value):
+    """
+    Devuelve una copia modificable de un resultado del nivel en memoria.
+    """
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, (tuple, list)):
+        return type(value)(_thaw(item) for item in value)
+    return value
+
+
+memory = MemoryTier(settings["memory_limit"])
+
+# Forked workers start with an empty memory tier of their own
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=memory.clear)
+
+
+def _open(directory, policy, size_limit):
+    """
+    Abre el almacén principal y el de estadísticas en un directorio.
+
+    El desalojo automático de diskcache se desactiva (`cull_limit=0`): lo hace
+    `_enforce_limits` para poder atribuir cada desalojo a su función.
+    """
+    store = Cache(
+        directory,
+        disk=ArrayDisk,
+        size_limit=size_limit,
+        eviction_policy=EVICTION_POLICIES[policy],
+        cull_limit=0,
+        tag_index=True,
+    )
+    stats = Cache(os.path.join(directory, STATS_SUBDIRECTORY), eviction_policy="none")
+    return store, stats
+
+
+def configure(
+    directory=None,
+    size_limit=None,
+    eviction_policy=None,
+    ttl=None,
+    max_entry_size=None,
+    memory_limit=None,
+):
+    """
+    Cambia la configuración de la caché y reabre el almacén en disco.
+
+    Los argumentos omitidos conservan su valor actual.
+
+    Args:
+        directory (str, optional): El directorio de la caché.
+        size_limit (int, optional): El tamaño máximo de la caché en bytes.
+        eviction_policy (str, optional): La política de desalojo: "lru", "lfu" o "ttl".
+        ttl (float, optional): La vida de cada entrada en segundos (política "ttl").
+        max_entry_size (int, optional): El tamaño máximo de una entrada en bytes.
+            Los resultados más grandes se devuelven pero no se guardan.
+        memory_limit (int, optional): El tamaño máximo del nivel en memoria de este
+            proceso, en bytes. Con 0 se desactiva.
+
+    Raises:
+        ValueError: Si la política de desalojo no es válida.
+    """
+    global cache, stats_store
+
+    policy = eviction_policy or settings["eviction_policy"]
+    if policy not in EVICTION_POLICIES:
+        raise ValueError(
+            f"Política de desalojo desconocida: {policy!r} "
+            f"(opciones: {', '.join(EVICTION_POLICIES)})"
+        )
+
+    if cache is not None:
+        flush_stats()
+    updates = {
+        "directory": directory,
+        "size_limit": size_limit,
+        "eviction_policy": policy,
+        "ttl": ttl,
+        "max_entry_size": max_entry_size,
+        "memory_limit": memory_limit,
+    }
+    settings.update({name: value for name, value in updates.items() if value is not None})
+    memory.clear()
+    memory.max_bytes = settings["memory_limit"]
+
+    with _open_lock:
+        for store in (cache, stats_store):
+            if store is not None:
+                store.close()
+        cache, stats_store = _open(
+            settings["directory"], settings["eviction_policy"], settings["size_limit"]
+        )
+
+
+def get_store():
+    """
+    Devuelve el almacén en disco, abriéndolo en el primer uso.
+
+    Importar el módulo no toca el disco: el directorio se crea y la base de datos
+    se abre la primera vez que se consulta o guarda un resultado.
+
+    Returns:
+        diskcache.Cache: El almacén principal.
+    """
+    if cache is None:
+        with _open_lock:
+            if cache is None:
+                configure()
+    return cache
+
+
+def entry_size(value):
+    """
+    Estima el tamaño en bytes de un resultado.
+
+    Los arrays (y las tuplas o listas de arrays) se miden sin serializarlos; el
+    resto de los valores se mide por su tamaño serializado.
+
+    Args:
+        value: El valor a medir.
+
+    Returns:
+        int: El tamaño estimado en bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(entry_size(item) for item in value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class _Stats:
+    """
+    Contadores por función acumulados en memoria y volcados periódicamente.
+
+    Cada proceso (incluidos los workers de `ProcessPoolExecutor`) acumula sus
+    propios contadores y los suma al almacén compartido cada
+    `STATS_FLUSH_INTERVAL` segundos y al terminar, así los aciertos no pagan una
+    escritura en SQLite.
+    """
+
+    FIELDS = (
+        "hits",
+        "memory_hits",
+        "misses",
+        "stores",
+        "skipped",
+        "evictions",
+        "bytes_served",
+        "bytes_stored",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(Counter)
+        self._pid = None
+        self._last_flush = time.monotonic()
+
+    def record(self, name, **amounts):
+        """
+        Suma cantidades a los contadores de una función.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._attach()
+            self._counters[name].update(amounts)
+            due = time.monotonic() - self._last_flush > STATS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def _attach(self):
+        # First event in this process: drop counters inherited through fork (the
+        # parent flushes those) and make sure ours are flushed on exit.
+        import multiprocessing.util
+
+        self._pid = os.getpid()
+        self._counters.clear()
+        atexit.register(self.flush)
+        multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
+
+    def flush(self):
+        """
+        Vuelca los contadores pendientes al almacén de estadísticas.
+        """
+        with self._lock:
+            pending, self._counters = self._counters, defaultdict(Counter)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        get_store()
+        with stats_store.transact(retry=True):
+            for name, counters in pending.items():
+                for field, amount in counters.items():
+                    stats_store.incr(f"{name}|{field}", amount, retry=True)
+
+
+_stats = _Stats()
+
+
+def flush_stats():
+    """
+    Vuelca al disco los contadores pendientes del proceso actual.
+    """
+    _stats.flush()
+
+
+def read_stats():
+    """
+    Lee los contadores acumulados por todos los procesos.
+
+    Returns:
+        dict: Un diccionario `{función: {contador: valor}}`.
+    """
+    flush_stats()
+    get_store()
+    result = defaultdict(lambda: dict.fromkeys(_Stats.FIELDS, 0))
+    for key in stats_store.iterkeys():
+        name, _, field = key.rpartition("|")
+        result[name][field] = stats_store.get(key, default=0)
+    return dict(result)
+
+
+def reset_stats():
+    """
+    Pone a cero todos los contadores.
+    """
+    flush_stats()
+    get_store()
+    stats_store.clear()
+
+
+def _function_of(key):
+    """
+    Devuelve el nombre de la función a la que pertenece una clave de caché.
+    """
+    return key.partition("@")[0] if isinstance(key, str) else None
+
+
+def _evicted_by(cleanup):
+    """
+    Ejecuta una limpieza de diskcache y registra los desalojos por función.
+
+    diskcache no dice qué entradas borra, así que se comparan las claves de antes
+    y de después.
+
+    Args:
+        cleanup (function): Un método público del almacén que borra entradas
+            (`Cache.expire` o `Cache.cull`).
+
+    Returns:
+        int: El número de entradas borradas.
+    """
+    store = get_store()
+    before = set(store.iterkeys())
+    cleanup(retry=True)
+    removed = Counter(_function_of(key) for key in before.difference(store.iterkeys()))
+    for name, count in removed.items():
+        _stats.record(name, evictions=count)
+    return sum(removed.values())
+
+
+def expire():
+    """
+    Borra las entradas cuya vida (política "ttl") ha vencido.
+
+    Returns:
+        int: El número de entradas borradas.
+    """
+    return _evicted_by(get_store().expire)
+
+
+def _enforce_limits():
+    """
+    Desaloja entradas, según la política configurada, hasta respetar `size_limit`.
+
+    Returns:
+        int: El número de entradas desalojadas.
+    """
+    if get_store().volume() <= settings["size_limit"]:
+        return 0
+    # cull() first drops the expired entries, then follows the store's policy
+    return _evicted_by(get_store().cull)
+
+
+def prune(name):
+    """
+    Borra todas las entradas (de cualquier versión) de una función.
+
+    Args:
+        name (str): El nombre calificado de la función, p. ej. `filters.apply_sobel`.
+
+    Returns:
+        int: El número de entradas borradas.
+    """
+    memory.discard(f"{name}@")
+    return get_store().evict(name, retry=True)
+
+
+def clear_stale():
+    """
+    Borra las entradas vencidas y las de versiones antiguas de funciones conocidas.
+
+    Sólo se consideran las funciones registradas en este proceso (las de los
+    módulos importados), de modo que nunca se borran entradas de funciones cuyo
+    código actual se desconoce.
+
+    Returns:
+        int: El número de entradas borradas.
+    """
+    removed = expire()
+    stale = []
+    for key in get_store().iterkeys():
+        name, _, rest = key.partition("@") if isinstance(key, str) else (None, "", "")
+        version = rest.partition("(")[0]
+        if name in registry and registry[name] != version:
+            stale.append(key)
+    for key in stale:
+        memory.discard(key)
+        removed += int(get_store().delete(key, retry=True))
+    return removed
+
+
+def store(name, key, value):
+    """
+    Guarda un resultado respetando el tamaño máximo por entrada y de la caché.
+
+    Args:
+        name (str): El nombre calificado de la función.
+        key (str): La clave de caché.
+        value: El resultado a guardar.
+
+    Returns:
+        bool: True si el resultado se guardó.
+    """
+    size = entry_size(value)
+    if size > settings["max_entry_size"]:
+        _stats.record(name, skipped=1)
+        return False
+
+    expire_after = settings["ttl"] if settings["eviction_policy"] == "ttl" else None
+    get_store().set(key, value, expire=expire_after, tag=name, retry=True)
+    _stats.record(name, stores=1, bytes_stored=size)
+    _enforce_limits()
+    return True
+
+
+def _source_version(func):
+    """
+    Calcula una etiqueta de versión a partir del código fuente de una función.
+
+    Args:
+        func (function): La función a versionar.
+
+    Returns:
+        str: Un hash corto del código de la función.
+    """
+    try:
+        source = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        source = func.__code__.co_code
+    return hashlib.blake2b(source, digest_size=4).hexdigest()
 
-cache = Cache("./cache")
 
+def function_name(func):
+    """
+    Devuelve el nombre con el que una función aparece en las claves de caché.
+
+    Se usa sólo el último componente del módulo (`filters.apply_sobel`) para que la
+    misma función comparta entradas tanto si se importa como `src.filters` como si se
+    importa como `project.src.filters`.
+
+    Args:
+        func (function): La función memoizada.
+
+    Returns:
+        str: El nombre calificado de la función.
+    """
+    return f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
 
-def memoize(func):
+
+def make_key(name, version, signature, args, kwargs):
+    """
+    Construye la clave de caché de una llamada.
+
+    Los argumentos se enlazan a la firma de la función (aplicando los valores por
+    defecto), así `apply_gaussian_blur(img)` y `apply_gaussian_blur(img, (5, 5))`
+    comparten la misma entrada.
+
+    Args:
+        name (str): El nombre calificado de la función.
+        version (str): La etiqueta de versión de la función.
+        signature (inspect.Signature): La firma de la función.
+        args (tuple): Los argumentos posicionales de la llamada.
+        kwargs (dict): Los argumentos con nombre de la llamada.
+
+    Returns:
+        str: La clave, p. ej. ``filters.apply_gaussian_blur@1(image=ndarray[480x640x3,|u1]:...,
+             kernel_size=(5, 5))``.
+    """
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    params = ", ".join(
+        f"{param}={_describe(value)}" for param, value in bound.arguments.items()
+    )
+    return f"{name}@{version}({params})"
+
+
+def memoize(func=None, *, version=None):
     """
     Un decorador para memoizar llamadas a funciones usando diskcache.
 
+    Puede usarse sin argumentos (`@memoize`) o con una versión explícita
+    (`@memoize(version="2")`). Sin versión explícita, la etiqueta se deriva del código
+    fuente de la función, de modo que modificar un filtro invalida sus entradas.
+
     Args:
         func (function): La función a ser memoizada.
+        version (str, optional): La etiqueta de versión de la función.
 
     Returns:
         function: La función envuelta.
     """
+    if func is None:
+        return functools.partial(memoize, version=version)
 
+    name = function_name(func)
+    tag = str(version) if version is not None else _source_version(func)
+    signature = inspect.signature(func)
+    registry[name] = tag
+
+    def key_for(*args, **kwargs):
+        """
+        Devuelve la clave de caché que usaría una llamada con estos argumentos.
+        """
+        return make_key(name, tag, signature, args, kwargs)
+
+    def lookup(key):
+        """
+        Busca un resultado en los dos niveles; devuelve `_MISSING` si no está.
+        """
+        # First tier: this process's memory
+        result = memory.get(key, default=_MISSING)
+        if result is not _MISSING:
+            _stats.record(name, hits=1, memory_hits=1, bytes_served=entry_size(result))
+            return result
+
+        # Second tier: the shared disk store; hits are promoted to memory
+        result = get_store().get(key, default=_MISSING, retry=True)
+        if result is not _MISSING:
+            size = entry_size(result)
+            _stats.record(name, hits=1, bytes_served=size)
+            memory.put(key, _freeze(result, copy=False), size)
+            return _thaw(result)
+        return _MISSING
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         """
         La función envoltorio que implementa la lógica de caché.
         """
-        # Create a cache key from the function name, args, and kwargs
-        key = (func.__name__, args, frozenset(kwargs.items()))
-
-        # Check if the result is already in the cache
-        if key in cache:
-            return cache[key]
+        with instrument.stage("cache_lookup"):
+            key = key_for(*args, **kwargs)
+            result = lookup(key)
+            instrument.cache_event(hit=result is not _MISSING)
+        if result is not _MISSING:
+            return result
 
-        # If not, call the function and store the result in the cache
+        # If not, call the function and store the result in both tiers
+        _stats.record(name, misses=1)
         result = func(*args, **kwargs)
-        cache[key] = result
+        with instrument.stage("cache_store") as span:
+            size = entry_size(result)
+            if store(name, key, result) and size <= memory.max_bytes:
+                memory.put(key, _freeze(result), size)
+            span.bytes_in = size
         return result
 
+    wrapper.key_for = key_for
+    wrapper.cache_version = tag
     return wrapper
@@ -0,0 +1,100 @@
+"""
+Herramienta de línea de comandos para administrar la caché.
+
+Permite consultar las estadísticas por función, borrar las entradas de una función
+y limpiar las entradas vencidas o de versiones antiguas sin borrar el directorio
+completo de la caché. Se ejecuta desde el directorio `project/`:
+
+    python -m src.cache_admin stats
+    python -m src.cache_admin prune filters.apply_sobel
+    python -m src.cache_admin clear-stale
+    python -m src.cache_admin reset-stats
+"""
+import argparse
+
+from . import cache
+
+# Imported for their side effect: registering the current version of every
+# memoized function, so that `clear-stale` knows which entries are outdated.
+from . import filters, detect  # noqa: F401
+
+
+def _format_bytes(amount):
+    """
+    Formatea una cantidad de bytes en la unidad más legible.
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if amount < 1024 or unit == "GiB":
+            return f"{amount:.1f} {unit}" if unit != "B" else f"{amount} B"
+        amount /= 1024
+
+
+def print_stats():
+    """
+    Imprime la configuración, el uso y los contadores de cada función memoizada.
+    """
+    settings = cache.settings
+    store = cache.get_store()
+    print(f"Directorio:         {settings['directory']}")
+    print(f"Política:           {settings['eviction_policy']}")
+    print(
+        f"Uso:                {_format_bytes(store.volume())} de "
+        f"{_format_bytes(settings['size_limit'])} ({len(store)} entradas)"
+    )
+    print(f"Máximo por entrada: {_format_bytes(settings['max_entry_size'])}")
+    print(f"Nivel en memoria:   {_format_bytes(settings['memory_limit'])} por proceso")
+    print()
+
+    stats = cache.read_stats()
+    header = (
+        f"{'función':<32} {'aciertos':>9} {'en memoria':>10} {'fallos':>8} {'tasa':>6} "
+        f"{'desalojos':>10} {'servido':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name in sorted(stats):
+        counters = stats[name]
+        lookups = counters["hits"] + counters["misses"]
+        rate = counters["hits"] / lookups if lookups else 0.0
+        print(
+            f"{name:<32} {counters['hits']:>9} {counters['memory_hits']:>10} "
+            f"{counters['misses']:>8} {rate:>6.1%} "
+            f"{counters['evictions']:>10} {_format_bytes(counters['bytes_served']):>11}"
+        )
+
+
+def main(argv=None):
+    """
+    Punto de entrada de la herramienta.
+
+    Args:
+        argv (list, optional): Los argumentos de la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Administra la caché de PhotoLab Express.")
+    parser.add_argument("--directory", help="El directorio de la caché.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Muestra el uso y los contadores por función.")
+    prune_parser = commands.add_parser("prune", help="Borra las entradas de una función.")
+    prune_parser.add_argument("function", help="Por ejemplo: filters.apply_sobel")
+    commands.add_parser(
+        "clear-stale", help="Borra las entradas vencidas y las de versiones antiguas."
+    )
+    commands.add_parser("reset-stats", help="Pone a cero los contadores.")
+    args = parser.parse_args(argv)
+
+    if args.directory:
+        cache.configure(directory=args.directory)
+
+    if args.command == "stats":
+        print_stats()
+    elif args.command == "prune":
+        print(f"{cache.prune(args.function)} entradas borradas de {args.function}.")
+    elif args.command == "clear-stale":
+        print(f"{cache.clear_stale()} entradas vencidas u obsoletas borradas.")
+    elif args.command == "reset-stats":
+        cache.reset_stats()
+        print("Contadores reiniciados.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Ejecución fusionada de cadenas de filtros.
+
+Aplicar los filtros de `filters.py` uno tras otro repite trabajo: `apply_sobel` y
+`apply_canny` terminan convirtiendo su resultado de gris a BGR, y el filtro siguiente
+vuelve a convertirlo a gris; además cada paso guarda en la caché una imagen
+intermedia que nadie reutiliza.
+
+Este módulo planifica la cadena completa antes de ejecutarla: sigue el espacio de
+color a lo largo de la cadena (una vez que un filtro produce una imagen gris, el resto
+de la cadena trabaja en gris), elimina las conversiones redundantes y ejecuta los
+pasos sobre buffers preasignados que se reutilizan entre imágenes del mismo tamaño,
+usando las salidas `dst=` de OpenCV. Los filtros, sus parámetros y el espacio de
+color que necesitan y producen se declaran en `registry`. Sólo el resultado final
+se guarda en la caché, con una clave que incluye la cadena completa.
+
+El resultado es idéntico píxel a píxel al de aplicar los filtros por separado: las
+conversiones gris → BGR → gris son exactas, los filtros por canal dan el mismo
+resultado sobre un canal que sobre tres canales iguales, y el cambio de tono no
+altera una imagen gris (su saturación es cero).
+
+Hay dos backends (`settings["backend"]`, variable `PHOTOLAB_FILTER_BACKEND`):
+"exact", el de por defecto, reproduce la aritmética de `filters.py` y da el
+resultado idéntico descrito arriba; "fast" usa las operaciones de `fast_filters`,
+que trabajan en float32 y con tablas de consulta y pueden diferir en
+`fast_filters.TOLERANCE` niveles de gris.
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from . import fast_filters, registry
+from .cache import memoize
+from .registry import BGR, GRAY
+
+BACKENDS = ("exact", "fast")
+
+settings = {
+    "backend": os.environ.get("PHOTOLAB_FILTER_BACKEND", "exact"),
+}
+
+# Conversion steps inserted by the planner
+TO_GRAY = "to_gray"
+TO_BGR = "to_bgr"
+
+
+def plan(filter_names, input_space=BGR):
+    """
+    Planifica una cadena de filtros.
+
+    Args:
+        filter_names (list): Los filtros, en orden de aplicación: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry.resolve`).
+        input_space (str, optional): El espacio de color de la imagen de entrada.
+            Por defecto es BGR.
+
+    Returns:
+        tuple: Los pasos a ejecutar: un `registry.Step` por filtro, incluidas las
+               conversiones `to_gray`/`to_bgr` estrictamente necesarias.
+
+    Raises:
+        ValueError: Si algún filtro no existe o algún parámetro no es válido.
+    """
+    steps = []
+    space = input_space
+    for step in registry.resolve_all(filter_names):
+        spec = registry.get(step.name)
+        if step.name == "Random Hue Shift" and space == GRAY:
+            # Shifting the hue of a gray image leaves it unchanged
+            continue
+        if spec.requires == GRAY and space != GRAY:
+            steps.append(TO_GRAY)
+        elif spec.requires == BGR and space != BGR:
+            steps.append(TO_BGR)
+        steps.append(step)
+        space = spec.produces or (space if spec.requires == registry.ANY else spec.requires)
+
+    if space != input_space:
+        steps.append(TO_BGR if input_space == BGR else TO_GRAY)
+    return tuple(steps)
+
+
+def is_deterministic(steps):
+    """
+    Indica si un plan da siempre el mismo resultado (y por tanto puede cachearse).
+    """
+    return registry.is_deterministic(steps)
+
+
+class Workspace:
+    """
+    Buffers preasignados para ejecutar cadenas de filtros.
+
+    Los buffers se reutilizan mientras las imágenes tengan el mismo tamaño, que es
+    el caso habitual en un lote. Cada hilo usa su propio workspace (ver
+    `workspace()`).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """
+        Devuelve el buffer `name` con la forma y el tipo pedidos, creándolo si hace falta.
+        """
+        array = self._buffers.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self._buffers[name] = array
+        return array
+
+    def output(self, image, space, parity):
+        """
+        Devuelve un buffer de salida para un paso, distinto del de su entrada.
+
+        Los pasos alternan entre dos buffers por espacio de color (`parity`).
+        """
+        shape = image.shape[:2] if space == GRAY else image.shape[:2] + (3,)
+        return self.buffer(f"{space}{parity}", shape)
+
+
+_local = threading.local()
+
+
+def workspace():
+    """
+    Devuelve el workspace del hilo actual.
+    """
+    if not hasattr(_local, "workspace"):
+        _local.workspace = Workspace()
+    return _local.workspace
+
+
+def _to_gray(src, dst, ws):
+    cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)
+
+
+def _to_bgr(src, dst, ws):
+    cv2.cvtColor(src, cv2.COLOR_GRAY2BGR, dst=dst)
+
+
+_CONVERSIONS = {
+    TO_GRAY: _to_gray,
+    TO_BGR: _to_bgr,
+}
+
+
+def _operations(backend):
+    """
+    Devuelve las implementaciones de un backend que sustituyen a las del registro.
+    """
+    backend = backend or settings["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de filtros desconocido: {backend}")
+    return fast_filters.OPERATIONS if backend == "fast" else {}
+
+
+def run_plan(image, steps, backend=None):
+    """
+    Ejecuta un plan sobre una imagen usando los buffers del workspace del hilo.
+
+    Args:
+        image (numpy.ndarray): La imagen de entrada (no se modifica).
+        steps (tuple): El plan devuelto por `plan`.
+        backend (str, optional): "exact" o "fast". Por defecto es `settings["backend"]`.
+
+    Returns:
+        numpy.ndarray: Una imagen nueva con el resultado.
+
+    Raises:
+        ValueError: Si el backend no existe.
+    """
+    overrides = _operations(backend)
+    if not steps:
+        return image.copy()
+
+    ws = workspace()
+    current = image
+    for index, step in enumerate(steps):
+        if isinstance(step, str):
+            operation, params = _CONVERSIONS[step], {}
+            space = GRAY if step == TO_GRAY else BGR
+        else:
+            spec = registry.get(step.name)
+            operation, params = overrides.get(step.name, spec.operation), dict(step.params)
+            space = spec.produces or (GRAY if current.ndim == 2 else BGR)
+        if index == len(steps) - 1:
+            # The last step writes into a fresh array that the caller owns
+            shape = image.shape[:2] if space == GRAY else image.shape[:2] + (3,)
+            destination = np.empty(shape, dtype=np.uint8)
+        else:
+            destination = ws.output(image, space, index % 2)
+        operation(current, destination, ws, **params)
+        current = destination
+    return current
+
+
+@memoize
+def _run_cached(image, steps, backend):
+    """
+    Variante memoizada de `run_plan`: la clave incluye la cadena completa y el backend.
+    """
+    return run_plan(image, steps, backend)
+
+
+def apply_chain(image, filter_names, backend=None, cached=True):
+    """
+    Aplica una cadena de filtros de forma fusionada.
+
+    Las cadenas deterministas se cachean como una sola entrada; las que incluyen un
+    filtro aleatorio se calculan siempre.
+
+    Args:
+        image (numpy.ndarray): La imagen de entrada.
+        filter_names (list): Los filtros, en orden de aplicación: nombres o pares
+            `(nombre, {parámetro: valor})`.
+        backend (str, optional): "exact" o "fast". Por defecto es `settings["backend"]`.
+        cached (bool, optional): Si se usa la caché. Con False la cadena se calcula
+            siempre, p. ej. para fotogramas de vídeo, que no se repiten.
+
+    Returns:
+        numpy.ndarray: La imagen filtrada.
+    """
+    if not filter_names:
+        return image
+    backend = backend or settings["backend"]
+    steps = plan(filter_names, GRAY if image.ndim == 2 else BGR)
+    if cached and is_deterministic(steps):
+        return _run_cached(image, steps, backend)
+    return run_plan(image, steps, backend)
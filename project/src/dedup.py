@@ -0,0 +1,384 @@
+"""
+Detección de imágenes casi duplicadas antes del pipeline.
+
+Las ráfagas de fotos y las reexportaciones de una misma foto no son idénticas byte
+a byte (`io_utils.get_image_hash` no las reconoce), pero sí lo son a la vista. Este
+módulo calcula un hash perceptual de 64 bits de cada imagen (`dhash` o `phash`) a
+partir de una decodificación reducida, y agrupa las imágenes cuyos hashes están a
+una distancia de Hamming de como mucho `threshold` bits:
+
+- La búsqueda de vecinos usa un índice multi-tramo (`MultiIndex`), no la
+  comparación de todos los pares: cada consulta sólo compara los hashes que
+  coinciden exactamente con ella en algún tramo de bits.
+- Cada grupo tiene un representante (su primera imagen) y sólo los representantes
+  entran en el índice, así que los grupos no se encadenan: toda imagen de un grupo
+  está a `threshold` bits o menos de su representante.
+- `Deduplicator.iter_pipeline` procesa sólo los representantes y entrega el
+  resultado de cada uno también para cada miembro de su grupo.
+
+Los hashes pueden guardarse entre ejecuciones en un índice (`HashIndex`, un
+fichero JSON) para no volver a decodificar las imágenes que no han cambiado.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from . import io_utils, pipeline
+
+HASH_METHODS = ("dhash", "phash")
+
+# Short side of the reduced decode the hashes are computed from
+HASH_INPUT_SIZE = 64
+
+settings = {
+    # Maximum Hamming distance, in bits out of 64, between duplicates
+    "threshold": int(os.environ.get("PHOTOLAB_DEDUP_THRESHOLD", 6)),
+    "method": os.environ.get("PHOTOLAB_DEDUP_HASH", "dhash"),
+    # JSON file where the hashes are kept between runs (None: not kept)
+    "index": os.environ.get("PHOTOLAB_DEDUP_INDEX") or None,
+}
+
+
+def _gray(image, width, height):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _pack(bits):
+    """
+    Empaqueta una matriz `(n, 64)` de bits en `n` enteros sin signo de 64 bits.
+    """
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def dhash(images):
+    """
+    Calcula el hash de diferencias (dHash) de un grupo de imágenes.
+
+    Cada imagen se reduce a 9x8 píxeles grises y cada bit indica si un píxel es más
+    claro que su vecino de la izquierda.
+
+    Args:
+        images (list): Las imágenes (BGR o grises, de cualquier tamaño).
+
+    Returns:
+        numpy.ndarray: Un hash `uint64` por imagen.
+    """
+    if not len(images):
+        return np.empty(0, dtype=np.uint64)
+    small = np.stack([_gray(image, 9, 8) for image in images])
+    return _pack((small[:, :, 1:] > small[:, :, :-1]).reshape(len(small), 64))
+
+
+def phash(images):
+    """
+    Calcula el hash perceptual basado en la DCT (pHash) de un grupo de imágenes.
+
+    Cada imagen se reduce a 32x32 píxeles grises; cada bit indica si uno de los 8x8
+    coeficientes de más baja frecuencia de su DCT supera la mediana de esos
+    coeficientes. Es más robusto que `dhash` frente a cambios de contraste y
+    recompresión, y algo más lento.
+
+    Args:
+        images (list): Las imágenes (BGR o grises, de cualquier tamaño).
+
+    Returns:
+        numpy.ndarray: Un hash `uint64` por imagen.
+    """
+    if not len(images):
+        return np.empty(0, dtype=np.uint64)
+    low = np.stack([cv2.dct(_gray(image, 32, 32))[:8, :8] for image in images])
+    low = low.reshape(len(low), 64)
+    # The DC coefficient (the mean brightness) is left out of the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+_HASHES = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a, b):
+    """
+    Devuelve la distancia de Hamming entre dos hashes.
+    """
+    return (int(a) ^ int(b)).bit_count()
+
+
+class MultiIndex:
+    """
+    Índice de hashes para buscar los que están a una distancia de Hamming acotada.
+
+    Es una búsqueda multi-índice: los 64 bits se dividen en `radius + 1` tramos y
+    cada tramo indexa los hashes en un diccionario. Si dos hashes difieren en
+    `radius` bits o menos, por el principio del palomar coinciden exactamente en
+    algún tramo, así que basta con comparar los hashes que comparten un tramo con
+    la consulta, no todos.
+
+    Args:
+        radius (int): La distancia máxima de las búsquedas (de 0 a 63).
+    """
+
+    def __init__(self, radius):
+        parts = radius + 1
+        self.radius = radius
+        self._slices = [
+            (64 * i // parts, (1 << (64 * (i + 1) // parts - 64 * i // parts)) - 1)
+            for i in range(parts)
+        ]
+        self._tables = [{} for _ in self._slices]
+        self._keys = []
+        self._values = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, value):
+        """
+        Añade un hash con un valor asociado.
+        """
+        key = int(key)
+        for (shift, mask), table in zip(self._slices, self._tables):
+            table.setdefault((key >> shift) & mask, []).append(len(self._keys))
+        self._keys.append(key)
+        self._values.append(value)
+
+    def search(self, key):
+        """
+        Busca los hashes a una distancia de como mucho `radius` bits.
+
+        Args:
+            key (int): El hash a buscar.
+
+        Returns:
+            list: Pares `(distancia, valor)`, del más cercano al más lejano (y en
+                  orden de inserción a igual distancia).
+        """
+        key = int(key)
+        candidates = set()
+        for (shift, mask), table in zip(self._slices, self._tables):
+            candidates.update(table.get((key >> shift) & mask, ()))
+        found = []
+        for position in sorted(candidates):
+            distance = (key ^ self._keys[position]).bit_count()
+            if distance <= self.radius:
+                found.append((distance, position))
+        found.sort()
+        return [(distance, self._values[position]) for distance, position in found]
+
+
+class HashIndex:
+    """
+    Hashes calculados en ejecuciones anteriores, por ruta.
+
+    Una entrada sólo se reutiliza si el fichero tiene el mismo tamaño y la misma
+    fecha de modificación que cuando se calculó.
+
+    Args:
+        path (str, optional): El fichero JSON del índice. Sin ruta, el índice sólo
+            vive en memoria.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._entries = {}
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as reader:
+                    self._entries = json.load(reader)
+            except (OSError, ValueError):
+                # A damaged index only costs recomputing the hashes
+                self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, path, method):
+        """
+        Devuelve el hash guardado de una imagen, o None si no está o está obsoleto.
+        """
+        entry = self._entries.get(str(path))
+        if entry is None or method not in entry:
+            return None
+        try:
+            if entry["stamp"] != self._stamp(path):
+                return None
+        except OSError:
+            return None
+        return entry[method]
+
+    def put(self, path, method, value):
+        """
+        Guarda el hash de una imagen.
+        """
+        try:
+            stamp = self._stamp(path)
+        except OSError:
+            return
+        entry = self._entries.get(str(path))
+        if entry is None or entry["stamp"] != stamp:
+            entry = self._entries[str(path)] = {"stamp": stamp}
+        entry[method] = int(value)
+
+    def save(self):
+        """
+        Escribe el índice en su fichero (de forma atómica), si tiene uno.
+        """
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as writer:
+            json.dump(self._entries, writer)
+        os.replace(temporary, self.path)
+
+
+class Deduplicator:
+    """
+    Agrupa imágenes casi duplicadas y procesa una sola imagen por grupo.
+
+    Args:
+        threshold (int, optional): La distancia de Hamming máxima, en bits, entre
+            una imagen y el representante de su grupo. Por defecto es
+            `settings["threshold"]`; 0 sólo agrupa imágenes con el mismo hash.
+        method (str, optional): "dhash" o "phash". Por defecto es `settings["method"]`.
+        index (str or HashIndex, optional): El índice de hashes (o su ruta) que se
+            conserva entre ejecuciones. Por defecto es `settings["index"]`.
+        max_workers (int, optional): Los hilos que decodifican las imágenes.
+
+    Raises:
+        ValueError: Si el método o el umbral no son válidos.
+    """
+
+    def __init__(self, threshold=None, method=None, index=None, max_workers=None):
+        self.threshold = settings["threshold"] if threshold is None else threshold
+        self.method = method or settings["method"]
+        if self.method not in HASH_METHODS:
+            raise ValueError(f"Hash desconocido: {self.method}")
+        if not 0 <= self.threshold <= 63:
+            raise ValueError(f"El umbral debe estar entre 0 y 63 bits, no {self.threshold}")
+        index = settings["index"] if index is None else index
+        self.index = index if isinstance(index, HashIndex) else HashIndex(index)
+        self.max_workers = max_workers
+        self.stats = {}
+        # Index of each image -> index of its group's representative (last run)
+        self.representative = {}
+
+    def hashes(self, paths):
+        """
+        Calcula (o recupera del índice) el hash de cada imagen.
+
+        Args:
+            paths (list): Las rutas de las imágenes.
+
+        Returns:
+            list: El hash de cada imagen, o None si no se pudo leer.
+        """
+        hashes = [self.index.get(path, self.method) for path in paths]
+        missing = [i for i, value in enumerate(hashes) if value is None]
+
+        def load(path):
+            try:
+                return io_utils.load_preview(path, HASH_INPUT_SIZE)
+            except (OSError, ValueError):
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            images = list(executor.map(load, [paths[i] for i in missing]))
+        readable = [(i, image) for i, image in zip(missing, images) if image is not None]
+        computed = _HASHES[self.method]([image for _, image in readable])
+        for (i, _), value in zip(readable, computed):
+            hashes[i] = int(value)
+            self.index.put(paths[i], self.method, value)
+        self.stats["hashed"] = len(readable)
+        self.stats["from_index"] = len(paths) - len(missing)
+        return hashes
+
+    def clusters(self, paths):
+        """
+        Agrupa las imágenes casi duplicadas.
+
+        Args:
+            paths (list): Las rutas de las imágenes.
+
+        Returns:
+            list: Los grupos, como listas de índices en `paths`; el primero de cada
+                  grupo es su representante. Las imágenes ilegibles forman su propio
+                  grupo (el pipeline informará del error).
+        """
+        start = time.perf_counter()
+        representatives = MultiIndex(self.threshold)
+        groups = []
+        for i, value in enumerate(self.hashes(paths)):
+            matches = representatives.search(value) if value is not None else []
+            if matches:
+                groups[matches[0][1]].append(i)
+                continue
+            if value is not None:
+                representatives.add(value, len(groups))
+            groups.append([i])
+        self.index.save()
+        self.stats.update(
+            images=len(paths),
+            unique=len(groups),
+            duplicates=len(paths) - len(groups),
+            hash_seconds=time.perf_counter() - start,
+        )
+        return groups
+
+    def iter_pipeline(self, image_paths, selected_filters, face_detection, **options):
+        """
+        Ejecuta el pipeline sólo sobre un representante de cada grupo de duplicados.
+
+        El resultado de cada representante se entrega también para cada miembro de
+        su grupo, con el índice y la ruta del miembro (y la misma imagen procesada,
+        que no debe modificarse). Los resultados salen por grupos: el representante
+        y a continuación sus duplicados.
+
+        Args:
+            image_paths (iterable): Las rutas a los archivos de imagen.
+            selected_filters (list): Los filtros a aplicar.
+            face_detection (bool): Si se debe realizar la detección de rostros.
+            **options: Otros argumentos de `pipeline.iter_pipeline`.
+
+        Yields:
+            pipeline.PipelineResult: Un resultado por imagen de entrada.
+        """
+        paths = list(image_paths)
+        groups = self.clusters(paths)
+        self.representative = {}
+        for group in groups:
+            for member in group:
+                self.representative[member] = group[0]
+        results = pipeline.iter_pipeline(
+            [paths[group[0]] for group in groups], selected_filters, face_detection, **options
+        )
+        try:
+            for result in results:
+                group = groups[result.index]
+                for member in group:
+                    yield result._replace(index=member, path=paths[member])
+        finally:
+            results.close()
+
+
+def find_duplicates(paths, threshold=None, method=None):
+    """
+    Agrupa un conjunto de imágenes casi duplicadas (ver `Deduplicator.clusters`).
+
+    Returns:
+        list: Los grupos de más de una imagen, como listas de rutas; la primera de
+              cada grupo es su representante.
+    """
+    paths = list(paths)
+    groups = Deduplicator(threshold, method).clusters(paths)
+    return [[paths[i] for i in group] for group in groups if len(group) > 1]
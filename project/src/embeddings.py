@@ -0,0 +1,461 @@
+"""
+Almacén en disco de los embeddings de imagen de CLIP.
+
+`ml.classify_batch` calcula el embedding de cada imagen para elegir su etiqueta.
+Con un `EmbeddingStore` esos embeddings se guardan, así que buscar imágenes
+parecidas a otra o volver a etiquetar toda la colección con otras etiquetas no
+vuelve a ejecutar la torre de visión del modelo.
+
+Un almacén es un directorio con tres ficheros:
+
+- `vectors.f16`: la matriz de embeddings normalizados, en float16, una fila por
+  imagen. Se lee como un array de numpy mapeado en memoria (`numpy.memmap`).
+- `ids.tsv`: una línea por fila con el digest del contenido de la imagen y su
+  nombre (p. ej. la ruta del fichero).
+- `meta.json`: la dimensión de los embeddings y el modelo que los calculó.
+
+Sólo se añaden filas al final (`add`); una imagen cuyo digest ya está guardado no
+se vuelve a añadir. Las filas se escriben antes que sus líneas de `ids.tsv`, así
+que un almacén interrumpido a medio añadir se abre con las filas completas.
+
+La búsqueda exacta (`EmbeddingStore.search`) recorre la matriz por bloques con un
+producto de matrices de numpy, sin cargarla entera en float32. Para colecciones
+grandes hay un índice aproximado (`IVFIndex`), que sólo compara la consulta con
+las filas de los grupos más cercanos.
+
+Se administra desde el directorio `project/`:
+
+    python -m src.embeddings DIRECTORIO stats
+    python -m src.embeddings DIRECTORIO search IMAGEN [-k 10]
+    python -m src.embeddings DIRECTORIO relabel "a photo of a cat" "a photo of a dog"
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+settings = {
+    # Default store of src.batch (empty: embeddings are not stored)
+    "directory": os.environ.get("PHOTOLAB_EMBEDDINGS", ""),
+    # Rows from which `search` uses the approximate index by default
+    "approximate_from": int(os.environ.get("PHOTOLAB_EMBEDDINGS_APPROXIMATE_FROM", 50000)),
+    # Groups of the approximate index compared with each query
+    "probes": int(os.environ.get("PHOTOLAB_EMBEDDINGS_PROBES", 16)),
+}
+
+# Rows converted to float32 at a time by the exact search and the re-labelling (small
+# enough for the converted block to stay in cache)
+CHUNK_ROWS = 4096
+
+VECTORS_NAME = "vectors.f16"
+IDS_NAME = "ids.tsv"
+META_NAME = "meta.json"
+
+
+def _top_k(scores, k):
+    """
+    Devuelve, por fila de `scores`, los índices de las `k` columnas mayores, en
+    orden descendente.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(best, order, axis=1)
+
+
+def _as_queries(query):
+    queries = np.asarray(query, dtype=np.float32)
+    return queries[None] if queries.ndim == 1 else queries
+
+
+class IVFIndex:
+    """
+    Índice aproximado de producto interno ("inverted file").
+
+    Agrupa las filas con k-means esférico en `lists` grupos. Una búsqueda compara la
+    consulta con los centroides y sólo con las filas de los `probes` grupos más
+    cercanos, así que revisa una fracción `probes / lists` de la colección. Las filas
+    añadidas después de entrenar se asignan a su centroide más cercano sin
+    reentrenar.
+
+    Args:
+        lists (int, optional): El número de grupos. Por defecto, la raíz cuadrada
+            del número de filas al entrenar.
+        iterations (int, optional): Las iteraciones de k-means.
+        seed (int, optional): La semilla de la inicialización.
+    """
+
+    def __init__(self, lists=None, iterations=10, seed=0):
+        self.lists = lists
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.trained_rows = 0
+        self._assignments = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._assignments)
+
+    def train(self, matrix):
+        """
+        Calcula los centroides a partir de una muestra de `matrix` y asigna todas
+        sus filas.
+
+        Args:
+            matrix (numpy.ndarray): Las filas normalizadas (puede ser un memmap).
+        """
+        rows = len(matrix)
+        lists = max(1, min(rows, self.lists or int(np.sqrt(rows))))
+        rng = np.random.default_rng(self.seed)
+        # Some 64 rows per group are enough to place the centroids
+        sample_size = min(rows, lists * 64)
+        sample = np.asarray(
+            matrix[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32
+        )
+        centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = (sample @ centroids.T).argmax(axis=1)
+            counts = np.bincount(assignments, minlength=lists)
+            present = counts > 0
+            starts = (np.cumsum(counts) - counts)[present]
+            sums = np.zeros_like(centroids)
+            order = np.argsort(assignments, kind="stable")
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Empty groups restart from a random row
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids
+        self.trained_rows = rows
+        self._assignments = np.empty(0, dtype=np.int32)
+        self.extend(matrix)
+
+    def extend(self, matrix):
+        """
+        Asigna a su grupo las filas de `matrix` que el índice aún no tiene.
+        """
+        start = len(self._assignments)
+        parts = [self._assignments]
+        for offset in range(start, len(matrix), CHUNK_ROWS):
+            block = np.asarray(matrix[offset : offset + CHUNK_ROWS], dtype=np.float32)
+            parts.append((block @ self.centroids.T).argmax(axis=1).astype(np.int32))
+        self._assignments = np.concatenate(parts)
+        # Rows grouped by list: those of list i are order[offsets[i]:offsets[i + 1]]
+        self._order = np.argsort(self._assignments, kind="stable")
+        counts = np.bincount(self._assignments, minlength=len(self.centroids))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, matrix, query, k=10, probes=None):
+        """
+        Busca las filas de `matrix` más parecidas a una o varias consultas.
+
+        Args:
+            matrix (numpy.ndarray): Las filas indexadas.
+            query (numpy.ndarray): Una consulta normalizada o una matriz de consultas.
+            k (int, optional): Los resultados por consulta.
+            probes (int, optional): Los grupos revisados por consulta. Por defecto
+                es `settings["probes"]`.
+
+        Returns:
+            tuple: `(filas, puntuaciones)`, dos arrays de forma (consultas, k) en
+                   orden descendente de similitud (con menos de `k` columnas si no
+                   hay tantas filas candidatas).
+        """
+        queries = _as_queries(query)
+        probes = min(probes or settings["probes"], len(self.centroids))
+        nearest = _top_k(queries @ self.centroids.T, probes)
+        rows, scores = [], []
+        for vector, lists in zip(queries, nearest):
+            candidates = np.sort(
+                np.concatenate(
+                    [self._order[self._offsets[i] : self._offsets[i + 1]] for i in lists]
+                )
+            )
+            candidate_scores = np.asarray(matrix[candidates], dtype=np.float32) @ vector
+            best = _top_k(candidate_scores[None], k)[0]
+            rows.append(candidates[best])
+            scores.append(candidate_scores[best])
+        width = min(len(item) for item in rows)
+        return (
+            np.stack([item[:width] for item in rows]),
+            np.stack([item[:width] for item in scores]),
+        )
+
+
+class EmbeddingStore:
+    """
+    Embeddings de imagen guardados en un directorio (ver el docstring del módulo).
+
+    No admite varios procesos escribiendo a la vez.
+
+    Args:
+        directory (str): El directorio del almacén; se crea al añadir la primera fila.
+        model (str, optional): El modelo que calcula los embeddings. Si se indica y
+            el almacén ya existe, debe ser el mismo con el que se creó.
+
+    Raises:
+        ValueError: Si el almacén se creó con otro modelo.
+    """
+
+    def __init__(self, directory, model=None):
+        self.directory = Path(directory)
+        self.model = model
+        self.dim = None
+        self.digests = []
+        self.names = []
+        self._rows = {}
+        self._ids_bytes = 0
+        self._matrix = None
+        self._index = None
+
+        meta_path = self.directory / META_NAME
+        if not meta_path.exists():
+            return
+        with open(meta_path, encoding="utf-8") as reader:
+            meta = json.load(reader)
+        if model is not None and meta.get("model") not in (None, model):
+            raise ValueError(
+                f"El almacén {self.directory} tiene embeddings de {meta['model']}, no de {model}"
+            )
+        self.dim = meta["dim"]
+        self.model = meta.get("model", model)
+        ids_path = self.directory / IDS_NAME
+        if ids_path.exists():
+            with open(ids_path, "rb") as reader:
+                # The last element is empty, or a line cut short by an interrupted run
+                lines = reader.read().split(b"\n")[:-1]
+            vectors_path = self.directory / VECTORS_NAME
+            stored = vectors_path.stat().st_size // self._row_bytes
+            # Only rows with both their vector and their id line are complete
+            for line in lines[:stored]:
+                digest, _, name = line.decode("utf-8").partition("\t")
+                self._rows.setdefault(digest, len(self.digests))
+                self.digests.append(digest)
+                self.names.append(name)
+                self._ids_bytes += len(line) + 1
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __contains__(self, digest):
+        return digest in self._rows
+
+    @property
+    def _row_bytes(self):
+        return self.dim * np.dtype(np.float16).itemsize
+
+    @property
+    def matrix(self):
+        """
+        La matriz de embeddings (float16, mapeada en memoria, de sólo lectura).
+        """
+        if self._matrix is None or len(self._matrix) != len(self):
+            if not len(self):
+                return np.empty((0, self.dim or 0), dtype=np.float16)
+            self._matrix = np.memmap(
+                self.directory / VECTORS_NAME,
+                dtype=np.float16,
+                mode="r",
+                shape=(len(self), self.dim),
+            )
+        return self._matrix
+
+    def add(self, digests, embeddings, names=None):
+        """
+        Añade al final los embeddings de las imágenes que aún no están.
+
+        Args:
+            digests (list): El digest del contenido de cada imagen.
+            embeddings (numpy.ndarray): Sus embeddings normalizados, de forma
+                (len(digests), dimensión).
+            names (list, optional): El nombre de cada imagen. Por defecto, su digest.
+
+        Returns:
+            int: Las filas añadidas.
+
+        Raises:
+            ValueError: Si la dimensión no es la del almacén.
+        """
+        embeddings = np.asarray(embeddings)
+        names = list(names) if names is not None else list(digests)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / META_NAME, "w", encoding="utf-8") as writer:
+                json.dump({"dim": self.dim, "model": self.model}, writer)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(
+                f"Los embeddings tienen dimensión {embeddings.shape[1]}, no {self.dim}"
+            )
+
+        new = []
+        seen = set()
+        for row, digest in enumerate(digests):
+            if digest not in self._rows and digest not in seen:
+                seen.add(digest)
+                new.append(row)
+        if not new:
+            return 0
+
+        vectors_path = self.directory / VECTORS_NAME
+        with open(vectors_path, "ab") as writer:
+            # Drop a partial append left by an interrupted run
+            writer.truncate(len(self) * self._row_bytes)
+            writer.write(np.ascontiguousarray(embeddings[new], dtype=np.float16).tobytes())
+        lines = []
+        for row in new:
+            name = str(names[row]).replace("\t", " ").replace("\n", " ")
+            lines.append(f"{digests[row]}\t{name}\n".encode("utf-8"))
+            self._rows[digests[row]] = len(self.digests)
+            self.digests.append(digests[row])
+            self.names.append(name)
+        with open(self.directory / IDS_NAME, "ab") as writer:
+            writer.truncate(self._ids_bytes)
+            writer.write(b"".join(lines))
+        self._ids_bytes += sum(len(line) for line in lines)
+        return len(new)
+
+    def get(self, digest):
+        """
+        Devuelve el embedding (float32) de una imagen, o None si no está guardado.
+        """
+        row = self._rows.get(digest)
+        return None if row is None else self.matrix[row].astype(np.float32)
+
+    def search(self, query, k=10, approximate=None, probes=None):
+        """
+        Busca las imágenes más parecidas a una consulta (similitud coseno).
+
+        Args:
+            query (numpy.ndarray): Un embedding normalizado, o una matriz de ellos.
+            k (int, optional): Los resultados por consulta. Por defecto es 10.
+            approximate (bool, optional): Si se usa el índice aproximado, que se
+                entrena la primera vez y se vuelve a entrenar cuando el almacén
+                crece al cuádruple. Por defecto, a partir de
+                `settings["approximate_from"]` filas.
+            probes (int, optional): Los grupos revisados por el índice aproximado.
+
+        Returns:
+            list: Para una consulta, pares `(nombre, similitud)` ordenados de más a
+                  menos parecido; para una matriz de consultas, una lista así por
+                  consulta.
+        """
+        queries = _as_queries(query)
+        if approximate is None:
+            approximate = len(self) >= settings["approximate_from"]
+        if not len(self):
+            rows = np.empty((len(queries), 0), dtype=np.int64)
+            scores = np.empty((len(queries), 0), dtype=np.float32)
+        elif approximate:
+            rows, scores = self._approximate_index().search(self.matrix, queries, k, probes)
+        else:
+            rows, scores = self._exact_search(queries, k)
+        results = [
+            [(self.names[row], float(score)) for row, score in zip(query_rows, query_scores)]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+        return results[0] if np.ndim(query) == 1 else results
+
+    def _exact_search(self, queries, k):
+        matrix = self.matrix
+        rows = np.empty((len(queries), 0), dtype=np.int64)
+        scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(matrix), CHUNK_ROWS):
+            block = np.asarray(matrix[start : start + CHUNK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            best = _top_k(block_scores, k)
+            # Merge the best of this block with the best so far
+            rows = np.concatenate([rows, best + start], axis=1)
+            scores = np.concatenate(
+                [scores, np.take_along_axis(block_scores, best, axis=1)], axis=1
+            )
+            keep = _top_k(scores, k)
+            rows = np.take_along_axis(rows, keep, axis=1)
+            scores = np.take_along_axis(scores, keep, axis=1)
+        return rows, scores
+
+    def _approximate_index(self):
+        index = self._index
+        if index is None or len(self) > 4 * index.trained_rows:
+            index = self._index = IVFIndex()
+            index.train(self.matrix)
+        elif len(index) < len(self):
+            index.extend(self.matrix)
+        return index
+
+    def classify(self, text_embeddings, labels):
+        """
+        Etiqueta toda la colección con un conjunto de etiquetas, sin volver a
+        calcular los embeddings de las imágenes (clasificación zero-shot).
+
+        Args:
+            text_embeddings (numpy.ndarray): Los embeddings normalizados de las
+                etiquetas, de forma (len(labels), dimensión) (ver
+                `ml.ClipClassifier.embed_texts`).
+            labels (list): Las etiquetas.
+
+        Returns:
+            list: La etiqueta más parecida a cada fila, en el orden de `names`.
+        """
+        text = np.asarray(text_embeddings, dtype=np.float32)
+        matrix = self.matrix
+        best = [
+            (np.asarray(matrix[start : start + CHUNK_ROWS], dtype=np.float32) @ text.T).argmax(
+                axis=1
+            )
+            for start in range(0, len(matrix), CHUNK_ROWS)
+        ]
+        return [labels[index] for index in np.concatenate(best)] if best else []
+
+
+def main(argv=None):
+    """
+    Punto de entrada de la herramienta.
+
+    Args:
+        argv (list, optional): Los argumentos de la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Consulta un almacén de embeddings de CLIP.")
+    parser.add_argument("directory", help="El directorio del almacén.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Muestra el tamaño del almacén.")
+    search = commands.add_parser("search", help="Busca las imágenes más parecidas a otra.")
+    search.add_argument("image", help="La imagen de la consulta.")
+    search.add_argument("-k", type=int, default=10, help="El número de resultados.")
+    relabel = commands.add_parser(
+        "relabel", help="Etiqueta toda la colección con otras etiquetas."
+    )
+    relabel.add_argument("labels", nargs="+", help="Las etiquetas candidatas.")
+    args = parser.parse_args(argv)
+
+    from . import io_utils, ml
+
+    store = EmbeddingStore(args.directory)
+    if not len(store):
+        parser.error(f"{args.directory} no tiene embeddings")
+    if args.command == "stats":
+        print(f"{len(store)} imágenes, dimensión {store.dim}, modelo {store.model}")
+        return
+    if store.model is not None:
+        ml.settings["model"] = store.model
+    classifier = ml.get_classifier()
+    if args.command == "search":
+        preview = io_utils.load_preview(args.image, ml.PREVIEW_SIZE)
+        if preview is None:
+            parser.error(f"No se pudo leer {args.image}")
+        for name, score in store.search(classifier.embed_images([preview])[0], args.k):
+            print(f"{score:.4f}\t{name}")
+    else:
+        labels = store.classify(classifier.embed_texts(args.labels), args.labels)
+        for name, label in zip(store.names, labels):
+            print(f"{name}\t{label}")
+
+
+if __name__ == "__main__":
+    main()
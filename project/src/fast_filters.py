@@ -0,0 +1,69 @@
+"""
+Implementación rápida de los filtros para `chain` (backend "fast").
+
+Las operaciones tienen la misma forma que las del registro (`src`, `dst`,
+workspace, parámetros), sustituyen a las de los filtros con el mismo nombre y
+escriben en buffers preasignados, pero eligen la aritmética más barata en lugar de
+reproducir bit a bit la de `filters.py`:
+
+- Sobel calcula los gradientes en float32 (no float64), la magnitud con
+  `cv2.magnitude` sobre el propio buffer y la normalización y conversión a uint8 en
+  una sola pasada (`cv2.convertScaleAbs`). Como redondea en lugar de truncar, un
+  píxel puede diferir en 1 nivel de gris del resultado exacto.
+- El cambio de tono aplica una tabla de consulta (`cv2.LUT`) de 256 entradas sobre
+  la imagen HSV, que sólo modifica el canal de tono, sin arrays temporales.
+- Los kernels constantes se construyen una sola vez, ya con el tipo que usa OpenCV.
+
+Canny y el desenfoque Gaussiano ya trabajan en uint8 sin temporales, así que usan la
+misma operación que el backend exacto.
+"""
+import cv2
+import numpy as np
+
+# Maximum difference, in gray levels, from the exact backend (see the module docstring)
+TOLERANCE = 1
+
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+
+_IDENTITY = np.arange(256, dtype=np.uint8)
+
+
+def _hue_table(shift):
+    hue = (np.add(_IDENTITY, shift, dtype=np.uint16) % 180).astype(np.uint8)
+    return cv2.merge([hue, _IDENTITY, _IDENTITY])
+
+
+# One lookup table per hue shift: the hue channel moves, saturation and value stay
+HUE_TABLES = [_hue_table(shift) for shift in range(180)]
+
+
+def sobel(src, dst, ws, ksize=5):
+    gradient_x = ws.buffer("sobel_x32", src.shape, np.float32)
+    gradient_y = ws.buffer("sobel_y32", src.shape, np.float32)
+    cv2.Sobel(src, cv2.CV_32F, 1, 0, dst=gradient_x, ksize=ksize)
+    cv2.Sobel(src, cv2.CV_32F, 0, 1, dst=gradient_y, ksize=ksize)
+    cv2.magnitude(gradient_x, gradient_y, magnitude=gradient_x)
+    peak = cv2.minMaxLoc(gradient_x)[1]
+    if peak == 0:
+        # A flat image has no edges
+        dst.fill(0)
+        return
+    cv2.convertScaleAbs(gradient_x, dst, alpha=255 / peak)
+
+
+def sharpen(src, dst, ws):
+    cv2.filter2D(src, -1, SHARPEN_KERNEL, dst=dst)
+
+
+def random_hue_shift(src, dst, ws):
+    hsv = ws.buffer("hsv", src.shape)
+    cv2.cvtColor(src, cv2.COLOR_BGR2HSV, dst=hsv)
+    cv2.LUT(hsv, HUE_TABLES[np.random.randint(0, 180)], dst=hsv)
+    cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=dst)
+
+
+OPERATIONS = {
+    "Sobel": sobel,
+    "Sharpen": sharpen,
+    "Random Hue Shift": random_hue_shift,
+}
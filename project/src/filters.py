@@ -12,37 +12,40 @@ from .cache import memoize
 
 
 @memoize
-def apply_sobel(image):
+def apply_sobel(image, ksize=5):
     """
     Aplica el filtro Sobel a una imagen para detectar bordes.
 
     Args:
         image (numpy.ndarray): La imagen de entrada.
+        ksize (int, optional): El tamaño del kernel: 1, 3, 5 o 7. Por defecto es 5.
 
     Returns:
         numpy.ndarray: La imagen con el filtro Sobel aplicado.
     """
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=5)
-    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=5)
+    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=ksize)
+    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=ksize)
     sobel = np.hypot(sobelx, sobely)
     sobel = np.uint8(sobel / sobel.max() * 255)
     return cv2.cvtColor(sobel, cv2.COLOR_GRAY2BGR)
 
 
 @memoize
-def apply_canny(image):
+def apply_canny(image, low_threshold=100, high_threshold=200):
     """
     Aplica el detector de bordes Canny a una imagen.
 
     Args:
         image (numpy.ndarray): La imagen de entrada.
+        low_threshold (int, optional): El umbral bajo de la histéresis. Por defecto es 100.
+        high_threshold (int, optional): El umbral alto de la histéresis. Por defecto es 200.
 
     Returns:
         numpy.ndarray: La imagen con el detector de bordes Canny aplicado.
     """
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    canny = cv2.Canny(gray, 100, 200)
+    canny = cv2.Canny(gray, low_threshold, high_threshold)
     return cv2.cvtColor(canny, cv2.COLOR_GRAY2BGR)
 
 
@@ -90,5 +93,6 @@ def apply_random_hue_shift(image):
     """
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     hue_shift = np.random.randint(0, 180)
-    hsv[:, :, 0] = (hsv[:, :, 0] + hue_shift) % 180
+    # Added in uint16: hue + shift can exceed 255 and would wrap around in uint8
+    hsv[:, :, 0] = np.add(hsv[:, :, 0], hue_shift, dtype=np.uint16) % 180
     return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
@@ -21,3 +21,38 @@ def tiles(image, tile_width, tile_height):
     for y in range(0, image.shape[0], tile_height):
         for x in range(0, image.shape[1], tile_width):
             yield image[y : y + tile_height, x : x + tile_width]
+
+
+def tile_windows(height, width, tile_width, tile_height, halo):
+    """
+    Un generador de ventanas de teselas con un borde de solapamiento (halo).
+
+    Recorre la imagen en el mismo orden que `tiles`. Para cada tesela produce la
+    región a leer (la tesela más `halo` píxeles a cada lado, recortada a los límites
+    de la imagen) y la posición de la tesela dentro de esa región. Un filtro de radio
+    menor o igual que `halo` aplicado a la región da, dentro de la tesela, el mismo
+    resultado que aplicado a la imagen completa.
+
+    Args:
+        height (int): La altura de la imagen.
+        width (int): El ancho de la imagen.
+        tile_width (int): El ancho de las teselas.
+        tile_height (int): La altura de las teselas.
+        halo (int): El solapamiento en píxeles.
+
+    Yields:
+        tuple: `(ventana, tesela)`, dos tuplas de `slice` (filas, columnas): la
+               región a leer en coordenadas de la imagen y la tesela en coordenadas
+               de esa región.
+    """
+    for y in range(0, height, tile_height):
+        for x in range(0, width, tile_width):
+            top, left = max(y - halo, 0), max(x - halo, 0)
+            bottom = min(y + tile_height + halo, height)
+            right = min(x + tile_width + halo, width)
+            window = (slice(top, bottom), slice(left, right))
+            core = (
+                slice(y - top, min(y + tile_height, height) - top),
+                slice(x - left, min(x + tile_width, width) - left),
+            )
+            yield window, core
@@ -0,0 +1,370 @@
+"""
+Medición opcional de cada etapa del pipeline, por imagen.
+
+Cuando un lote es lento, esta capa indica en qué se fue el tiempo: cada etapa de
+cada imagen (decodificación, previsualización, filtros, rostros, exportación, espera
+en la cola del pool, transferencia del resultado al padre, clasificación...) queda
+registrada como un `Span` con su tiempo de pared, su tiempo de CPU (del hilo), los
+aciertos y fallos de la caché durante la etapa y los bytes que entran y salen.
+
+Las etapas se marcan en el código con `stage`:
+
+    with instrument.stage("decode") as span:
+        image = io_utils.load_image(path)
+        span.bytes_out = image.nbytes
+
+y sólo se registran dentro de `recording(sink)`, que dirige los spans del hilo
+actual a `sink` (una lista o un `Report`). Fuera de una grabación `stage` devuelve
+un objeto nulo compartido después de comprobar un contador global, así que la
+medición desactivada no cuesta más que una llamada a función.
+
+Los workers del pipeline graban en una lista por imagen que vuelve al padre con el
+resultado (`PipelineResult.spans`); `pipeline.iter_pipeline(report=...)` la
+acumula en un `Report` junto con las etapas que sólo ve el padre. El informe se
+resume por etapa (`Report.summary`) y se exporta como JSON (`Report.to_json`) o
+en el formato de trazas de Chrome (`Report.to_chrome_trace`, para
+`chrome://tracing` o Perfetto).
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+settings = {
+    # Whether src.batch and the app measure stages when not told otherwise
+    "enabled": os.environ.get("PHOTOLAB_INSTRUMENT", "").lower() in ("1", "true", "yes"),
+}
+
+# One stage of one image. `image` is the index of the image in its batch (None for
+# stages that cover several images), `parent` the stage it ran inside (None at the
+# top level), `start` a wall-clock timestamp (seconds since the epoch, comparable
+# across processes) and `wall` and `cpu` are seconds.
+Span = namedtuple(
+    "Span",
+    [
+        "image",
+        "stage",
+        "parent",
+        "start",
+        "wall",
+        "cpu",
+        "cache_hits",
+        "cache_misses",
+        "bytes_in",
+        "bytes_out",
+        "pid",
+        "thread",
+    ],
+)
+
+# Active recordings in this process, over all threads
+_active = 0
+_active_lock = threading.Lock()
+_state = threading.local()
+
+
+class _NullStage:
+    """
+    La etapa que se devuelve cuando no se está grabando: no mide nada.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """
+    Una etapa en curso. `bytes_in`, `bytes_out` e `image` pueden fijarse dentro del
+    bloque `with`.
+    """
+
+    def __init__(self, sink, name, image, bytes_in):
+        self.sink = sink
+        self.name = name
+        self.image = image
+        self.bytes_in = bytes_in
+        self.bytes_out = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __enter__(self):
+        self._parent = getattr(_state, "stage", None)
+        _state.stage = self
+        self._start = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        _state.stage = self._parent
+        self.sink.append(
+            Span(
+                self.image,
+                self.name,
+                self._parent.name if self._parent is not None else None,
+                self._start,
+                wall,
+                cpu,
+                self.cache_hits,
+                self.cache_misses,
+                self.bytes_in,
+                self.bytes_out,
+                os.getpid(),
+                threading.get_ident(),
+            )
+        )
+        return False
+
+
+class recording:
+    """
+    Graba en `sink` las etapas que se ejecuten en este hilo dentro del bloque.
+
+    Args:
+        sink: Dónde se añaden los `Span` (cualquier objeto con `append`, como una
+            lista o un `Report`).
+        image (int, optional): El índice de imagen de las etapas que no indiquen
+            otro.
+    """
+
+    def __init__(self, sink, image=None):
+        self.sink = sink
+        self.image = image
+
+    def __enter__(self):
+        global _active
+        self._previous = (getattr(_state, "sink", None), getattr(_state, "image", None))
+        _state.sink, _state.image = self.sink, self.image
+        with _active_lock:
+            _active += 1
+        return self.sink
+
+    def __exit__(self, *exc_info):
+        global _active
+        _state.sink, _state.image = self._previous
+        with _active_lock:
+            _active -= 1
+        return False
+
+
+def stage(name, image=None, bytes_in=None):
+    """
+    Mide una etapa si el hilo actual está grabando (ver `recording`).
+
+    Args:
+        name (str): El nombre de la etapa.
+        image (int, optional): El índice de la imagen. Por defecto, el de la grabación.
+        bytes_in (int, optional): Los bytes que entran en la etapa.
+
+    Returns:
+        Un gestor de contexto; dentro del bloque pueden fijarse `bytes_out` y
+        `bytes_in`. Si no se está grabando, un objeto nulo que no mide nada.
+    """
+    if not _active:
+        return _NULL_STAGE
+    sink = getattr(_state, "sink", None)
+    if sink is None:
+        return _NULL_STAGE
+    return _Stage(sink, name, _state.image if image is None else image, bytes_in)
+
+
+def is_recording():
+    """
+    Indica si el hilo actual está grabando etapas.
+    """
+    return bool(_active) and getattr(_state, "sink", None) is not None
+
+
+def cache_event(hit):
+    """
+    Apunta un acierto o un fallo de la caché en la etapa en curso y en las etapas
+    que la contienen.
+    """
+    if not _active:
+        return
+    current = getattr(_state, "stage", None)
+    while current is not None:
+        if hit:
+            current.cache_hits += 1
+        else:
+            current.cache_misses += 1
+        current = current._parent
+
+
+def span(image, stage, start, wall, cpu=None, bytes_in=None, bytes_out=None):
+    """
+    Construye un `Span` para una etapa medida fuera de `stage` (p. ej. la espera en
+    la cola del pool, que empieza en un proceso y termina en otro).
+    """
+    return Span(
+        image, stage, None, start, wall, cpu, 0, 0, bytes_in, bytes_out, os.getpid(), None
+    )
+
+
+class Report:
+    """
+    Los spans de una ejecución, acumulados en el proceso padre.
+
+    Es seguro añadir spans desde varios hilos.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.spans)
+
+    def append(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def extend(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def summary(self):
+        """
+        Resume los spans por etapa, en el orden en que aparecen por primera vez.
+
+        Returns:
+            list: Un diccionario por etapa con `stage`, `parent`, `count`, `total_ms`,
+                  `mean_ms`, `max_ms`, `cpu_ms`, `cache_hits`, `cache_misses`,
+                  `bytes_in`, `bytes_out` y `share`: la fracción del tiempo de
+                  pared de las etapas de primer nivel (las etapas anidadas, como
+                  `cache_lookup` dentro de `filters`, son parte de la de su padre).
+        """
+        with self._lock:
+            spans = list(self.spans)
+        stages = {}
+        total = 0.0
+        for item in spans:
+            if item.parent is None:
+                total += item.wall * 1000
+            row = stages.setdefault(
+                item.stage,
+                {
+                    "stage": item.stage,
+                    "parent": item.parent,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "cpu_ms": 0.0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                },
+            )
+            row["count"] += 1
+            row["total_ms"] += item.wall * 1000
+            row["max_ms"] = max(row["max_ms"], item.wall * 1000)
+            row["cpu_ms"] += (item.cpu or 0) * 1000
+            row["cache_hits"] += item.cache_hits
+            row["cache_misses"] += item.cache_misses
+            row["bytes_in"] += item.bytes_in or 0
+            row["bytes_out"] += item.bytes_out or 0
+        for row in stages.values():
+            row["mean_ms"] = row["total_ms"] / row["count"]
+            row["share"] = row["total_ms"] / total if total else 0.0
+        return list(stages.values())
+
+    def format(self):
+        """
+        Devuelve el resumen por etapa como una tabla de texto.
+        """
+        header = (
+            f"{'etapa':<16}{'n':>7}{'total ms':>12}{'media ms':>11}{'máx ms':>10}"
+            f"{'CPU ms':>12}{'caché':>11}{'MiB in':>9}{'MiB out':>9}{'%':>7}"
+        )
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            stage = row["stage"] if row["parent"] is None else f"  {row['stage']}"
+            lines.append(
+                f"{stage:<16}{row['count']:>7}{row['total_ms']:>12.1f}{row['mean_ms']:>11.2f}"
+                f"{row['max_ms']:>10.1f}{row['cpu_ms']:>12.1f}"
+                f"{row['cache_hits']:>5}/{row['cache_misses']:<5}"
+                f"{row['bytes_in'] / 2**20:>9.1f}{row['bytes_out'] / 2**20:>9.1f}"
+                f"{row['share']:>7.1%}"
+            )
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """
+        Devuelve el resumen y los spans como estructuras serializables en JSON.
+        """
+        with self._lock:
+            spans = [item._asdict() for item in self.spans]
+        return {"summary": self.summary(), "spans": spans}
+
+    def to_json(self, path=None):
+        """
+        Exporta el informe como JSON.
+
+        Args:
+            path (str, optional): El fichero de destino. Sin ruta, devuelve el texto.
+
+        Returns:
+            str: El JSON, si no se indicó una ruta.
+        """
+        return _dump(self.to_dict(), path)
+
+    def to_chrome_trace(self, path=None):
+        """
+        Exporta los spans en el formato de trazas de Chrome ("Trace Event Format").
+
+        Cada proceso aparece como una fila y cada etapa como un evento completo
+        (`"ph": "X"`) con la imagen, la caché y los bytes en sus argumentos. Las
+        etapas sin hilo (las que cruzan procesos) van en una fila propia.
+
+        Args:
+            path (str, optional): El fichero de destino. Sin ruta, devuelve el texto.
+
+        Returns:
+            str: El JSON, si no se indicó una ruta.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for item in spans:
+            events.append(
+                {
+                    "name": item.stage,
+                    "cat": "pipeline",
+                    "ph": "X",
+                    "ts": item.start * 1e6,
+                    "dur": item.wall * 1e6,
+                    "pid": item.pid,
+                    "tid": item.thread if item.thread is not None else 0,
+                    "args": {
+                        "image": item.image,
+                        "cpu_ms": None if item.cpu is None else item.cpu * 1000,
+                        "cache_hits": item.cache_hits,
+                        "cache_misses": item.cache_misses,
+                        "bytes_in": item.bytes_in,
+                        "bytes_out": item.bytes_out,
+                    },
+                }
+            )
+        return _dump({"traceEvents": events, "displayTimeUnit": "ms"}, path)
+
+
+def _dump(data, path):
+    if path is None:
+        return json.dumps(data)
+    with open(path, "w", encoding="utf-8") as writer:
+        json.dump(data, writer)
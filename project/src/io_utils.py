@@ -4,36 +4,268 @@ Funciones de E/S y utilidades para el procesamiento de imágenes.
 Este módulo proporciona un conjunto de funciones de utilidad para manejar archivos de imagen,
 incluyendo la carga, guardado y hashing de imágenes, así como la conversión
 entre diferentes formatos de imagen.
+
+La lectura admite decodificación a resolución reducida (`load_image(..., reduce=4)`,
+`load_preview`), que para JPEG es varias veces más rápida que decodificar completo
+y reducir después. La escritura puede hacerse en segundo plano con `ImageWriter`:
+un pool de hilos con una cola acotada y un único punto de espera (`flush`). Los
+parámetros de codificación PNG, JPEG y WebP se toman de `settings`.
 """
 import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 import cv2
 import numpy as np
 from PIL import Image
 
+# Decode flags by reduction factor (libjpeg scales while decoding)
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+settings = {
+    # Encode parameters; None keeps OpenCV's default for the format
+    "png_compression": _optional_int("PHOTOLAB_PNG_COMPRESSION"),
+    "jpeg_quality": _optional_int("PHOTOLAB_JPEG_QUALITY"),
+    "webp_quality": _optional_int("PHOTOLAB_WEBP_QUALITY"),
+    # Background writer: threads and images waiting to be written
+    "writers": _optional_int("PHOTOLAB_WRITERS") or os.cpu_count(),
+    "write_queue": _optional_int("PHOTOLAB_WRITE_QUEUE") or 32,
+}
+
 
-def load_image(image_path):
+def load_image(image_path, reduce=1):
     """
     Carga una imagen desde una ruta de archivo.
 
     Args:
         image_path (str): La ruta al archivo de imagen.
+        reduce (int, optional): Decodifica a 1/2, 1/4 o 1/8 de la resolución
+            (`cv2.IMREAD_REDUCED_COLOR_*`). Por defecto es 1 (resolución completa).
 
     Returns:
         numpy.ndarray: La imagen cargada.
+
+    Raises:
+        ValueError: Si el factor de reducción no es 1, 2, 4 u 8.
+    """
+    if reduce not in REDUCED_FLAGS:
+        raise ValueError(f"reduce debe ser 1, 2, 4 u 8, no {reduce}")
+    return cv2.imread(str(image_path), REDUCED_FLAGS[reduce])
+
+
+def load_preview(image_path, min_side):
+    """
+    Carga una imagen a la menor resolución cuyo lado corto sea al menos `min_side`.
+
+    Sólo se lee la cabecera para conocer el tamaño y después se decodifica
+    directamente a resolución reducida; útil para miniaturas y para la entrada del
+    clasificador, que reduce las imágenes a 224 píxeles.
+
+    Args:
+        image_path (str): La ruta al archivo de imagen.
+        min_side (int): El lado corto mínimo de la imagen devuelta.
+
+    Returns:
+        numpy.ndarray: La imagen cargada, o None si no se pudo leer.
+    """
+    try:
+        with Image.open(image_path) as header:
+            width, height = header.size
+    except OSError:
+        # A format Pillow cannot parse; OpenCV may still decode it
+        return load_image(image_path)
+    reduce = 1
+    while reduce < 8 and min(width, height) // (reduce * 2) >= min_side:
+        reduce *= 2
+    return load_image(image_path, reduce)
+
+
+def decode_image(data):
+    """
+    Decodifica una imagen a partir de los bytes de su fichero (p. ej. una subida).
+
+    Args:
+        data (bytes): El contenido del fichero, en cualquier formato que lea OpenCV.
+
+    Returns:
+        numpy.ndarray: La imagen BGR, o None si no se pudo decodificar.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def encode_image(image, extension):
+    """
+    Codifica una imagen en memoria, con los mismos parámetros que `save_image`.
+
+    Args:
+        image (numpy.ndarray): La imagen a codificar.
+        extension (str): El formato, como extensión de fichero: ".png", ".jpg"...
+
+    Returns:
+        bytes: El contenido del fichero codificado.
+
+    Raises:
+        ValueError: Si OpenCV no sabe codificar ese formato.
     """
-    return cv2.imread(str(image_path))
+    if not extension.startswith("."):
+        extension = "." + extension
+    try:
+        ok, buffer = cv2.imencode(extension, image, encode_params(extension))
+    except cv2.error:
+        ok = False
+    if not ok:
+        raise ValueError(f"Formato de imagen no soportado: {extension}")
+    return buffer.tobytes()
 
 
-def save_image(image, save_path):
+def encode_params(save_path):
+    """
+    Devuelve los parámetros de `cv2.imwrite` para el formato de una ruta.
+
+    Args:
+        save_path (str): La ruta de destino; su extensión decide el formato.
+
+    Returns:
+        list: Los parámetros configurados en `settings` para ese formato.
+    """
+    extension = os.path.splitext(str(save_path))[1].lower()
+    option = {
+        ".png": (cv2.IMWRITE_PNG_COMPRESSION, "png_compression"),
+        ".jpg": (cv2.IMWRITE_JPEG_QUALITY, "jpeg_quality"),
+        ".jpeg": (cv2.IMWRITE_JPEG_QUALITY, "jpeg_quality"),
+        ".webp": (cv2.IMWRITE_WEBP_QUALITY, "webp_quality"),
+    }.get(extension)
+    if option is None or settings[option[1]] is None:
+        return []
+    return [option[0], settings[option[1]]]
+
+
+def save_image(image, save_path, params=None):
     """
     Guarda una imagen en una ruta de archivo.
 
     Args:
         image (numpy.ndarray): La imagen a guardar.
         save_path (str): La ruta donde guardar la imagen.
+        params (list, optional): Los parámetros de codificación de `cv2.imwrite`.
+            Por defecto son los de `encode_params`.
+
+    Returns:
+        bool: True si la imagen se pudo escribir.
+    """
+    if params is None:
+        params = encode_params(save_path)
+    return cv2.imwrite(str(save_path), image, params)
+
+
+class ImageWriter:
+    """
+    Escritor de imágenes en segundo plano.
+
+    Las imágenes se codifican y escriben desde un pool de hilos (`cv2.imwrite`
+    libera el GIL). Como mucho `max_pending` imágenes esperan a ser escritas:
+    `write` bloquea cuando la cola está llena, de modo que la memoria queda acotada
+    aunque el productor sea más rápido que el disco. `flush` es el único punto de
+    espera: devuelve cuando todo lo enviado está en disco.
+
+    Args:
+        max_workers (int, optional): Los hilos de escritura. Por defecto es
+            `settings["writers"]`.
+        max_pending (int, optional): Las imágenes en cola o escribiéndose. Por
+            defecto es `settings["write_queue"]`.
     """
-    cv2.imwrite(str(save_path), image)
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or settings["writers"])
+        self._slots = threading.BoundedSemaphore(max_pending or settings["write_queue"])
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, image, save_path, params=None):
+        """
+        Encola una imagen para escribirla, creando su directorio si hace falta.
+
+        Args:
+            image (numpy.ndarray): La imagen a guardar. No debe modificarse hasta
+                que se haya escrito.
+            save_path (str): La ruta de destino.
+            params (list, optional): Los parámetros de codificación.
+
+        Returns:
+            concurrent.futures.Future: Se completa cuando la imagen está en disco y
+            falla con `OSError` si no se pudo escribir.
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_write, image, Path(save_path), params)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._failures.append(future.exception())
+        self._slots.release()
+
+    def flush(self):
+        """
+        Espera a que se escriban todas las imágenes enviadas.
+
+        Returns:
+            list: Los errores de las escrituras fallidas desde el último `flush`.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+        with self._lock:
+            failures, self._failures = self._failures, []
+        return failures
+
+    def close(self):
+        """
+        Espera a las escrituras pendientes y detiene los hilos.
+
+        Returns:
+            list: Los errores de las escrituras fallidas desde el último `flush`.
+        """
+        failures = self.flush()
+        self._executor.shutdown()
+        return failures
+
+
+def _write(image, save_path, params):
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    if not save_image(image, save_path, params):
+        raise OSError(f"No se pudo escribir {save_path}")
+    return save_path
 
 
 def get_image_hash(image):
@@ -49,6 +281,62 @@ def get_image_hash(image):
     return hashlib.sha256(image.tobytes()).hexdigest()
 
 
+def get_image_digest(image):
+    """
+    Calcula un digest rápido del contenido de una imagen.
+
+    A diferencia de `get_image_hash`, no copia el buffer de píxeles (se hashea la
+    memoria del array directamente) y usa BLAKE2b, que es bastante más rápido que
+    SHA256. La forma y el dtype forman parte del digest, de modo que dos arrays con
+    los mismos bytes pero distinta geometría no colisionan.
+
+    Args:
+        image (numpy.ndarray): La imagen de entrada.
+
+    Returns:
+        str: El digest hexadecimal (32 caracteres) de la imagen.
+    """
+    buffer = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{buffer.shape}{buffer.dtype.str}".encode())
+    digest.update(buffer.data)
+    return digest.hexdigest()
+
+
+def make_thumbnail(image, max_size=400):
+    """
+    Reduce una imagen para mostrarla en miniatura, conservando su proporción.
+
+    Args:
+        image (numpy.ndarray): La imagen de entrada.
+        max_size (int, optional): El tamaño máximo del lado más largo. Por defecto es 400.
+
+    Returns:
+        numpy.ndarray: La miniatura (la imagen original si ya es pequeña).
+    """
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def make_preview(image, min_side):
+    """
+    Reduce una imagen hasta que su lado corto mida `min_side`, conservando su proporción.
+
+    Args:
+        image (numpy.ndarray): La imagen de entrada.
+        min_side (int): El lado corto de la imagen reducida.
+
+    Returns:
+        numpy.ndarray: La imagen reducida (la imagen original si ya es pequeña).
+    """
+    height, width = image.shape[:2]
+    return make_thumbnail(image, round(max(height, width) * min_side / min(height, width)))
+
+
 def pil_to_cv2(pil_image):
     """
     Convierte una imagen PIL a una imagen de OpenCV.
@@ -4,13 +4,50 @@ Modelos de aprendizaje automático para la clasificación de imágenes.
 Este módulo proporciona funciones para clasificar imágenes utilizando modelos de
 aprendizaje automático pre-entrenados. Actualmente utiliza el modelo CLIP de OpenAI
 para clasificar imágenes basándose en un conjunto de etiquetas de texto personalizadas.
+
+`ClipClassifier` separa las dos torres de CLIP: los embeddings de texto de las
+etiquetas se calculan una sola vez (y al cambiar de etiquetas), y las imágenes pasan
+por la torre de visión en micro-lotes de tamaño acotado, en modo inferencia. Los
+embeddings de imagen se guardan en memoria por el hash de la imagen, de modo que
+volver a clasificar las mismas imágenes no ejecuta el modelo.
+
+La torre de visión, que es casi todo el costo de clasificar, puede ejecutarse con
+varios backends de inferencia en CPU (`settings["backend"]`, ver `image_encoder`):
+
+- "eager": el modelo de PyTorch en float32, tal cual.
+- "int8": cuantización dinámica a int8 de las capas lineales (pesos en int8,
+  activaciones cuantizadas al vuelo). Es el más rápido en CPU; los embeddings
+  difieren muy poco de los de float32 y la etiqueta elegida casi nunca cambia.
+- "torchscript": el grafo trazado y congelado con `torch.jit`, en float32.
+- "onnx": el grafo exportado a ONNX y ejecutado con ONNX Runtime (dependencia
+  opcional: `onnxruntime` y `onnxscript`).
+
+Los embeddings de texto de las etiquetas se calculan siempre en float32: sólo se
+calculan una vez. Los hilos de PyTorch (`set_threads`) se pueden limitar para que la
+clasificación comparta los núcleos con el pool de workers de los filtros.
+
+Importar este módulo es barato: `torch`, `transformers` y los pesos del modelo se
+cargan la primera vez que se clasifica una imagen, o antes con `warmup()`.
 """
+import os
+import tempfile
+import threading
+import warnings
+
+import numpy as np
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
 
-# Load the pre-trained CLIP model
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+from .cache import MemoryTier
+from .io_utils import get_image_digest
+
+DEFAULT_MODEL = "openai/clip-vit-base-patch32"
+
+# Short side of the previews sent to the classifier; the processor resizes every
+# image to 224 pixels, so a preview this size classifies like the full image
+PREVIEW_SIZE = 224
+
+# Inference backends of the vision tower (see `image_encoder`)
+BACKENDS = ("eager", "int8", "torchscript", "onnx")
 
 # Define the custom labels
 LABELS = [
@@ -20,36 +57,416 @@ LABELS = [
     "other",
 ]
 
+settings = {
+    "model": os.environ.get("PHOTOLAB_CLIP_MODEL", DEFAULT_MODEL),
+    # Images sent through the vision tower in each forward pass
+    "batch_size": int(os.environ.get("PHOTOLAB_CLIP_BATCH_SIZE", 16)),
+    # Memory used by the image embedding cache of each classifier
+    "embedding_cache_size": int(os.environ.get("PHOTOLAB_CLIP_CACHE_SIZE", 32 * 2**20)),
+    "backend": os.environ.get("PHOTOLAB_CLIP_BACKEND", "eager"),
+    # Threads used inside each operator and to run independent operators in
+    # parallel (0: PyTorch's default, one per core)
+    "threads": int(os.environ.get("PHOTOLAB_CLIP_THREADS", 0)),
+    "interop_threads": int(os.environ.get("PHOTOLAB_CLIP_INTEROP_THREADS", 0)),
+}
+
+
+def _features(output):
+    # get_*_features returns a tensor in transformers 4 and a model output in 5
+    return getattr(output, "pooler_output", output)
+
 
-def classify_batch(images):
+def _normalize(embeddings):
+    return embeddings / embeddings.norm(p=2, dim=-1, keepdim=True)
+
+
+def set_threads(threads=None, interop_threads=None):
     """
-    Clasifica un lote de imágenes utilizando el modelo CLIP.
+    Fija los hilos que usa PyTorch en este proceso.
 
     Args:
-        images (list): Una lista de imágenes como arrays de numpy.
+        threads (int, optional): Los hilos de cada operación. Por defecto es
+            `settings["threads"]`; con 0 no se cambia.
+        interop_threads (int, optional): Los hilos para ejecutar operaciones
+            independientes en paralelo. Por defecto es `settings["interop_threads"]`;
+            con 0 no se cambia. PyTorch sólo permite fijarlo antes de ejecutar la
+            primera operación en paralelo; si ya es tarde, se avisa y se mantiene.
+    """
+    import torch
+
+    threads = settings["threads"] if threads is None else threads
+    if interop_threads is None:
+        interop_threads = settings["interop_threads"]
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads and interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_interop_threads(interop_threads)
+        except RuntimeError as error:
+            warnings.warn(f"No se pudieron fijar los hilos entre operaciones: {error}")
+
+
+def _vision_tower(model):
+    """
+    Devuelve la torre de visión de `model` como un módulo de PyTorch que recibe los
+    píxeles y devuelve los embeddings normalizados (lo que trazan y cuantizan los
+    backends).
+    """
+    import torch
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.vision_model = model.vision_model
+            self.visual_projection = model.visual_projection
+
+        def forward(self, pixel_values):
+            pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+            return _normalize(self.visual_projection(pooled))
+
+    return VisionTower().eval()
+
+
+def _example_input(model):
+    import torch
+
+    size = model.config.vision_config.image_size
+    return torch.zeros(1, model.config.vision_config.num_channels, size, size)
+
+
+def image_encoder(model, backend=None):
+    """
+    Prepara la torre de visión de un modelo CLIP para un backend de inferencia.
+
+    Args:
+        model (transformers.CLIPModel): El modelo; no se modifica.
+        backend (str, optional): Uno de `BACKENDS`. Por defecto es
+            `settings["backend"]`.
 
     Returns:
-        list: Una lista de listas, donde cada lista interna contiene la etiqueta
-              de clasificación superior para la imagen correspondiente.
+        function: Una función que recibe los píxeles preprocesados (un tensor de
+                  forma (n, canales, alto, ancho)) y devuelve los embeddings
+                  normalizados como un array `float32` de forma (n, dimensión).
+
+    Raises:
+        ValueError: Si el backend no existe.
+        ImportError: Si el backend "onnx" no tiene sus dependencias instaladas.
+    """
+    import torch
+
+    backend = backend or settings["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de CLIP desconocido: {backend}")
+
+    if backend == "eager":
+
+        def encode(pixel_values):
+            with torch.inference_mode():
+                features = model.get_image_features(pixel_values=pixel_values)
+                return _normalize(_features(features)).numpy()
+
+        return encode
+
+    tower = _vision_tower(model)
+    if backend == "int8":
+        with warnings.catch_warnings():
+            # torch.ao.quantization is deprecated in favour of torchao, which is not a
+            # dependency; the eager dynamic quantization still works. Only its own
+            # deprecation notices are silenced
+            warnings.filterwarnings(
+                "ignore", r"torch\.ao\.quantization is deprecated", DeprecationWarning
+            )
+            warnings.filterwarnings(
+                "ignore", r"torch\.quantize_per_tensor, .* are deprecated", UserWarning
+            )
+            tower = torch.ao.quantization.quantize_dynamic(
+                tower, {torch.nn.Linear}, dtype=torch.qint8
+            )
+    elif backend == "torchscript":
+        with torch.no_grad(), warnings.catch_warnings():
+            # Tracing warns about the shape checks it bakes in, and torch.jit about
+            # its own deprecation; neither changes the traced graph
+            warnings.simplefilter("ignore")
+            tower = torch.jit.freeze(torch.jit.trace(tower, _example_input(model)))
+    else:
+        return _onnx_encoder(tower, _example_input(model))
+
+    def encode(pixel_values):
+        with torch.inference_mode():
+            return tower(pixel_values).numpy()
+
+    return encode
+
+
+def _onnx_encoder(tower, example):
+    import torch
+
+    try:
+        import onnxruntime
+    except ImportError as error:
+        raise ImportError(
+            "El backend 'onnx' necesita ONNX Runtime: pip install onnxruntime onnxscript"
+        ) from error
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if settings["threads"]:
+        options.intra_op_num_threads = settings["threads"]
+    if settings["interop_threads"]:
+        options.inter_op_num_threads = settings["interop_threads"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "vision.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                tower,
+                (example,),
+                path,
+                input_names=["pixel_values"],
+                output_names=["embeddings"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+            )
+        # The session reads the graph (and its external weights) while it is built
+        session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(pixel_values):
+        return session.run(None, {"pixel_values": pixel_values.numpy()})[0]
+
+    return encode
+
+
+class ClipClassifier:
     """
+    Clasificador de imágenes por similitud con etiquetas de texto (zero-shot).
+
+    Args:
+        model (transformers.CLIPModel): El modelo CLIP.
+        processor (transformers.CLIPProcessor): El preprocesador del modelo.
+        labels (list, optional): Las etiquetas candidatas. Por defecto es `LABELS`.
+        batch_size (int, optional): Las imágenes por pasada de la torre de visión.
+        cache_size (int, optional): Los bytes de la caché de embeddings de imagen;
+            con 0 la caché queda desactivada.
+        backend (str, optional): El backend de la torre de visión (ver
+            `image_encoder`). Por defecto es `settings["backend"]`.
+    """
+
+    def __init__(
+        self, model, processor, labels=LABELS, batch_size=None, cache_size=None, backend=None
+    ):
+        self.model = model.eval()
+        self.processor = processor
+        self.backend = backend or settings["backend"]
+        self._encode = image_encoder(self.model, self.backend)
+        self.batch_size = max(1, batch_size or settings["batch_size"])
+        if cache_size is None:
+            cache_size = settings["embedding_cache_size"]
+        self.embeddings = MemoryTier(cache_size)
+        self.set_labels(labels)
+
+    def set_labels(self, labels):
+        """
+        Cambia las etiquetas candidatas sin recargar el modelo.
+
+        Los embeddings de imagen ya calculados siguen siendo válidos.
+
+        Args:
+            labels (list): Las nuevas etiquetas.
+        """
+        import torch
+
+        labels = list(labels)
+        self.text_embeddings = torch.from_numpy(self.embed_texts(labels))
+        self.labels = labels
 
-    # Preprocess the images and labels
-    inputs = processor(
-        text=LABELS,
-        images=[Image.fromarray(image) for image in images],
-        return_tensors="pt",
-        padding=True,
-    )
+    def embed_texts(self, labels):
+        """
+        Devuelve los embeddings normalizados de un conjunto de textos.
 
-    # Make predictions
-    outputs = model(**inputs)
-    logits_per_image = outputs.logits_per_image
+        Args:
+            labels (list): Los textos, p. ej. etiquetas candidatas.
 
-    # Get the top prediction for each image
-    probs = logits_per_image.softmax(dim=1)
-    top_predictions = probs.argmax(dim=1)
+        Returns:
+            numpy.ndarray: Un array `float32` de forma (len(labels), dimensión).
 
-    # Decode the predictions
-    results = [[LABELS[prediction.item()]] for prediction in top_predictions]
+        Raises:
+            ValueError: Si no hay ningún texto.
+        """
+        import torch
 
-    return results
+        labels = list(labels)
+        if not labels:
+            raise ValueError("Se necesita al menos una etiqueta")
+        inputs = self.processor(text=labels, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            text = _features(
+                self.model.get_text_features(
+                    input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]
+                )
+            )
+            return _normalize(text).numpy()
+
+    def embed_images(self, images):
+        """
+        Devuelve los embeddings normalizados de un conjunto de imágenes.
+
+        Las imágenes que no están en la caché se procesan en micro-lotes de
+        `batch_size`.
+
+        Args:
+            images (list): Una lista de imágenes como arrays de numpy.
+
+        Returns:
+            numpy.ndarray: Un array `float32` de forma (len(images), dimensión).
+        """
+        digests = [get_image_digest(image) for image in images]
+        found = {}
+        missing = {}
+        for digest, image in zip(digests, images):
+            if digest in found or digest in missing:
+                # Identical images in the same call only go through the model once
+                continue
+            embedding = self.embeddings.get(digest)
+            if embedding is None:
+                missing[digest] = image
+            else:
+                found[digest] = embedding
+
+        missing = list(missing.items())
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start : start + self.batch_size]
+            inputs = self.processor(
+                images=[Image.fromarray(image) for _, image in batch], return_tensors="pt"
+            )
+            features = self._encode(inputs["pixel_values"])
+            for (digest, _), row in zip(batch, features):
+                row = row.copy()
+                row.setflags(write=False)
+                self.embeddings.put(digest, row)
+                found[digest] = row
+
+        if not digests:
+            return np.empty((0, self.text_embeddings.shape[1]), dtype=np.float32)
+        return np.stack([found[digest] for digest in digests])
+
+    def predict(self, images):
+        """
+        Devuelve la probabilidad de cada etiqueta para cada imagen.
+
+        Args:
+            images (list): Una lista de imágenes como arrays de numpy.
+
+        Returns:
+            numpy.ndarray: Un array de forma (len(images), len(labels)).
+        """
+        return self.predict_embeddings(self.embed_images(images))
+
+    def predict_embeddings(self, embeddings):
+        """
+        Devuelve la probabilidad de cada etiqueta para embeddings de imagen ya
+        calculados (ver `embed_images`).
+        """
+        import torch
+
+        image_embeddings = torch.from_numpy(np.asarray(embeddings, dtype=np.float32))
+        with torch.inference_mode():
+            logits = self.model.logit_scale.exp() * image_embeddings @ self.text_embeddings.T
+            return logits.softmax(dim=1).numpy()
+
+    def classify(self, images):
+        """
+        Devuelve la etiqueta más probable para cada imagen.
+
+        Args:
+            images (list): Una lista de imágenes como arrays de numpy.
+
+        Returns:
+            list: Una etiqueta por imagen.
+        """
+        return [self.labels[index] for index in self.predict(images).argmax(axis=1)]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def load_model(name=None):
+    """
+    Carga un modelo CLIP pre-entrenado y su preprocesador.
+
+    Args:
+        name (str, optional): El nombre o la ruta del modelo. Por defecto es
+            `settings["model"]`.
+
+    Returns:
+        tuple: `(modelo, preprocesador)`.
+    """
+    from transformers import CLIPModel, CLIPProcessor
+
+    name = name or settings["model"]
+    return CLIPModel.from_pretrained(name), CLIPProcessor.from_pretrained(name)
+
+
+def get_classifier():
+    """
+    Devuelve el clasificador compartido del proceso, cargando el modelo la primera vez.
+
+    Returns:
+        ClipClassifier: El clasificador con las etiquetas `LABELS`.
+    """
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            set_threads()
+            _classifier = ClipClassifier(*load_model())
+        return _classifier
+
+
+def is_loaded():
+    """
+    Indica si el modelo compartido ya está cargado.
+    """
+    return _classifier is not None
+
+
+def warmup():
+    """
+    Carga el modelo compartido por adelantado, para que la primera clasificación no
+    pague el arranque.
+    """
+    get_classifier()
+
+
+def category(label):
+    """
+    Convierte una etiqueta en el nombre corto usado para las carpetas de salida.
+
+    Args:
+        label (str): La etiqueta, p. ej. "a photo of a person".
+
+    Returns:
+        str: El nombre corto, p. ej. "person".
+    """
+    return label.replace("a photo of a ", "").replace("an ", "").replace("a ", "")
+
+
+def classify_batch(images, store=None, names=None):
+    """
+    Clasifica un lote de imágenes utilizando el modelo CLIP.
+
+    Args:
+        images (list): Una lista de imágenes como arrays de numpy.
+        store (embeddings.EmbeddingStore, optional): Dónde guardar los embeddings
+            de las imágenes, para buscarlas o volver a etiquetarlas sin el modelo.
+        names (list, optional): El nombre de cada imagen en el almacén.
+
+    Returns:
+        list: Una lista de listas, donde cada lista interna contiene la etiqueta
+              de clasificación superior para la imagen correspondiente.
+    """
+    classifier = get_classifier()
+    embeddings = classifier.embed_images(images)
+    if store is not None:
+        store.add([get_image_digest(image) for image in images], embeddings, names)
+    best = classifier.predict_embeddings(embeddings).argmax(axis=1)
+    return [[classifier.labels[index]] for index in best]
@@ -4,10 +4,50 @@ Orquesta el pipeline de procesamiento de imágenes.
 Este módulo es responsable de gestionar el procesamiento por lotes de imágenes en paralelo.
 Toma una lista de rutas de imágenes y un conjunto de parámetros de procesamiento, aplica los
 filtros y transformaciones seleccionados y devuelve las imágenes procesadas.
+
+`iter_pipeline` entrega los resultados a medida que terminan, con un número acotado de
+imágenes en vuelo, de modo que la memoria del proceso padre no crece con el tamaño del
+lote. `run_pipeline` conserva la interfaz original y devuelve una lista. Ambos usan el
+pool persistente de `workers`, que se reutiliza entre lotes.
+
+Este módulo no importa `ml`: los workers sólo cargan el código de filtros y detección.
+
+Las imágenes procesadas pueden volver al padre copiadas por la tubería del pool (el
+modo por defecto) o, con `transport="shm"` o `"mmap"`, a través de memoria
+compartida: el padre recibe vistas de los píxeles en lugar de copias (ver
+`transport`).
+
+Con `report=instrument.Report()`, cada etapa de cada imagen se mide en el worker
+(ver `instrument`) y se acumula en el informe junto con la espera en la cola del
+pool y la transferencia de los resultados al padre.
 """
+import contextlib
+import itertools
 import os
-from concurrent.futures import ProcessPoolExecutor
-from . import filters, detect, ml, io_utils
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from . import chain, detect, instrument, io_utils, registry, tiling, transport, workers
+
+# One processed image; `error` holds the exception when the image could not be
+# processed (and then `image` is None). `preview` is a reduced copy of the original
+# image, only produced on request (e.g. as the input of the classifier). `spans`
+# holds the worker's `instrument.Span` list when the run is instrumented.
+PipelineResult = namedtuple(
+    "PipelineResult",
+    ["index", "path", "image", "faces_detected", "error", "preview", "spans"],
+    defaults=(None, None),
+)
+
+# One image processed on its own (see `process_source`)
+SourceResult = namedtuple(
+    "SourceResult",
+    ["width", "height", "faces_detected", "colors", "preview", "output", "encoded"],
+)
+
+# Images per task for chains of cheap per-pixel filters, relative to the pool's
+# chunksize: for those, sending the images costs more than filtering them
+CHEAP_CHUNKSIZE_FACTOR = 4
 
 
 def process_image(image_path, selected_filters, face_detection):
@@ -16,63 +56,381 @@ def process_image(image_path, selected_filters, face_detection):
 
     Args:
         image_path (str): La ruta al archivo de imagen.
-        selected_filters (list): Una lista de cadenas que representan los filtros a aplicar.
+        selected_filters (list): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
         face_detection (bool): Si se debe realizar la detección de rostros.
 
     Returns:
         tuple: Una tupla que contiene la imagen procesada y un booleano que indica
                si se detectaron rostros.
     """
+    return process_loaded(_load(image_path), selected_filters, face_detection)
+
+
+def _load(image_path):
     image = io_utils.load_image(image_path)
+    if image is None:
+        raise ValueError(f"No se pudo leer la imagen: {image_path}")
+    return image
+
+
+def process_loaded(image, selected_filters, face_detection, backend=None):
+    """
+    Aplica una serie de filtros y transformaciones a una imagen ya decodificada.
 
-    # Apply selected filters
-    for filter_name in selected_filters:
-        if filter_name == "Sobel":
-            image = filters.apply_sobel(image)
-        elif filter_name == "Canny":
-            image = filters.apply_canny(image)
-        elif filter_name == "Gaussian Blur":
-            image = filters.apply_gaussian_blur(image)
-        elif filter_name == "Sharpen":
-            image = filters.apply_sharpen(image)
-        elif filter_name == "Random Hue Shift":
-            image = filters.apply_random_hue_shift(image)
+    Args:
+        image (numpy.ndarray): La imagen de entrada. No se modifica.
+        selected_filters (list): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
+        face_detection (bool): Si se debe realizar la detección de rostros.
+        backend (str, optional): El backend de los filtros, "exact" o "fast". Por
+            defecto es `chain.settings["backend"]`. Las imágenes que se procesan por
+            teselas usan siempre el exacto.
+
+    Returns:
+        tuple: La imagen procesada y un booleano que indica si se detectaron rostros.
+    """
+    with instrument.stage("filters", bytes_in=image.nbytes) as span:
+        if tiling.should_tile(image, selected_filters):
+            # Very large images are filtered tile by tile to bound the working memory
+            image = tiling.apply_chain_tiled(image, selected_filters)
+        else:
+            # Apply the selected filters as a single fused, cached chain
+            image = chain.apply_chain(image, selected_filters, backend)
+        span.bytes_out = image.nbytes
 
     # Perform face detection if enabled
     faces_detected = False
     if face_detection:
-        image, faces = detect.detect_faces(image)
+        with instrument.stage("faces", bytes_in=image.nbytes):
+            image, faces = detect.detect_faces(image)
         if len(faces) > 0:
             faces_detected = True
 
     return image, faces_detected
 
 
-def _process_image_wrapper(args):
+def process_source(
+    source,
+    selected_filters,
+    face_detection,
+    colors=0,
+    output=None,
+    encode=None,
+    preview_size=None,
+    backend=None,
+):
+    """
+    Procesa una sola imagen dada como ruta o como bytes, p. ej. para una petición del
+    servicio (ver `service`). Pensada para ejecutarse en un worker: sólo devuelve
+    al padre lo que se pide, no la imagen procesada completa.
+
+    Args:
+        source (str | bytes): La ruta de la imagen o el contenido de su fichero.
+        selected_filters (list): Los filtros a aplicar (ver `registry`).
+        face_detection (bool): Si se debe realizar la detección de rostros.
+        colors (int, optional): Cuántos colores dominantes de la imagen procesada
+            se calculan (`detect.get_dominant_colors`, en el modo "histogram"); con
+            0, ninguno.
+        output (str, optional): Dónde guardar la imagen procesada.
+        encode (str, optional): Si se indica (p. ej. ".png"), la imagen procesada
+            vuelve codificada en ese formato.
+        preview_size (int, optional): Si se indica, el resultado incluye una copia
+            reducida de la imagen original con ese lado corto.
+        backend (str, optional): El backend de los filtros (ver `process_loaded`).
+
+    Returns:
+        SourceResult: El tamaño de la imagen, si tiene rostros, los colores
+            dominantes (BGR), la previsualización, la ruta guardada y la imagen
+            codificada; los campos no pedidos quedan en None.
+
+    Raises:
+        ValueError: Si la imagen no se puede leer o codificar, o algún filtro no
+            es válido.
+        OSError: Si la imagen procesada no se pudo guardar.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        original = io_utils.decode_image(source)
+        if original is None:
+            raise ValueError("No se pudo decodificar la imagen")
+    else:
+        original = _load(source)
+    preview = io_utils.make_preview(original, preview_size) if preview_size else None
+    image, faces_detected = process_loaded(original, selected_filters, face_detection, backend)
+    dominant = None
+    if colors:
+        with instrument.stage("colors", bytes_in=image.nbytes):
+            # Histogram mode: its cost barely depends on the resolution of the upload
+            dominant = detect.get_dominant_colors(image, k=colors, mode="histogram").tolist()
+    if output is not None:
+        with instrument.stage("save", bytes_in=image.nbytes):
+            if not io_utils.save_image(image, output):
+                raise OSError(f"No se pudo escribir {output}")
+        output = str(output)
+    encoded = io_utils.encode_image(image, encode) if encode else None
+    height, width = image.shape[:2]
+    return SourceResult(width, height, faces_detected, dominant, preview, output, encoded)
+
+
+def process_chunk(
+    items,
+    selected_filters,
+    face_detection,
+    shared=None,
+    preview_size=None,
+    backend=None,
+    instrumented=False,
+):
+    """
+    Procesa un grupo de imágenes dentro de un worker.
+
+    Los errores se capturan imagen a imagen, para que una imagen corrupta no
+    invalide al resto del grupo.
+
+    Args:
+        items (list): Pares `(index, path)` a procesar.
+        selected_filters (list): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
+        face_detection (bool): Si se debe realizar la detección de rostros.
+        shared (tuple, optional): `(directorio, prefijo)` donde exportar las imágenes
+            procesadas; si se omite, las imágenes vuelven copiadas en el resultado.
+        preview_size (int, optional): Si se indica, cada resultado incluye una copia
+            reducida de la imagen original con ese lado corto, obtenida de la misma
+            decodificación que la imagen procesada.
+        backend (str, optional): El backend de los filtros (ver `process_loaded`).
+        instrumented (bool, optional): Si se miden las etapas de cada imagen; los
+            spans vuelven en el campo `spans` de cada resultado.
+
+    Returns:
+        list: Un `PipelineResult` por cada imagen.
+    """
+    results = []
+    for index, path in items:
+        spans = [] if instrumented else None
+        with instrument.recording(spans, index) if instrumented else contextlib.nullcontext():
+            try:
+                result = _process_item(
+                    index, path, selected_filters, face_detection, shared, preview_size, backend
+                )
+            except Exception as error:
+                result = PipelineResult(index, path, None, False, error)
+        results.append(result._replace(spans=spans))
+    return results
+
+
+def _process_item(index, path, selected_filters, face_detection, shared, preview_size, backend):
+    with instrument.stage("decode") as span:
+        if instrument.is_recording():
+            span.bytes_in = os.path.getsize(path)
+        original = _load(path)
+        span.bytes_out = original.nbytes
+    preview = None
+    if preview_size:
+        with instrument.stage("preview", bytes_in=original.nbytes) as span:
+            preview = io_utils.make_preview(original, preview_size)
+            span.bytes_out = preview.nbytes
+    image, faces_detected = process_loaded(original, selected_filters, face_detection, backend)
+    if shared is not None:
+        with instrument.stage("export", bytes_in=image.nbytes):
+            image = transport.export_image(image, *shared)
+    return PipelineResult(index, path, image, faces_detected, None, preview)
+
+
+def iter_pipeline(
+    image_paths,
+    selected_filters,
+    face_detection,
+    ordered=True,
+    max_in_flight=None,
+    pool=None,
+    transport_mode=None,
+    preview_size=None,
+    backend=None,
+    report=None,
+):
+    """
+    Ejecuta el pipeline en paralelo y entrega cada resultado en cuanto está listo.
+
+    Como mucho `max_in_flight` imágenes están a la vez en proceso o esperando a ser
+    consumidas; las rutas se leen del iterable a medida que hay hueco, así que
+    también pueden venir de un generador. Un error en una imagen no detiene el lote:
+    se entrega en el campo `error` de su resultado.
+
+    Los filtros se validan contra el registro antes de empezar. Si todos son de
+    coste `registry.PIXEL` (y no se detectan rostros), cada tarea lleva
+    `CHEAP_CHUNKSIZE_FACTOR` veces más imágenes.
+
+    Args:
+        image_paths (iterable): Las rutas a los archivos de imagen.
+        selected_filters (list): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
+        face_detection (bool): Si se debe realizar la detección de rostros.
+        ordered (bool, optional): Si es True, los resultados se entregan en el orden de
+            entrada; si es False, en el orden en que terminan. Por defecto es True.
+        max_in_flight (int, optional): El máximo de imágenes en vuelo. Por defecto es
+            el doble de las imágenes que ocupan a todos los workers.
+        pool (workers.WorkerPool, optional): El pool a usar. Por defecto es el pool
+            persistente compartido (`workers.get_pool()`).
+        transport_mode (str, optional): Cómo vuelven las imágenes al padre: "copy",
+            "shm" o "mmap". Por defecto es `transport.settings["transport"]`.
+        preview_size (int, optional): Si se indica, cada resultado incluye en
+            `preview` la imagen original reducida a ese lado corto, para no tener
+            que volver a decodificarla (p. ej. para clasificarla).
+        backend (str, optional): El backend de los filtros, "exact" o "fast". Por
+            defecto es `chain.settings["backend"]` del proceso que llama.
+        report (instrument.Report, optional): Si se indica, se miden las etapas de
+            cada imagen en los workers y se acumulan en el informe, junto con la
+            espera en la cola del pool ("queue", desde que se envía la tarea hasta
+            que empieza la imagen) y la transferencia de cada tarea al padre
+            ("transfer", desde que el worker termina hasta que el padre tiene los
+            resultados; incluye la serialización y el tiempo que el padre tarda en
+            recogerlos).
+
+    Yields:
+        PipelineResult: `(index, path, image, faces_detected, error, preview, spans)`
+        por cada imagen.
+    """
+    pool = pool or workers.get_pool()
+    # Validated here, once, instead of failing on every image in the workers
+    selected_filters = registry.resolve_all(selected_filters)
+    chunksize = pool.chunksize
+    if not face_detection and registry.is_cheap(selected_filters):
+        chunksize *= CHEAP_CHUNKSIZE_FACTOR
+    max_in_flight = max(chunksize, max_in_flight or 2 * pool.max_workers * chunksize)
+    transport_mode = transport_mode or transport.settings["transport"]
+    # Resolved here: the workers do not see settings changed after they started
+    backend = backend or chain.settings["backend"]
+    shared = None
+    if transport_mode != "copy":
+        shared = (str(transport.directory_for(transport_mode)), transport.owner_prefix())
+
+    paths = enumerate(image_paths)
+    pending = {}  # future -> list of (index, path)
+    submitted = {}  # future -> submission timestamp, only used with a report
+    in_flight = 0
+    finished = {}  # index -> PipelineResult, only used when ordered
+    next_index = 0
+
+    try:
+        while True:
+            # Keep the pool busy without exceeding the in-flight budget
+            while in_flight + len(finished) + chunksize <= max_in_flight:
+                items = list(itertools.islice(paths, chunksize))
+                if not items:
+                    break
+                future = pool.submit(
+                    process_chunk,
+                    items,
+                    selected_filters,
+                    face_detection,
+                    shared,
+                    preview_size,
+                    backend,
+                    report is not None,
+                )
+                pending[future] = items
+                if report is not None:
+                    submitted[future] = time.time()
+                in_flight += len(items)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                items = pending.pop(future)
+                in_flight -= len(items)
+                error = future.exception()
+                if error is None:
+                    if report is not None:
+                        _record(report, future.result(), submitted.pop(future))
+                    results = [_receive(result) for result in future.result()]
+                else:
+                    submitted.pop(future, None)
+                    # The whole task failed, e.g. because its worker died
+                    results = [
+                        PipelineResult(index, path, None, False, error)
+                        for index, path in items
+                    ]
+
+                for result in results:
+                    if not ordered:
+                        yield result
+                        continue
+                    finished[result.index] = result
+                    while next_index in finished:
+                        yield finished.pop(next_index)
+                        next_index += 1
+    finally:
+        # The pool outlives the batch; only drop work nobody will consume
+        for future in pending:
+            if not future.cancel():
+                future.add_done_callback(_discard_results)
+
+
+def _record(report, results, submitted):
+    """
+    Añade al informe los spans de una tarea y las etapas que sólo ve el padre.
+    """
+    received = time.time()
+    finished = submitted
+    payload = 0
+    for result in results:
+        spans = result.spans or []
+        report.extend(spans)
+        if spans:
+            started = min(item.start for item in spans)
+            finished = max(finished, max(item.start + item.wall for item in spans))
+            report.append(instrument.span(result.index, "queue", submitted, started - submitted))
+        # What travelled through the pool's pipe (a shared image is only a descriptor)
+        for array in (result.image, result.preview):
+            payload += getattr(array, "nbytes", 0)
+    transfer = max(received - finished, 0.0)
+    report.append(instrument.span(None, "transfer", finished, transfer, bytes_in=payload))
+
+
+def _receive(result):
+    """
+    Sustituye el descriptor de una imagen exportada por una vista de sus píxeles.
     """
-    Función auxiliar para desempaquetar argumentos para process_image.
+    if isinstance(result.image, transport.SharedImage):
+        return result._replace(image=transport.import_image(result.image))
+    return result
 
-    Se utiliza para permitir que `ProcessPoolExecutor` mapee un único iterable
-    de tuplas de argumentos a la función `process_image`.
+
+def _discard_results(future):
+    """
+    Borra las imágenes exportadas por una tarea cuyo resultado nadie consumirá.
     """
-    return process_image(*args)
+    if future.cancelled() or future.exception() is not None:
+        return
+    for result in future.result():
+        if isinstance(result.image, transport.SharedImage):
+            transport.discard(result.image)
 
 
-def run_pipeline(image_paths, selected_filters, face_detection):
+def run_pipeline(image_paths, selected_filters, face_detection, report=None):
     """
     Ejecuta el pipeline de procesamiento de imágenes en paralelo.
 
     Args:
         image_paths (list): Una lista de rutas a los archivos de imagen.
-        selected_filters (list): Una lista de cadenas que representan los filtros a aplicar.
+        selected_filters (list): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
         face_detection (bool): Si se debe realizar la detección de rostros.
+        report (instrument.Report, optional): Dónde acumular la medición de las
+            etapas de cada imagen (ver `iter_pipeline`).
 
     Returns:
         list: Una lista de tuplas, donde cada tupla contiene la imagen procesada
               y un booleano que indica si se detectaron rostros.
-    """
-    tasks = [(path, selected_filters, face_detection) for path in image_paths]
-    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-        results = list(executor.map(_process_image_wrapper, tasks))
 
+    Raises:
+        Exception: El primer error encontrado al procesar alguna imagen.
+    """
+    results = []
+    for result in iter_pipeline(image_paths, selected_filters, face_detection, report=report):
+        if result.error is not None:
+            raise result.error
+        results.append((result.image, result.faces_detected))
     return results
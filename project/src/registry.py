@@ -0,0 +1,350 @@
+"""
+Registro de los filtros disponibles.
+
+Cada filtro se declara una sola vez con un `FilterSpec`: su nombre, sus parámetros
+con tipo, valor por defecto y rango, y las propiedades que usa el resto del código
+para decidir cómo ejecutarlo:
+
+- `requires`/`produces`: el espacio de color que necesita y el que produce; `chain`
+  los usa para planificar las conversiones.
+- `deterministic`: si da siempre el mismo resultado; sólo las cadenas deterministas
+  se guardan en la caché.
+- `cost`: `PIXEL` (barato, por píxel) o `CONVOLUTION`; el pipeline envía más
+  imágenes por tarea cuando todos los filtros son baratos.
+- `tileable` y `halo`: si el filtro puede ejecutarse por teselas (`tiling`) y
+  cuántos píxeles alrededor de cada tesela necesita leer.
+
+La implementación (`operation`) escribe el resultado en un buffer preasignado:
+`operation(src, dst, ws, **params)`, donde `ws` es el workspace de `chain`. Los
+filtros integrados se registran al importar el módulo; otros pueden añadirse con
+`register`, y a partir de ese momento aparecen en la interfaz, en `src.batch` y en
+el pipeline. Como los workers del pipeline son procesos nuevos, los módulos que
+registran filtros deben listarse en `PHOTOLAB_FILTER_PLUGINS` (separados por comas):
+se importan al importar este módulo, también dentro de cada worker.
+
+En una cadena, cada filtro se indica por su nombre (con los parámetros por
+defecto) o como un par `(nombre, {parámetro: valor})`; `resolve` lo convierte en un
+`Step` con todos los parámetros validados, que es lo que forma parte de las claves
+de la caché.
+"""
+import importlib
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+BGR = "bgr"
+GRAY = "gray"
+ANY = "any"
+
+# Cost classes
+PIXEL = "pixel"
+CONVOLUTION = "convolution"
+
+# A parameter of a filter. `choices`, or else `minimum` and `maximum`, bound its value.
+Parameter = namedtuple(
+    "Parameter",
+    ["name", "type", "default", "minimum", "maximum", "choices", "label"],
+    defaults=(None, None, None, None),
+)
+
+# A filter: see the module docstring. `halo(params)` gives the pixels read around
+# each output pixel, for tiled execution.
+FilterSpec = namedtuple(
+    "FilterSpec",
+    [
+        "name",
+        "operation",
+        "parameters",
+        "requires",
+        "produces",
+        "deterministic",
+        "cost",
+        "tileable",
+        "halo",
+    ],
+    defaults=((), ANY, None, True, CONVOLUTION, False, None),
+)
+
+# A filter in a chain, with all its parameters as sorted `(name, value)` pairs
+Step = namedtuple("Step", ["name", "params"])
+
+FILTERS = {}
+
+settings = {
+    # Modules imported after the built-in filters are registered
+    "plugins": [
+        name.strip()
+        for name in os.environ.get("PHOTOLAB_FILTER_PLUGINS", "").split(",")
+        if name.strip()
+    ],
+}
+
+
+def register(spec, replace=False):
+    """
+    Registra un filtro.
+
+    Args:
+        spec (FilterSpec): La declaración del filtro.
+        replace (bool, optional): Si se permite sustituir un filtro con el mismo
+            nombre. Por defecto es False.
+
+    Returns:
+        FilterSpec: La declaración registrada.
+
+    Raises:
+        ValueError: Si ya existe un filtro con ese nombre, o si algún parámetro por
+            defecto no es válido.
+    """
+    if spec.name in FILTERS and not replace:
+        raise ValueError(f"Ya existe un filtro llamado {spec.name!r}")
+    for parameter in spec.parameters:
+        _check(spec.name, parameter, parameter.default)
+    FILTERS[spec.name] = spec
+    return spec
+
+
+def get(name):
+    """
+    Devuelve la declaración de un filtro.
+
+    Raises:
+        ValueError: Si el filtro no existe.
+    """
+    try:
+        return FILTERS[name]
+    except KeyError:
+        raise ValueError(f"Filtros desconocidos: {name}") from None
+
+
+def names():
+    """
+    Devuelve los nombres de los filtros registrados, en orden de registro.
+    """
+    return list(FILTERS)
+
+
+def resolve(entry):
+    """
+    Convierte un filtro de una cadena en un `Step` con sus parámetros validados.
+
+    Args:
+        entry: El nombre del filtro, un par `(nombre, {parámetro: valor})` o un `Step`.
+
+    Returns:
+        Step: El filtro con todos sus parámetros (los omitidos toman su valor por
+              defecto).
+
+    Raises:
+        ValueError: Si el filtro no existe o algún parámetro no existe o no es válido.
+    """
+    if isinstance(entry, str):
+        name, given = entry, {}
+    else:
+        name, given = entry
+        given = dict(given)
+    spec = get(name)
+    declared = {parameter.name: parameter for parameter in spec.parameters}
+    unknown = sorted(set(given) - set(declared))
+    if unknown:
+        raise ValueError(f"{name}: parámetros desconocidos: {', '.join(unknown)}")
+    params = []
+    for parameter in spec.parameters:
+        value = given.get(parameter.name, parameter.default)
+        params.append((parameter.name, _check(name, parameter, value)))
+    return Step(name, tuple(sorted(params)))
+
+
+def resolve_all(entries):
+    """
+    Resuelve todos los filtros de una cadena (ver `resolve`).
+
+    Raises:
+        ValueError: Si algún filtro no existe (se indican todos) o algún parámetro no
+            es válido.
+    """
+    entries = list(entries)
+    unknown = [_name(entry) for entry in entries if _name(entry) not in FILTERS]
+    if unknown:
+        raise ValueError(f"Filtros desconocidos: {', '.join(unknown)}")
+    return tuple(resolve(entry) for entry in entries)
+
+
+def parse(text):
+    """
+    Interpreta un filtro escrito en la línea de comandos.
+
+    Args:
+        text (str): `Nombre` o `Nombre:parámetro=valor,parámetro=valor`, p. ej.
+            ``"Canny:low_threshold=50,high_threshold=150"``.
+
+    Returns:
+        tuple: El par `(nombre, {parámetro: valor})`, con los valores convertidos al
+               tipo de cada parámetro.
+
+    Raises:
+        ValueError: Si el filtro no existe o algún parámetro no es válido.
+    """
+    name, _, arguments = text.partition(":")
+    name = name.strip()
+    spec = get(name)
+    declared = {parameter.name: parameter for parameter in spec.parameters}
+    params = {}
+    for argument in filter(None, (item.strip() for item in arguments.split(","))):
+        key, separator, value = argument.partition("=")
+        key = key.strip()
+        if not separator or key not in declared:
+            raise ValueError(f"{name}: parámetro no válido: {argument!r}")
+        params[key] = _convert(declared[key], value.strip())
+    return name, params
+
+
+def is_deterministic(steps):
+    """
+    Indica si una cadena de `Step` da siempre el mismo resultado.
+    """
+    return all(FILTERS[step.name].deterministic for step in steps if isinstance(step, Step))
+
+
+def is_cheap(steps):
+    """
+    Indica si todos los filtros de una cadena de `Step` son de coste `PIXEL`.
+    """
+    return all(FILTERS[step.name].cost == PIXEL for step in steps if isinstance(step, Step))
+
+
+def _name(entry):
+    return entry if isinstance(entry, str) else entry[0]
+
+
+def _convert(parameter, text):
+    if parameter.type is bool:
+        if text.lower() in ("1", "true", "yes", "sí", "si"):
+            return True
+        if text.lower() in ("0", "false", "no"):
+            return False
+        raise ValueError(f"{parameter.name}: se esperaba un booleano, no {text!r}")
+    try:
+        return parameter.type(text)
+    except ValueError:
+        raise ValueError(
+            f"{parameter.name}: se esperaba {parameter.type.__name__}, no {text!r}"
+        ) from None
+
+
+def _check(name, parameter, value):
+    """
+    Valida el valor de un parámetro y lo devuelve con su tipo.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if parameter.type is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if type(value) is not parameter.type:
+        raise ValueError(
+            f"{name}: {parameter.name} debe ser {parameter.type.__name__}, no {value!r}"
+        )
+    if parameter.choices is not None and value not in parameter.choices:
+        choices = ", ".join(str(choice) for choice in parameter.choices)
+        raise ValueError(f"{name}: {parameter.name} debe ser uno de {choices}, no {value}")
+    if parameter.minimum is not None and value < parameter.minimum:
+        raise ValueError(f"{name}: {parameter.name} debe ser >= {parameter.minimum}")
+    if parameter.maximum is not None and value > parameter.maximum:
+        raise ValueError(f"{name}: {parameter.name} debe ser <= {parameter.maximum}")
+    return value
+
+
+# --- Built-in filters ---
+# Same arithmetic as the functions of filters.py, on the buffers of a chain workspace.
+
+_SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+
+
+def _sobel(src, dst, ws, ksize=5):
+    gradient_x = ws.buffer("sobel_x", src.shape, np.float64)
+    gradient_y = ws.buffer("sobel_y", src.shape, np.float64)
+    cv2.Sobel(src, cv2.CV_64F, 1, 0, dst=gradient_x, ksize=ksize)
+    cv2.Sobel(src, cv2.CV_64F, 0, 1, dst=gradient_y, ksize=ksize)
+    np.hypot(gradient_x, gradient_y, out=gradient_x)
+    np.divide(gradient_x, gradient_x.max(), out=gradient_x)
+    np.multiply(gradient_x, 255, out=gradient_x)
+    np.copyto(dst, gradient_x, casting="unsafe")
+
+
+def _canny(src, dst, ws, low_threshold=100, high_threshold=200):
+    cv2.Canny(src, low_threshold, high_threshold, edges=dst)
+
+
+def _gaussian_blur(src, dst, ws, kernel_size=5):
+    cv2.GaussianBlur(src, (kernel_size, kernel_size), 0, dst=dst)
+
+
+def _sharpen(src, dst, ws):
+    cv2.filter2D(src, -1, _SHARPEN_KERNEL, dst=dst)
+
+
+def _random_hue_shift(src, dst, ws):
+    hsv = ws.buffer("hsv", src.shape)
+    cv2.cvtColor(src, cv2.COLOR_BGR2HSV, dst=hsv)
+    hue = hsv[:, :, 0]
+    hue_shift = np.random.randint(0, 180)
+    hsv[:, :, 0] = np.add(hue, hue_shift, dtype=np.uint16) % 180
+    cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=dst)
+
+
+register(
+    FilterSpec(
+        "Sobel",
+        _sobel,
+        (Parameter("ksize", int, 5, choices=(1, 3, 5, 7), label="Tamaño del kernel"),),
+        requires=GRAY,
+        produces=GRAY,
+        tileable=True,
+        # Plus one pixel of safety margin
+        halo=lambda params: params["ksize"] // 2 + 1,
+    )
+)
+register(
+    FilterSpec(
+        "Canny",
+        _canny,
+        (
+            Parameter("low_threshold", int, 100, 0, 1000, label="Umbral bajo"),
+            Parameter("high_threshold", int, 200, 0, 1000, label="Umbral alto"),
+        ),
+        requires=GRAY,
+        produces=GRAY,
+        tileable=True,
+        # The 3x3 gradient plus non-maximum suppression, plus one pixel of margin
+        halo=lambda params: 3,
+    )
+)
+register(
+    FilterSpec(
+        "Gaussian Blur",
+        _gaussian_blur,
+        (
+            Parameter(
+                "kernel_size", int, 5, choices=(3, 5, 7, 9, 11, 15, 21), label="Tamaño del kernel"
+            ),
+        ),
+        tileable=True,
+        halo=lambda params: params["kernel_size"] // 2,
+    )
+)
+register(FilterSpec("Sharpen", _sharpen, tileable=True, halo=lambda params: 1))
+register(
+    FilterSpec(
+        "Random Hue Shift",
+        _random_hue_shift,
+        requires=BGR,
+        produces=BGR,
+        deterministic=False,
+        cost=PIXEL,
+    )
+)
+
+for _plugin in settings["plugins"]:
+    importlib.import_module(_plugin)
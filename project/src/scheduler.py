@@ -0,0 +1,423 @@
+"""
+Ejecución concurrente de las etapas de cada imagen según sus dependencias.
+
+Cada imagen recorre un grafo de etapas. En la aplicación, por ejemplo:
+
+    imagen ─┬─> decodificar, filtros y rostros (pool) ─────┬─> guardar
+            └─> decodificar reducida ──> clasificar (CLIP) ┘
+
+Las etapas independientes no tienen por qué esperarse: mientras el pool de
+procesos filtra unas imágenes, CLIP puede clasificar otras y los hilos de E/S
+guardar las que ya tienen las dos cosas. `Scheduler` ejecuta así un grafo:
+
+- Cada etapa tiene sus propios hilos y una cola acotada. Un elemento entra en la
+  cola de una etapa en cuanto terminaron todas las etapas de las que depende; si la
+  cola está llena, quien lo entrega espera, así que una etapa lenta frena a las
+  anteriores en lugar de acumular imágenes en memoria.
+- Una etapa puede procesar micro-lotes (`batch_size`): espera hasta `max_wait`
+  segundos a juntar un lote completo, p. ej. para CLIP.
+- La etapa raíz es un iterable (`source`) de pares `(clave, valor)`, que se
+  consume en su propio hilo.
+- Una etapa puede calcularse fuera del planificador (`add_stream`), p. ej. los
+  resultados de `pipeline.iter_pipeline` en el pool de procesos: sus valores se
+  asignan a cada elemento por su clave, en cualquier orden.
+- Los resultados se entregan por imagen en cuanto termina su última etapa, con los
+  valores de todas sus etapas o con el error de la que falló.
+
+Con varias etapas solapadas, el tiempo de un lote se acerca al de la etapa más
+lenta en lugar de a la suma de todas (si hay núcleos para ejecutarlas a la vez).
+"""
+import contextlib
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from . import instrument
+
+settings = {
+    # Items waiting in front of each stage
+    "queue_size": int(os.environ.get("PHOTOLAB_SCHEDULER_QUEUE_SIZE", 32)),
+}
+
+# The name of the root stage, whose values come from the source iterable
+SOURCE = "source"
+
+# The outcome of one item: `values` maps each finished stage to its value; if a
+# stage failed, `error` is its exception and `stage` its name.
+Outcome = namedtuple("Outcome", ["key", "values", "error", "stage"])
+
+# Seconds between checks of the stop flag while waiting on a queue
+_POLL = 0.1
+
+
+class _Stage:
+    def __init__(self, name, function, after, workers, batch_size, max_wait, queue_size):
+        self.name = name
+        self.function = function
+        self.after = after
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max(1, queue_size or settings["queue_size"]))
+        self.dependents = []
+        # The (key, value) pairs of a stage computed outside the scheduler
+        self.stream = None
+        self.finished = False
+
+
+class _Item:
+    def __init__(self, stages):
+        self.values = {}
+        # Stages still waiting for some of their dependencies
+        self.waiting = {name: set(stage.after) for name, stage in stages.items()}
+        self.remaining = len(stages)
+        self.done = False
+
+
+class Scheduler:
+    """
+    Un grafo de etapas que se ejecutan a la vez sobre un flujo de elementos.
+
+    Args:
+        report (instrument.Report, optional): Si se indica, cada llamada a una etapa
+            se mide como una etapa de `instrument` con su nombre.
+    """
+
+    def __init__(self, report=None):
+        self.report = report
+        self._stages = {}
+        self.stats = {}
+        # Wall time of the last run, in seconds
+        self.elapsed = None
+
+    def add(
+        self,
+        name,
+        function,
+        after=(SOURCE,),
+        workers=1,
+        batch_size=None,
+        max_wait=0.05,
+        queue_size=None,
+    ):
+        """
+        Añade una etapa. Sus dependencias tienen que haberse añadido antes, así que
+        el grafo no puede tener ciclos.
+
+        Args:
+            name (str): El nombre de la etapa.
+            function (function): Sin `batch_size`, se llama como
+                `function(clave, entradas)`, donde `entradas` es un diccionario con el
+                valor de cada dependencia, y devuelve el valor de la etapa. Con
+                `batch_size`, recibe una lista de pares `(clave, entradas)` y
+                devuelve una lista de valores en el mismo orden.
+            after (tuple, optional): Las etapas de las que depende. Por defecto, sólo
+                de `SOURCE`.
+            workers (int, optional): Los hilos de la etapa.
+            batch_size (int, optional): El tamaño máximo de los micro-lotes.
+            max_wait (float, optional): Los segundos que se espera a completar un
+                micro-lote antes de procesar los elementos que haya.
+            queue_size (int, optional): Los elementos que pueden esperar en la cola
+                de la etapa. Por defecto es `settings["queue_size"]`.
+
+        Returns:
+            Scheduler: El propio planificador, para encadenar llamadas.
+
+        Raises:
+            ValueError: Si el nombre está repetido o una dependencia no existe.
+        """
+        if name == SOURCE or name in self._stages:
+            raise ValueError(f"La etapa {name} ya existe")
+        after = tuple(after)
+        unknown = [dep for dep in after if dep != SOURCE and dep not in self._stages]
+        if unknown or not after:
+            raise ValueError(f"Dependencias desconocidas de {name}: {', '.join(unknown)}")
+        stage = _Stage(name, function, after, max(1, workers), batch_size, max_wait, queue_size)
+        for dep in after:
+            if dep != SOURCE:
+                self._stages[dep].dependents.append(stage)
+        self._stages[name] = stage
+        return self
+
+    def add_stream(self, name, results):
+        """
+        Añade una etapa cuyos valores se calculan fuera del planificador, p. ej. los
+        resultados de `pipeline.iter_pipeline`, que usa su propio pool de procesos.
+
+        La etapa sólo depende de `SOURCE`: se consume en su propio hilo, en paralelo
+        con las demás ramas, y cada valor se asigna al elemento de su clave en
+        cuanto `source` lo entregó. Los elementos cuya clave no aparece en
+        `results` fallan en esta etapa.
+
+        Args:
+            name (str): El nombre de la etapa.
+            results (iterable): Pares `(clave, valor)`, en cualquier orden. Si el
+                valor es una excepción, el elemento falla en esta etapa.
+
+        Returns:
+            Scheduler: El propio planificador, para encadenar llamadas.
+
+        Raises:
+            ValueError: Si el nombre está repetido.
+        """
+        if name == SOURCE or name in self._stages:
+            raise ValueError(f"La etapa {name} ya existe")
+        stage = _Stage(name, None, (SOURCE,), 0, None, 0, 1)
+        stage.stream = results
+        self._stages[name] = stage
+        return self
+
+    def run(self, source):
+        """
+        Ejecuta el grafo sobre los elementos de `source`.
+
+        Args:
+            source (iterable): Pares `(clave, valor)`; las claves deben ser únicas.
+                Si el valor es una excepción, el elemento falla sin pasar por
+                ninguna etapa.
+
+        Yields:
+            Outcome: El resultado de cada elemento, en el orden en que terminan.
+
+        Raises:
+            Exception: La que lance `source` (o una etapa de `add_stream`) al
+                iterarlo.
+        """
+        stages = self._stages
+        for stage in stages.values():
+            stage.finished = False
+        roots = [
+            stage
+            for stage in stages.values()
+            if SOURCE in stage.after and stage.stream is None
+        ]
+        streams = [stage for stage in stages.values() if stage.stream is not None]
+        items = {}
+        # Keys delivered by the source so far, for the streams to wait on
+        seen = set()
+        lock = threading.Lock()
+        registered = threading.Condition(lock)
+        errors = []
+        stop = threading.Event()
+        outcomes = queue.Queue(maxsize=max(1, settings["queue_size"]))
+        self.stats = {
+            name: {"items": 0, "calls": 0, "busy_s": 0.0, "max_queue": 0} for name in stages
+        }
+        stats_lock = threading.Lock()
+
+        def put(target, value):
+            # Blocks while the target queue is full, unless the run is stopping
+            while not stop.is_set():
+                try:
+                    target.put(value, timeout=_POLL)
+                    return
+                except queue.Full:
+                    continue
+
+        def finish(key, item, error=None, stage=None):
+            # Called with the lock held; an item is reported once
+            if item.done:
+                return None
+            item.done = True
+            del items[key]
+            return Outcome(key, item.values, error, stage)
+
+        def complete(key, name, value):
+            ready = []
+            with lock:
+                item = items.get(key)
+                if item is None:
+                    return  # the item already failed in another branch
+                item.values[name] = value
+                if name != SOURCE and stages[name].stream is not None:
+                    with stats_lock:
+                        self.stats[name]["items"] += 1
+                outcome = None
+                if name != SOURCE:
+                    item.remaining -= 1
+                if not item.remaining:
+                    outcome = finish(key, item)
+                for stage in roots if name == SOURCE else stages[name].dependents:
+                    waiting = item.waiting[stage.name]
+                    waiting.discard(name)
+                    if not waiting:
+                        inputs = {dep: item.values[dep] for dep in stage.after}
+                        ready.append((stage, inputs))
+            if outcome is not None:
+                put(outcomes, outcome)
+            for stage, inputs in ready:
+                put(stage.queue, (key, inputs))
+                with stats_lock:
+                    stats = self.stats[stage.name]
+                    stats["max_queue"] = max(stats["max_queue"], stage.queue.qsize())
+
+        def fail(key, error, name):
+            with lock:
+                item = items.get(key)
+                outcome = finish(key, item, error, name) if item is not None else None
+            if outcome is not None:
+                put(outcomes, outcome)
+
+        def take(stage):
+            # The next batch for a stage, or None when the run is stopping
+            while not stop.is_set():
+                try:
+                    batch = [stage.queue.get(timeout=_POLL)]
+                    break
+                except queue.Empty:
+                    continue
+            else:
+                return None
+            if stage.batch_size:
+                deadline = time.perf_counter() + stage.max_wait
+                while len(batch) < stage.batch_size:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(stage.queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+            return batch
+
+        def work(stage):
+            recording = (
+                instrument.recording(self.report)
+                if self.report is not None
+                else contextlib.nullcontext()
+            )
+            with recording:
+                while (batch := take(stage)) is not None:
+                    start = time.perf_counter()
+                    try:
+                        if stage.batch_size:
+                            with instrument.stage(stage.name):
+                                values = list(stage.function(batch))
+                            if len(values) != len(batch):
+                                # Unmatched items would never finish: fail the batch
+                                raise ValueError(
+                                    f"La etapa {stage.name} devolvió {len(values)} valores "
+                                    f"para {len(batch)} elementos"
+                                )
+                        else:
+                            key, inputs = batch[0]
+                            image = key if isinstance(key, int) else None
+                            with instrument.stage(stage.name, image=image):
+                                values = [stage.function(key, inputs)]
+                    except Exception as error:
+                        for key, _ in batch:
+                            fail(key, error, stage.name)
+                        continue
+                    finally:
+                        with stats_lock:
+                            stats = self.stats[stage.name]
+                            stats["calls"] += 1
+                            stats["items"] += len(batch)
+                            stats["busy_s"] += time.perf_counter() - start
+                    for (key, _), value in zip(batch, values):
+                        complete(key, stage.name, value)
+
+        fed = {"count": 0, "done": False}
+
+        def missing(stage):
+            return ValueError(f"La etapa {stage.name} no devolvió ningún resultado")
+
+        def feed():
+            try:
+                for key, value in source:
+                    if stop.is_set():
+                        break
+                    with registered:
+                        items[key] = _Item(stages)
+                        # Set now, in case a stream completes the item before its roots
+                        items[key].values[SOURCE] = value
+                        seen.add(key)
+                        fed["count"] += 1
+                        finished = [stage for stage in streams if stage.finished]
+                        registered.notify_all()
+                    if isinstance(value, BaseException):
+                        fail(key, value, SOURCE)
+                    elif finished:
+                        fail(key, missing(finished[0]), finished[0].name)
+                    else:
+                        complete(key, SOURCE, value)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                with registered:
+                    fed["done"] = True
+                    registered.notify_all()
+                put(outcomes, None)  # wakes the consumer up to check for the end
+
+        def drain(stage):
+            results = iter(stage.stream)
+            try:
+                for key, value in results:
+                    # A value may arrive before the source delivered its key
+                    with registered:
+                        while key not in seen and not fed["done"] and not stop.is_set():
+                            registered.wait(_POLL)
+                        known = key in seen
+                    if stop.is_set():
+                        break
+                    if not known:
+                        continue
+                    if isinstance(value, BaseException):
+                        fail(key, value, stage.name)
+                    else:
+                        complete(key, stage.name, value)
+                else:
+                    with lock:
+                        stage.finished = True
+                        unmatched = [
+                            key for key, item in items.items() if stage.name not in item.values
+                        ]
+                    for key in unmatched:
+                        fail(key, missing(stage), stage.name)
+            except Exception as error:
+                errors.append(error)
+                put(outcomes, None)
+            finally:
+                close = getattr(results, "close", None)
+                if close is not None:
+                    close()
+
+        threads = [threading.Thread(target=feed, name="photolab-scheduler-source", daemon=True)]
+        threads += [
+            threading.Thread(
+                target=drain, args=(stage,), name=f"photolab-{stage.name}", daemon=True
+            )
+            for stage in streams
+        ]
+        for stage in stages.values():
+            threads += [
+                threading.Thread(
+                    target=work, args=(stage,), name=f"photolab-{stage.name}", daemon=True
+                )
+                for _ in range(stage.workers)
+            ]
+        for thread in threads:
+            thread.start()
+
+        start = time.perf_counter()
+        delivered = 0
+        try:
+            while True:
+                if errors:
+                    raise errors[0]
+                if fed["done"] and delivered == fed["count"]:
+                    return
+                try:
+                    outcome = outcomes.get(timeout=_POLL)
+                except queue.Empty:
+                    continue
+                if outcome is not None:
+                    delivered += 1
+                    yield outcome
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - start
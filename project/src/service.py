@@ -0,0 +1,684 @@
+"""
+Servicio HTTP local para usar PhotoLab desde otras herramientas, sin la interfaz.
+
+Un servidor `asyncio` (sólo la biblioteca estándar) expone el pipeline de una
+imagen (`pipeline.process_source`: filtros, rostros y colores dominantes) y la
+clasificación de CLIP (`ml.classify_batch`):
+
+- `POST /process`: procesa una imagen. La imagen llega como cuerpo de la petición
+  (los bytes del fichero) o como ruta (`path`); los parámetros van en la query o,
+  con `Content-Type: application/json`, en un objeto JSON junto con `path`.
+  Parámetros: `filters` (repetible, con la sintaxis de `registry.parse`, p. ej.
+  ``Canny:low_threshold=50``), `faces`, `colors` (cuántos colores dominantes),
+  `classify`, `output` (dónde guardar la imagen procesada) y `format` (p. ej.
+  `png`: la respuesta es la imagen codificada y el resultado va en la cabecera
+  `X-PhotoLab-Result`). Sin `format`, la respuesta es el resultado en JSON.
+- `POST /classify`: igual, pero clasifica por defecto.
+- `GET /metrics`: percentiles de latencia por ruta, peticiones rechazadas,
+  profundidad de las colas y tamaño de los micro-lotes.
+- `GET /health`.
+
+El trabajo de CPU va al pool compartido de `workers`, que devuelve sólo lo pedido
+(una previsualización para clasificar, los colores, la imagen codificada) y no la
+imagen completa. Las clasificaciones de peticiones concurrentes se agrupan en
+micro-lotes dinámicos (`MicroBatcher`): el lote sale cuando está completo o cuando
+su primera imagen lleva `max_wait` segundos esperando, y se ejecuta en un hilo
+aparte mientras el siguiente se va llenando.
+
+Cuando hay `max_pending` imágenes en el pool o la cola de clasificación está llena,
+el servicio responde 429 (con `Retry-After`) en lugar de acumular peticiones en
+memoria.
+
+El servicio escucha por defecto sólo en `127.0.0.1`: lee y escribe rutas locales
+sin autenticación, así que no debe exponerse a la red.
+
+Uso (desde el directorio `project/`):
+
+    python -m src.service --port 8765
+    curl --data-binary @foto.jpg "localhost:8765/process?filters=Sobel&colors=5&classify=1"
+    curl --data-binary @foto.jpg -o bordes.png "localhost:8765/process?filters=Canny&format=png"
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from . import ml, pipeline, registry, workers
+
+settings = {
+    "host": os.environ.get("PHOTOLAB_SERVICE_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("PHOTOLAB_SERVICE_PORT", 8765)),
+    # Images being processed or waiting in the worker pool (0: four per worker)
+    "max_pending": int(os.environ.get("PHOTOLAB_SERVICE_MAX_PENDING", 0)),
+    # Requests that will be classified, from the pool until they get their label
+    "classify_queue": int(os.environ.get("PHOTOLAB_SERVICE_CLASSIFY_QUEUE", 64)),
+    # Largest micro-batch, and how long its first image may wait for more
+    "batch_size": int(os.environ.get("PHOTOLAB_SERVICE_BATCH_SIZE", 16)),
+    "max_wait": float(os.environ.get("PHOTOLAB_SERVICE_MAX_WAIT", 0.02)),
+    "max_body": int(os.environ.get("PHOTOLAB_SERVICE_MAX_BODY", 64 * 2**20)),
+    # Latest requests per route kept for the latency percentiles
+    "latency_window": int(os.environ.get("PHOTOLAB_SERVICE_LATENCY_WINDOW", 4096)),
+}
+
+# A parsed HTTP request
+Request = namedtuple("Request", ["method", "path", "query", "headers", "body", "keep_alive"])
+
+# The parameters of one image request (see the module docstring)
+Job = namedtuple("Job", ["source", "filters", "faces", "colors", "classify", "output", "format"])
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+_CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+
+_TRUE = {"1", "true", "yes", "on"}
+
+# Method of each route
+_ROUTES = {
+    "/process": "POST",
+    "/classify": "POST",
+    "/metrics": "GET",
+    "/health": "GET",
+}
+
+
+class HTTPError(Exception):
+    """
+    Un error que se responde al cliente con su código HTTP.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Busy(HTTPError):
+    """
+    El servicio está saturado: la petición se rechaza con un 429.
+    """
+
+    def __init__(self, message):
+        super().__init__(429, message)
+
+
+class MicroBatcher:
+    """
+    Agrupa en micro-lotes las llamadas concurrentes a una función por lotes.
+
+    Debe usarse desde un mismo bucle de eventos: `start` crea la cola y la tarea
+    que forma los lotes, y cada lote se ejecuta en un hilo aparte.
+
+    Args:
+        function (function): Recibe una lista de elementos y devuelve una lista de
+            resultados en el mismo orden.
+        batch_size (int): El tamaño máximo de los lotes.
+        max_wait (float): Los segundos que el primer elemento de un lote espera a
+            que lleguen más.
+        queue_size (int): Los elementos que pueden esperar; más se rechazan con
+            `Busy`.
+    """
+
+    def __init__(self, function, batch_size, max_wait, queue_size):
+        self.function = function
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.queue_size = max(1, queue_size)
+        self.in_flight = 0
+        self.stats = {"batches": 0, "items": 0, "max_size": 0}
+        self._queue = None
+        self._task = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="photolab-service-batch"
+        )
+
+    @property
+    def depth(self):
+        """
+        Los elementos esperando a entrar en un lote.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, item):
+        """
+        Añade un elemento al siguiente lote y espera su resultado.
+
+        Raises:
+            Busy: Si la cola está llena.
+            Exception: La que lance la función con el lote del elemento.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise Busy("La cola de clasificación está llena") from None
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Skip the requests whose clients went away while waiting
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.in_flight = len(batch)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["max_size"] = max(self.stats["max_size"], len(batch))
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.function, [item for item, _ in batch]
+                )
+                if len(results) != len(batch):
+                    # Unmatched requests would wait forever: fail the batch
+                    raise ValueError(
+                        f"La función por lotes devolvió {len(results)} resultados "
+                        f"para {len(batch)} elementos"
+                    )
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self.in_flight = 0
+
+
+class Latencies:
+    """
+    Las latencias recientes y los contadores de respuestas de cada ruta.
+
+    Args:
+        window (int): Las latencias que se conservan por ruta para los percentiles.
+    """
+
+    def __init__(self, window):
+        self.window = max(1, window)
+        self._routes = {}
+
+    def record(self, route, status, seconds):
+        entry = self._routes.setdefault(
+            route,
+            {"samples": deque(maxlen=self.window), "count": 0, "errors": 0, "rejected": 0},
+        )
+        entry["count"] += 1
+        if status == 429:
+            entry["rejected"] += 1
+        elif status >= 400:
+            entry["errors"] += 1
+        else:
+            entry["samples"].append(seconds * 1000)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Por ruta, las peticiones, los errores, las rechazadas y los
+                  percentiles 50, 90 y 99 y el máximo (en milisegundos) de las
+                  últimas respuestas correctas.
+        """
+        summary = {}
+        for route, entry in self._routes.items():
+            row = {name: entry[name] for name in ("count", "errors", "rejected")}
+            if entry["samples"]:
+                samples = np.fromiter(entry["samples"], dtype=float)
+                p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+                row.update(p50_ms=p50, p90_ms=p90, p99_ms=p99, max_ms=samples.max())
+            summary[route] = row
+        return summary
+
+
+def _classify_previews(previews):
+    return [labels[0] for labels in ml.classify_batch(previews)]
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in _TRUE
+
+
+def _filters(entries):
+    if isinstance(entries, str):
+        entries = [entries]
+    return registry.resolve_all(
+        registry.parse(entry) if isinstance(entry, str) else tuple(entry) for entry in entries
+    )
+
+
+def parse_job(request, classify=False):
+    """
+    Interpreta los parámetros de una petición de imagen.
+
+    Args:
+        request (Request): La petición.
+        classify (bool, optional): Si se clasifica cuando la petición no lo dice.
+
+    Returns:
+        Job: Los parámetros, con los filtros ya validados.
+
+    Raises:
+        HTTPError: Si falta la imagen o algún parámetro no es válido.
+    """
+    params = {name: values[-1] for name, values in request.query.items()}
+    if "filters" in request.query:
+        params["filters"] = request.query["filters"]
+    source = None
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError as error:
+            raise HTTPError(400, f"JSON no válido: {error}") from None
+        if not isinstance(body, dict):
+            raise HTTPError(400, "El cuerpo JSON debe ser un objeto")
+        params.update(body)
+    elif request.body:
+        source = request.body
+    if source is None:
+        source = params.get("path")
+    if not source:
+        raise HTTPError(400, "Falta la imagen: envíala como cuerpo o indica path")
+    try:
+        colors = int(params.get("colors", 0))
+        if colors < 0:
+            raise ValueError(f"colors no puede ser negativo: {colors}")
+        output_format = params.get("format")
+        if output_format:
+            output_format = "." + str(output_format).lstrip(".").lower()
+            if output_format not in _CONTENT_TYPES:
+                raise ValueError(f"Formato de imagen no soportado: {params['format']}")
+        return Job(
+            source,
+            _filters(params.get("filters", [])),
+            _flag(params.get("faces", False)),
+            colors,
+            _flag(params.get("classify", classify)),
+            params.get("output"),
+            output_format,
+        )
+    except (TypeError, ValueError) as error:
+        raise HTTPError(400, str(error)) from None
+
+
+async def read_request(reader, max_body=None):
+    """
+    Lee una petición HTTP/1.1 de un stream.
+
+    Returns:
+        Request: La petición, o None si el cliente cerró la conexión.
+
+    Raises:
+        HTTPError: Si la petición está mal formada o el cuerpo es demasiado grande.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Línea de petición no válida") from None
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(411, "Se necesita Content-Length")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length no válido") from None
+    if length > (max_body or settings["max_body"]):
+        raise HTTPError(413, f"El cuerpo supera {max_body or settings['max_body']} bytes")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" and (version != "HTTP/1.0" or connection == "keep-alive")
+    return Request(method, url.path, parse_qs(url.query), headers, body, keep_alive)
+
+
+def _json(status, payload, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    return status, {"Content-Type": "application/json", **(headers or {})}, body
+
+
+async def _write_response(writer, status, headers, body, keep_alive):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+    headers = {**headers, "Content-Length": str(len(body))}
+    headers["Connection"] = "keep-alive" if keep_alive else "close"
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+class Service:
+    """
+    El servicio HTTP.
+
+    Args:
+        pool (workers.WorkerPool, optional): El pool donde se procesan las
+            imágenes. Por defecto, el compartido del proceso.
+        classify (function, optional): Recibe una lista de previsualizaciones y
+            devuelve una etiqueta por imagen. Por defecto usa `ml.classify_batch`.
+        max_pending (int, optional): Ver `settings`.
+        classify_queue (int, optional): Ver `settings`.
+        batch_size (int, optional): Ver `settings`.
+        max_wait (float, optional): Ver `settings`.
+    """
+
+    def __init__(
+        self,
+        pool=None,
+        classify=None,
+        max_pending=None,
+        classify_queue=None,
+        batch_size=None,
+        max_wait=None,
+    ):
+        self.pool = pool or workers.get_pool()
+        self.max_pending = (
+            max_pending or settings["max_pending"] or 4 * self.pool.max_workers
+        )
+        self.batcher = MicroBatcher(
+            classify or _classify_previews,
+            batch_size or settings["batch_size"],
+            settings["max_wait"] if max_wait is None else max_wait,
+            classify_queue or settings["classify_queue"],
+        )
+        self.latencies = Latencies(settings["latency_window"])
+        # Images submitted to the pool and not finished yet
+        self.pending = 0
+        # Requests holding a classification slot, from before the pool until their label
+        self.classifying = 0
+        self._server = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        El puerto en el que escucha el servidor.
+        """
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host=None, port=None):
+        """
+        Empieza a aceptar conexiones en el bucle de eventos actual.
+
+        Args:
+            host (str, optional): Por defecto es `settings["host"]`.
+            port (int, optional): Por defecto es `settings["port"]`; con 0, uno libre.
+
+        Returns:
+            asyncio.Server: El servidor.
+        """
+        self.batcher.start()
+        self._server = await asyncio.start_server(
+            self._handle,
+            host or settings["host"],
+            settings["port"] if port is None else port,
+        )
+        return self._server
+
+    async def close(self):
+        """
+        Deja de aceptar conexiones y cierra las abiertas.
+        """
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+        await self.batcher.close()
+
+    def start_in_thread(self, host=None, port=None):
+        """
+        Ejecuta el servicio en un hilo con su propio bucle de eventos, p. ej. para
+        usarlo dentro de otro programa o en las pruebas. Se detiene con `stop`.
+
+        Returns:
+            int: El puerto en el que escucha.
+        """
+        self._loop = asyncio.new_event_loop()
+        started = concurrent.futures.Future()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start(host, port))
+            except BaseException as error:
+                started.set_exception(error)
+                return
+            started.set_result(self.port)
+            try:
+                self._loop.run_forever()
+                self._loop.run_until_complete(self.close())
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="photolab-service", daemon=True)
+        self._thread.start()
+        return started.result()
+
+    def stop(self):
+        """
+        Detiene el servicio lanzado con `start_in_thread`.
+        """
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Las latencias por ruta (ver `Latencies.summary`), la ocupación de
+                  las colas y los micro-lotes de clasificación.
+        """
+        batches = dict(self.batcher.stats)
+        batches["mean_size"] = batches["items"] / batches["batches"] if batches["batches"] else 0
+        return {
+            "requests": self.latencies.summary(),
+            "queues": {
+                "pool_pending": self.pending,
+                "pool_limit": self.max_pending,
+                "classify_waiting": self.batcher.depth,
+                "classify_running": self.batcher.in_flight,
+                "classify_reserved": self.classifying,
+                "classify_limit": self.batcher.queue_size,
+            },
+            "batches": batches,
+        }
+
+    async def process(self, job):
+        """
+        Procesa (y, si se pide, clasifica) la imagen de una petición.
+
+        Returns:
+            tuple: El `pipeline.SourceResult` y la etiqueta (None si no se clasifica).
+
+        Raises:
+            Busy: Si el pool o la cola de clasificación están llenos.
+        """
+        if self.pending >= self.max_pending:
+            raise Busy("Hay demasiadas imágenes en proceso")
+        if job.classify and self.classifying >= self.batcher.queue_size:
+            # Rejected before spending a worker on it
+            raise Busy("La cola de clasificación está llena")
+        # The slot is taken before the pool, so the batcher has room once the image is done
+        if job.classify:
+            self.classifying += 1
+        try:
+            self.pending += 1
+            try:
+                future = self.pool.submit(
+                    pipeline.process_source,
+                    job.source,
+                    job.filters,
+                    job.faces,
+                    job.colors,
+                    job.output,
+                    job.format,
+                    ml.PREVIEW_SIZE if job.classify else None,
+                )
+                result = await asyncio.wrap_future(future)
+            finally:
+                self.pending -= 1
+            label = await self.batcher.submit(result.preview) if job.classify else None
+        finally:
+            if job.classify:
+                self.classifying -= 1
+        return result, label
+
+    async def _dispatch(self, request):
+        if request.path not in _ROUTES:
+            return _json(404, {"error": f"Ruta desconocida: {request.path}"})
+        if request.method != _ROUTES[request.path]:
+            return _json(405, {"error": f"Usa {_ROUTES[request.path]}"})
+        if request.path == "/health":
+            return _json(200, {"status": "ok"})
+        if request.path == "/metrics":
+            return _json(200, self.metrics())
+        try:
+            job = parse_job(request, classify=request.path == "/classify")
+            start = time.perf_counter()
+            result, label = await self.process(job)
+        except Busy as error:
+            return _json(429, {"error": str(error)}, {"Retry-After": "1"})
+        except HTTPError as error:
+            return _json(error.status, {"error": str(error)})
+        except ValueError as error:
+            return _json(400, {"error": str(error)})
+        except Exception as error:
+            return _json(500, {"error": f"{type(error).__name__}: {error}"})
+        payload = {
+            "width": result.width,
+            "height": result.height,
+            "faces_detected": result.faces_detected,
+            "colors": result.colors,
+            "label": label,
+            "category": ml.category(label) if label is not None else None,
+            "output": result.output,
+            "seconds": time.perf_counter() - start,
+        }
+        if job.format:
+            header = json.dumps(payload, ensure_ascii=True)
+            headers = {"Content-Type": _CONTENT_TYPES[job.format], "X-PhotoLab-Result": header}
+            return 200, headers, result.encoded
+        return _json(200, payload)
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as error:
+                    # The rest of the stream cannot be trusted: answer and close
+                    status, headers, body = _json(error.status, {"error": str(error)})
+                    await _write_response(writer, status, headers, body, False)
+                    break
+                except asyncio.IncompleteReadError:
+                    break
+                if request is None:
+                    break
+                start = time.perf_counter()
+                status, headers, body = await self._dispatch(request)
+                await _write_response(writer, status, headers, body, request.keep_alive)
+                # Unknown paths share one entry, so they cannot grow the metrics
+                route = request.path if request.path in _ROUTES else "other"
+                self.latencies.record(route, status, time.perf_counter() - start)
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+
+async def _serve(host, port, warmup):
+    service = Service()
+    if warmup:
+        await asyncio.get_running_loop().run_in_executor(None, ml.warmup)
+    service.pool.start()
+    await service.start(host, port)
+    print(f"PhotoLab escuchando en http://{host or settings['host']}:{service.port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    """
+    Punto de entrada de la herramienta.
+
+    Args:
+        argv (list, optional): Los argumentos de la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de PhotoLab.")
+    parser.add_argument("--host", help="La dirección (por defecto, 127.0.0.1).")
+    parser.add_argument("--port", type=int, help="El puerto (por defecto, 8765).")
+    parser.add_argument("--workers", type=int, help="Procesos del pool de filtros.")
+    parser.add_argument(
+        "--warmup", action="store_true", help="Carga el modelo CLIP antes de aceptar peticiones."
+    )
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        workers.configure(max_workers=args.workers)
+    try:
+        asyncio.run(_serve(args.host, args.port, args.warmup))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        workers.shutdown()
+
+
+if __name__ == "__main__":
+    main()
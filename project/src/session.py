@@ -0,0 +1,276 @@
+"""
+Estado de una sesión de la aplicación entre ejecuciones de Streamlit.
+
+Streamlit vuelve a ejecutar `app.py` entero en cada interacción. Para que añadir una
+imagen o cambiar un filtro no cueste rehacer todo el lote, `Session` guarda, por
+contenido de cada fichero subido (su SHA-256):
+
+- El fichero en disco, escrito una sola vez, y su miniatura, generada una sola vez
+  con una decodificación reducida.
+- La clasificación de CLIP de cada imagen, que sólo depende de la imagen original y
+  no de los filtros.
+- El resultado de cada combinación (imagen, cadena de filtros): la miniatura de la
+  imagen procesada, si se detectaron rostros y dónde se guardó. No se guardan las
+  imágenes procesadas completas, así que la memoria no crece con su resolución.
+
+`Session.process` calcula lo que falta: cada imagen (o cada grupo de casi
+duplicados, con un `dedup.Deduplicator`) recorre dos ramas independientes del
+planificador (`scheduler`):
+
+    imagen ─┬─> filtros y rostros (pool) ───────────────────┬─> guardar
+            └─> decodificar reducida ──> clasificar (CLIP) ─┘
+
+Una sesión no depende de Streamlit: la aplicación la guarda en `st.session_state`.
+"""
+import hashlib
+import os
+from collections import namedtuple
+from pathlib import Path
+
+from . import chain, io_utils, ml, pipeline, registry, scheduler
+
+# Longest side of the thumbnails of the uploaded files
+THUMBNAIL_SIZE = 100
+
+# Longest side of the thumbnails of the processed images
+RESULT_THUMBNAIL_SIZE = 200
+
+# Number of images classified together by CLIP
+CLASSIFY_BATCH_SIZE = 16
+
+# An uploaded file: `digest` is the SHA-256 of its content and `thumbnail` a small
+# BGR copy of the image (None if it could not be decoded).
+SessionFile = namedtuple("SessionFile", ["digest", "name", "path", "thumbnail"])
+
+# The result of one (image, filter chain) combination
+Processed = namedtuple("Processed", ["thumbnail", "faces_detected", "output"])
+
+
+class Session:
+    """
+    Los ficheros subidos y los resultados ya calculados de una sesión.
+
+    Args:
+        directory (str): Dónde se guardan los ficheros subidos.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.files = {}  # digest -> SessionFile
+        self.labels = {}  # digest -> CLIP label
+        self.results = {}  # (digest, chain key) -> Processed
+        self._digests = {}  # upload key -> digest
+
+    def add(self, name, data, key=None):
+        """
+        Registra un fichero subido; sólo se escribe y se reduce la primera vez.
+
+        Args:
+            name (str): El nombre del fichero.
+            data (bytes-like): Su contenido.
+            key (hashable, optional): Un identificador estable de la subida (p. ej.
+                el `file_id` de Streamlit). Si ya se vio, el contenido no se vuelve
+                a hashear.
+
+        Returns:
+            SessionFile: El fichero de la sesión. Dos subidas con el mismo contenido
+            comparten el mismo fichero (y el nombre de la primera).
+        """
+        digest = self._digests.get(key) if key is not None else None
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest()
+            if key is not None:
+                self._digests[key] = digest
+        entry = self.files.get(digest)
+        if entry is not None:
+            return entry
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # The digest in the file name keeps different files with the same name apart
+        path = self.directory / f"{digest[:16]}_{os.path.basename(name)}"
+        with open(path, "wb") as writer:
+            writer.write(data)
+        thumbnail = None
+        try:
+            preview = io_utils.load_preview(path, THUMBNAIL_SIZE)
+            if preview is not None:
+                thumbnail = io_utils.make_thumbnail(preview, THUMBNAIL_SIZE)
+        except (OSError, ValueError):
+            pass
+        entry = self.files[digest] = SessionFile(digest, name, path, thumbnail)
+        return entry
+
+    @staticmethod
+    def chain_key(selected_filters, face_detection, backend=None):
+        """
+        Devuelve la clave de una configuración de procesamiento.
+
+        Args:
+            selected_filters (list): Los filtros, con o sin parámetros.
+            face_detection (bool): Si se detectan rostros.
+            backend (str, optional): El backend de los filtros.
+
+        Returns:
+            tuple: La clave, con los filtros normalizados (los parámetros omitidos y
+                   los explícitos con su valor por defecto dan la misma clave).
+        """
+        return (
+            registry.resolve_all(selected_filters),
+            bool(face_detection),
+            backend or chain.settings["backend"],
+        )
+
+    def pending(self, files, key):
+        """
+        Devuelve los ficheros que aún no tienen resultado para una configuración.
+        """
+        return [entry for entry in files if (entry.digest, key) not in self.results]
+
+    def result(self, entry, key):
+        """
+        Devuelve el resultado de un fichero para una configuración, o None.
+        """
+        return self.results.get((entry.digest, key))
+
+    def record(self, entry, key, image, faces_detected, output=None):
+        """
+        Guarda el resultado de un fichero para una configuración.
+
+        Args:
+            entry (SessionFile): El fichero.
+            key (tuple): La configuración (ver `chain_key`).
+            image (numpy.ndarray): La imagen procesada; sólo se guarda su miniatura.
+            faces_detected (bool): Si se detectaron rostros.
+            output (str, optional): Dónde se guardó la imagen procesada.
+
+        Returns:
+            Processed: El resultado guardado.
+        """
+        processed = Processed(
+            io_utils.make_thumbnail(image, RESULT_THUMBNAIL_SIZE).copy(),
+            bool(faces_detected),
+            output,
+        )
+        self.results[(entry.digest, key)] = processed
+        return processed
+
+    def unlabeled(self, files):
+        """
+        Devuelve los ficheros que aún no tienen clasificación.
+        """
+        return [entry for entry in files if entry.digest not in self.labels]
+
+    def process(
+        self,
+        files,
+        key,
+        selected_filters,
+        face_detection,
+        output_dir,
+        deduplicator=None,
+        report=None,
+        pool=None,
+    ):
+        """
+        Procesa, clasifica y guarda los ficheros, y registra sus resultados.
+
+        Las etapas se solapan: el pool filtra unas imágenes mientras CLIP clasifica
+        otras (a partir de una decodificación reducida, sin esperar a los filtros) y
+        los hilos de E/S guardan las que ya tienen las dos cosas. Cada imagen
+        procesada se guarda en `output_dir/<categoría>/<nombre>`.
+
+        Args:
+            files (list): Los ficheros (`SessionFile`) a procesar.
+            key (tuple): La configuración (ver `chain_key`).
+            selected_filters (list): Los filtros a aplicar.
+            face_detection (bool): Si se detectan rostros.
+            output_dir (str): El directorio de salida.
+            deduplicator (dedup.Deduplicator, optional): Si se indica, sólo el
+                representante de cada grupo de casi duplicados se filtra y se
+                clasifica; su imagen y su etiqueta valen para todo el grupo.
+            report (instrument.Report, optional): Dónde acumular la medición de las
+                etapas.
+            pool (workers.WorkerPool, optional): El pool a usar. Por defecto es el
+                pool persistente compartido.
+
+        Yields:
+            tuple: Cada fichero con su resultado (`Processed`) o con la excepción
+                   que impidió procesarlo, en el orden en que terminan.
+        """
+        files = list(files)
+        if deduplicator is not None:
+            groups = deduplicator.clusters([entry.path for entry in files])
+        else:
+            groups = [[index] for index in range(len(files))]
+        groups = [[files[index] for index in group] for group in groups]
+        output_dir = Path(output_dir)
+
+        def preview(index, inputs):
+            # Labels depend on the original image only, so each group goes through
+            # CLIP once per session, whatever the filters
+            if not self.unlabeled(groups[index]):
+                return None
+            representative = groups[index][0]
+            image = io_utils.load_preview(representative.path, ml.PREVIEW_SIZE)
+            if image is None:
+                raise ValueError(f"No se pudo leer {representative.name}")
+            return image
+
+        def classify(batch):
+            previews = [
+                (groups[index], inputs["preview"])
+                for index, inputs in batch
+                if inputs["preview"] is not None
+            ]
+            if previews:
+                labels = ml.classify_batch([image for _, image in previews])
+                for (group, _), (label,) in zip(previews, labels):
+                    for entry in self.unlabeled(group):
+                        self.labels[entry.digest] = label
+            return [None] * len(batch)
+
+        def save(index, inputs):
+            outputs = []
+            for entry in groups[index]:
+                category = ml.category(self.labels[entry.digest])
+                destination = output_dir / category / entry.name
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                if not io_utils.save_image(inputs["filters"].image, destination):
+                    raise OSError(f"No se pudo escribir {destination}")
+                outputs.append(str(destination))
+            return outputs
+
+        results = pipeline.iter_pipeline(
+            [group[0].path for group in groups],
+            selected_filters,
+            face_detection,
+            pool=pool,
+            report=report,
+        )
+        stages = scheduler.Scheduler(report)
+        # The pipeline keeps its own order and pool, so it joins as a stream
+        stages.add_stream(
+            "filters",
+            (
+                (result.index, result if result.error is None else result.error)
+                for result in results
+            ),
+        )
+        stages.add("preview", preview, workers=io_utils.settings["writers"])
+        stages.add("classify", classify, after=("preview",), batch_size=CLASSIFY_BATCH_SIZE)
+        stages.add(
+            "save",
+            save,
+            after=("filters", "classify"),
+            workers=io_utils.settings["writers"],
+            queue_size=io_utils.settings["write_queue"],
+        )
+        for outcome in stages.run(enumerate(groups)):
+            group = groups[outcome.key]
+            if outcome.error is not None:
+                for entry in group:
+                    yield entry, outcome.error
+                continue
+            result = outcome.values["filters"]
+            for entry, output in zip(group, outcome.values["save"]):
+                yield entry, self.record(entry, key, result.image, result.faces_detected, output)
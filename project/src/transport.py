@@ -0,0 +1,152 @@
+"""
+Transporte de imágenes entre los workers del pipeline y el proceso padre.
+
+Por defecto (`"copy"`) cada imagen procesada vuelve al padre serializada con pickle
+por la tubería del `ProcessPoolExecutor`: se copia en el worker, viaja por el pipe y
+se vuelve a copiar en el padre. Para imágenes grandes y filtros rápidos ese costo
+domina.
+
+Con los transportes `"shm"` y `"mmap"` el worker escribe los píxeles una sola vez en
+un fichero de un directorio temporal y devuelve sólo un descriptor (`SharedImage`).
+El padre proyecta el fichero en memoria y recibe una vista de los píxeles, sin
+copiarlos:
+
+- `"shm"` usa `/dev/shm`, el tmpfs en RAM sobre el que Linux implementa
+  `multiprocessing.shared_memory`; si no existe, se comporta como `"mmap"`.
+- `"mmap"` usa un directorio temporal en disco (`PHOTOLAB_SCRATCH_DIR`), útil cuando
+  la RAM compartida es escasa.
+
+Ciclo de vida: el padre borra el fichero en cuanto lo proyecta, así que la memoria se
+libera sola cuando desaparece la última vista de la imagen. Los descriptores que
+nunca llegan a importarse (un lote abandonado a medias) se descartan con `discard`,
+y `sweep` elimina los restos de un proceso al terminar.
+"""
+import atexit
+import os
+import tempfile
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+TRANSPORTS = ("copy", "shm", "mmap")
+
+SHM_DIRECTORY = Path("/dev/shm")
+
+settings = {
+    "transport": os.environ.get("PHOTOLAB_TRANSPORT", "copy"),
+    "scratch_directory": os.environ.get(
+        "PHOTOLAB_SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "photolab")
+    ),
+}
+
+# Descriptor of an image left in a scratch file by a worker
+SharedImage = namedtuple("SharedImage", ["path", "shape", "dtype"])
+
+
+def directory_for(transport):
+    """
+    Devuelve el directorio donde un transporte deja las imágenes.
+
+    Args:
+        transport (str): "shm" o "mmap".
+
+    Returns:
+        pathlib.Path: El directorio (creado si no existía).
+
+    Raises:
+        ValueError: Si el transporte no es válido o no usa ficheros.
+    """
+    if transport not in TRANSPORTS[1:]:
+        raise ValueError(
+            f"Transporte desconocido: {transport!r} (opciones: {', '.join(TRANSPORTS)})"
+        )
+    directory = _location(transport)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _location(transport):
+    if transport == "shm" and SHM_DIRECTORY.is_dir():
+        return SHM_DIRECTORY / "photolab"
+    return Path(settings["scratch_directory"])
+
+
+def owner_prefix(pid=None):
+    """
+    Devuelve el prefijo de los ficheros destinados a un proceso padre.
+    """
+    return f"photolab-{pid or os.getpid()}-"
+
+
+def export_image(image, directory, prefix):
+    """
+    Escribe una imagen en un fichero temporal (lado del worker).
+
+    Args:
+        image (numpy.ndarray): La imagen a exportar.
+        directory (str): El directorio de destino (ver `directory_for`).
+        prefix (str): El prefijo del proceso que la importará (ver `owner_prefix`).
+
+    Returns:
+        SharedImage: El descriptor de la imagen.
+    """
+    image = np.ascontiguousarray(image)
+    path = Path(directory) / f"{prefix}{uuid.uuid4().hex}.raw"
+    with open(path, "xb") as writer:
+        writer.write(memoryview(image).cast("B"))
+    return SharedImage(str(path), image.shape, image.dtype.str)
+
+
+def import_image(shared):
+    """
+    Proyecta en memoria una imagen exportada (lado del padre).
+
+    El fichero se borra enseguida: la proyección sigue siendo válida y la memoria
+    se libera cuando se libera la última vista del array devuelto.
+
+    Args:
+        shared (SharedImage): El descriptor devuelto por `export_image`.
+
+    Returns:
+        numpy.ndarray: Una vista modificable de los píxeles.
+    """
+    if not shared.shape or 0 in shared.shape:
+        discard(shared)
+        return np.empty(shared.shape, dtype=shared.dtype)
+    mapped = np.memmap(shared.path, dtype=shared.dtype, mode="r+", shape=shared.shape)
+    discard(shared)
+    return mapped.view(np.ndarray)
+
+
+def discard(shared):
+    """
+    Borra el fichero de una imagen exportada que no se va a importar.
+    """
+    try:
+        os.unlink(shared.path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep(pid=None):
+    """
+    Borra los ficheros pendientes destinados a un proceso.
+
+    Args:
+        pid (int, optional): El proceso padre. Por defecto es el actual.
+
+    Returns:
+        int: El número de ficheros borrados.
+    """
+    removed = 0
+    prefix = owner_prefix(pid)
+    for directory in {_location(transport) for transport in TRANSPORTS[1:]}:
+        for path in directory.glob(f"{prefix}*.raw"):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+atexit.register(sweep)
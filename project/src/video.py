@@ -0,0 +1,358 @@
+"""
+Procesamiento de vídeos y de flujos de fotogramas.
+
+Aplica a cada fotograma los mismos filtros (`chain.apply_chain`) y la misma
+detección de rostros (`detect.detect_faces`) que el pipeline de imágenes, sin
+volcar los fotogramas a disco:
+
+- Un hilo lector decodifica el vídeo con `cv2.VideoCapture` y deja los fotogramas
+  en una cola acotada (`read_frames`). Con `step` sólo se conserva uno de cada
+  `step` fotogramas; los demás se saltan sin convertirlos.
+- Los fotogramas se procesan en paralelo en un pool de hilos (OpenCV libera el GIL
+  en los filtros y en la cascada), con un número acotado de fotogramas en vuelo, y
+  se entregan en orden (`process_frames`).
+- Con `detect_every`, la cascada sólo se ejecuta en uno de cada `detect_every`
+  fotogramas; los intermedios se recuadran con las cajas de la última detección.
+- `process_video` vuelve a codificar los fotogramas con `cv2.VideoWriter`.
+
+La memoria no depende de la duración del vídeo: como mucho hay `queue_size`
+fotogramas decodificados esperando y `in_flight` en proceso o por escribir. Los
+fotogramas no pasan por la caché, porque no se repiten.
+
+Uso (desde el directorio `project/`):
+
+    python -m src.video entrada.mp4 salida.mp4 --filters "Gaussian Blur" --faces
+    python -m src.video entrada.mp4 salida.mp4 --faces --detect-every 5 --step 2
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from . import chain, detect, registry
+
+settings = {
+    # Threads that process frames (0: one per core)
+    "workers": int(os.environ.get("PHOTOLAB_VIDEO_WORKERS", 0)),
+    # Decoded frames waiting to be processed
+    "queue_size": int(os.environ.get("PHOTOLAB_VIDEO_QUEUE_SIZE", 8)),
+    # FourCC of the output videos
+    "codec": os.environ.get("PHOTOLAB_VIDEO_CODEC", "mp4v"),
+}
+
+# One processed frame: `index` is its position in the stream, `faces` the boxes
+# drawn on it (None without face detection) and `detected` whether the cascade ran
+# on this frame or the boxes were carried over from the last frame where it did.
+Frame = namedtuple("Frame", ["index", "image", "faces", "detected"])
+
+VideoInfo = namedtuple("VideoInfo", ["fps", "frames", "width", "height"])
+
+_NO_FACES = np.empty((0, 4), dtype=np.int32)
+
+# Marks the end of the frames in the reader's queue
+_END = object()
+
+
+def _open(source):
+    capture = cv2.VideoCapture(str(source))
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el vídeo: {source}")
+    return capture
+
+
+def video_info(source):
+    """
+    Devuelve los fotogramas por segundo, el número de fotogramas y el tamaño de un
+    vídeo, según su cabecera.
+
+    Raises:
+        ValueError: Si el vídeo no se puede abrir.
+    """
+    capture = _open(source)
+    try:
+        return VideoInfo(
+            capture.get(cv2.CAP_PROP_FPS),
+            int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+            int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+    finally:
+        capture.release()
+
+
+def read_frames(source, step=1, queue_size=None):
+    """
+    Decodifica un vídeo en un hilo aparte y entrega sus fotogramas.
+
+    Args:
+        source (str): La ruta (o cualquier fuente que acepte `cv2.VideoCapture`).
+        step (int, optional): Se entrega uno de cada `step` fotogramas.
+        queue_size (int, optional): Los fotogramas decodificados que pueden esperar
+            a ser consumidos. Por defecto es `settings["queue_size"]`.
+
+    Yields:
+        numpy.ndarray: Los fotogramas BGR, en orden.
+
+    Raises:
+        ValueError: Si el vídeo no se puede abrir.
+    """
+    step = max(1, step)
+    capture = _open(source)
+    frames = queue.Queue(maxsize=max(1, queue_size or settings["queue_size"]))
+    stop = threading.Event()
+
+    def put(item):
+        # Waits for room in the queue, unless the consumer went away
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read():
+        try:
+            index = 0
+            while not stop.is_set():
+                if index % step:
+                    # Skipped frames are demuxed and decoded but not converted to BGR
+                    if not capture.grab():
+                        break
+                else:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    put(frame)
+                index += 1
+        except Exception as error:
+            put(error)
+        finally:
+            capture.release()
+            put(_END)
+
+    reader = threading.Thread(target=read, name="photolab-video-reader", daemon=True)
+    reader.start()
+    try:
+        while (item := frames.get()) is not _END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+def _process_frame(image, selected_filters, face_detection, backend):
+    image = chain.apply_chain(image, selected_filters, backend, cached=False)
+    faces = None
+    if face_detection:
+        _, faces = detect.detect_faces(image, annotate=False, cached=False)
+    return image, faces
+
+
+def process_frames(
+    frames,
+    selected_filters=(),
+    face_detection=False,
+    detect_every=1,
+    workers=None,
+    in_flight=None,
+    backend=None,
+):
+    """
+    Aplica los filtros y la detección de rostros a un flujo de fotogramas.
+
+    Args:
+        frames (iterable): Los fotogramas BGR (p. ej. `read_frames`, o los de una
+            cámara). Se consumen a medida que hay hueco.
+        selected_filters (list, optional): Los filtros a aplicar: nombres o pares
+            `(nombre, {parámetro: valor})` (ver `registry`).
+        face_detection (bool, optional): Si se detectan y recuadran rostros.
+        detect_every (int, optional): La cascada se ejecuta en uno de cada
+            `detect_every` fotogramas; los demás llevan las cajas de la última
+            detección. Por defecto, en todos.
+        workers (int, optional): Los hilos de proceso. Por defecto es
+            `settings["workers"]` (o uno por núcleo).
+        in_flight (int, optional): Los fotogramas en proceso o esperando a ser
+            entregados en orden. Por defecto, el doble de `workers`.
+        backend (str, optional): El backend de los filtros, "exact" o "fast".
+
+    Yields:
+        Frame: Los fotogramas procesados, en el orden de entrada.
+    """
+    selected_filters = registry.resolve_all(selected_filters)
+    detect_every = max(1, detect_every)
+    workers = workers or settings["workers"] or os.cpu_count()
+    in_flight = max(1, in_flight or 2 * workers)
+    pending = deque()
+    submitted = 0
+    faces = _NO_FACES if face_detection else None
+    with ThreadPoolExecutor(workers, thread_name_prefix="photolab-video") as executor:
+        try:
+            frames = iter(frames)
+            while True:
+                # Keep the pool busy, but with a bounded number of frames in memory
+                while len(pending) < in_flight:
+                    image = next(frames, None)
+                    if image is None:
+                        break
+                    detected = face_detection and submitted % detect_every == 0
+                    future = executor.submit(
+                        _process_frame, image, selected_filters, detected, backend
+                    )
+                    pending.append((submitted, detected, future))
+                    submitted += 1
+                if not pending:
+                    return
+                index, detected, future = pending.popleft()
+                image, found = future.result()
+                if detected:
+                    faces = found
+                if face_detection and len(faces):
+                    image = detect.draw_faces(image, faces)
+                yield Frame(index, image, faces, detected)
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
+def process_video(
+    source,
+    output,
+    selected_filters=(),
+    face_detection=False,
+    step=1,
+    detect_every=1,
+    workers=None,
+    queue_size=None,
+    backend=None,
+    codec=None,
+):
+    """
+    Procesa un vídeo fotograma a fotograma y escribe el resultado en otro vídeo.
+
+    Args:
+        source (str): El vídeo de entrada.
+        output (str): El vídeo de salida; su contenedor lo decide la extensión.
+        selected_filters (list, optional): Los filtros a aplicar (ver `registry`).
+        face_detection (bool, optional): Si se detectan y recuadran rostros.
+        step (int, optional): Se procesa uno de cada `step` fotogramas; la salida
+            tiene `step` veces menos fotogramas por segundo y dura lo mismo.
+        detect_every (int, optional): Ver `process_frames`.
+        workers (int, optional): Los hilos de proceso (ver `process_frames`).
+        queue_size (int, optional): Ver `read_frames`.
+        backend (str, optional): El backend de los filtros, "exact" o "fast".
+        codec (str, optional): El FourCC de la salida. Por defecto es
+            `settings["codec"]`.
+
+    Returns:
+        dict: El resumen: fotogramas escritos, fotogramas en los que se ejecutó la
+              cascada, fotogramas con rostros, segundos y fotogramas por segundo.
+
+    Raises:
+        ValueError: Si el vídeo de entrada no se puede abrir o el de salida no se
+            puede crear.
+    """
+    step = max(1, step)
+    fps = video_info(source).fps or 30.0
+    fourcc = cv2.VideoWriter_fourcc(*(codec or settings["codec"]))
+    writer = None
+    summary = {"frames": 0, "detected": 0, "with_faces": 0}
+    start = time.perf_counter()
+    decoded = read_frames(source, step, queue_size)
+    frames = process_frames(
+        decoded, selected_filters, face_detection, detect_every, workers, backend=backend
+    )
+    try:
+        for frame in frames:
+            if writer is None:
+                # The size and the colour mode are those of the first processed frame
+                height, width = frame.image.shape[:2]
+                is_color = frame.image.ndim == 3
+                writer = cv2.VideoWriter(
+                    str(output), fourcc, fps / step, (width, height), is_color
+                )
+                if not writer.isOpened():
+                    raise ValueError(f"No se pudo crear el vídeo: {output}")
+            writer.write(frame.image)
+            summary["frames"] += 1
+            summary["detected"] += frame.detected
+            summary["with_faces"] += frame.faces is not None and len(frame.faces) > 0
+    finally:
+        # Stops the workers and the reader thread if the loop ended early
+        frames.close()
+        decoded.close()
+        if writer is not None:
+            writer.release()
+    summary["seconds"] = time.perf_counter() - start
+    summary["fps"] = summary["frames"] / summary["seconds"] if summary["seconds"] else 0.0
+    return summary
+
+
+def main(argv=None):
+    """
+    Punto de entrada de la herramienta.
+
+    Args:
+        argv (list, optional): Los argumentos de la línea de comandos.
+    """
+    parser = argparse.ArgumentParser(
+        description="Aplica los filtros y la detección de rostros a un vídeo."
+    )
+    parser.add_argument("source", help="El vídeo de entrada.")
+    parser.add_argument("output", help="El vídeo de salida.")
+    parser.add_argument(
+        "--filters",
+        nargs="*",
+        default=[],
+        metavar="FILTRO",
+        help='Los filtros a aplicar, con parámetros opcionales: "Canny:low_threshold=50".',
+    )
+    parser.add_argument("--faces", action="store_true", help="Detecta y recuadra rostros.")
+    parser.add_argument(
+        "--step", type=int, default=1, help="Procesa uno de cada N fotogramas."
+    )
+    parser.add_argument(
+        "--detect-every",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Busca rostros en uno de cada N fotogramas y mantiene las cajas en los demás.",
+    )
+    parser.add_argument("--workers", type=int, help="Hilos de proceso.")
+    parser.add_argument(
+        "--backend",
+        choices=chain.BACKENDS,
+        help="El backend de los filtros (por defecto, PHOTOLAB_FILTER_BACKEND o exact).",
+    )
+    parser.add_argument("--codec", help="El FourCC de la salida (por defecto, mp4v).")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = process_video(
+            args.source,
+            args.output,
+            [registry.parse(text) for text in args.filters],
+            face_detection=args.faces,
+            step=args.step,
+            detect_every=args.detect_every,
+            workers=args.workers,
+            backend=args.backend,
+            codec=args.codec,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    print(
+        f"{summary['frames']} fotogramas en {summary['seconds']:.1f} s "
+        f"({summary['fps']:.1f} fotogramas/s); rostros en {summary['with_faces']}."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Pool persistente de procesos para el pipeline.
+
+Crear un `ProcessPoolExecutor` por lote obliga a arrancar e importar todo en cada
+worker cada vez que se pulsa "Procesar". Este módulo mantiene un pool de larga vida
+que se arranca la primera vez que se necesita y sobrevive a las re-ejecuciones de
+Streamlit (los módulos de `src` no se recargan entre re-ejecuciones).
+
+Los workers se crean por defecto con el método `spawn`: arrancan un intérprete
+limpio que sólo importa el código de filtros y detección (nunca el modelo CLIP de
+`ml`), y su inicializador deja cargado el clasificador de rostros. La configuración
+se toma de variables de entorno o de `configure`:
+
+- `PHOTOLAB_WORKERS`: el número de procesos (por defecto `os.cpu_count()`).
+- `PHOTOLAB_CHUNKSIZE`: las imágenes que se envían a un worker por tarea.
+- `PHOTOLAB_MAX_TASKS_PER_CHILD`: las tareas tras las que se recicla un worker.
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+settings = {
+    "max_workers": int(os.environ.get("PHOTOLAB_WORKERS", 0)) or os.cpu_count(),
+    "chunksize": int(os.environ.get("PHOTOLAB_CHUNKSIZE", 1)),
+    "max_tasks_per_child": int(os.environ.get("PHOTOLAB_MAX_TASKS_PER_CHILD", 0)) or None,
+    "start_method": os.environ.get("PHOTOLAB_START_METHOD", "spawn"),
+}
+
+
+def _init_worker():
+    """
+    Inicializa un worker: importa el código que necesita y evita sobresuscribir la CPU.
+    """
+    import cv2
+
+    # Each worker is one of cpu_count() processes; OpenCV's own thread pool would
+    # only compete with the other workers for the same cores.
+    cv2.setNumThreads(1)
+
+    from . import chain, detect  # noqa: F401
+
+    detect.warmup()
+
+
+def _ping():
+    """
+    Tarea vacía usada para forzar el arranque de los workers.
+    """
+    return os.getpid()
+
+
+class WorkerPool:
+    """
+    Un `ProcessPoolExecutor` que se crea al primer uso y se reutiliza entre lotes.
+
+    Args:
+        max_workers (int, optional): El número de procesos.
+        chunksize (int, optional): Las imágenes agrupadas en cada tarea.
+        max_tasks_per_child (int, optional): Las tareas que ejecuta cada worker
+            antes de ser reemplazado por uno nuevo. Por defecto no se reciclan.
+        start_method (str, optional): El método de arranque de `multiprocessing`.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        chunksize=None,
+        max_tasks_per_child=None,
+        start_method=None,
+    ):
+        self.max_workers = max_workers or settings["max_workers"]
+        self.chunksize = max(1, chunksize or settings["chunksize"])
+        self.max_tasks_per_child = max_tasks_per_child or settings["max_tasks_per_child"]
+        self.start_method = start_method or settings["start_method"]
+        self._executor = None
+        self._broken = False
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """
+        El `ProcessPoolExecutor` subyacente, creándolo (o recreándolo si se rompió).
+        """
+        with self._lock:
+            if self._executor is None or self._broken:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+                self._broken = False
+            return self._executor
+
+    @property
+    def started(self):
+        return self._executor is not None
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Envía una tarea al pool.
+
+        Returns:
+            concurrent.futures.Future: El futuro de la tarea.
+        """
+        executor = self.executor
+        try:
+            future = executor.submit(function, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer); start a fresh pool
+            self._mark_broken(executor)
+            executor = self.executor
+            future = executor.submit(function, *args, **kwargs)
+        future.add_done_callback(lambda done: self._check_result(executor, done))
+        return future
+
+    def _check_result(self, executor, future):
+        """
+        Marca el pool como roto si la tarea falló porque murió un worker.
+
+        Args:
+            executor (ProcessPoolExecutor): El executor que ejecutó la tarea.
+            future (concurrent.futures.Future): El futuro ya terminado.
+        """
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._mark_broken(executor)
+
+    def _mark_broken(self, executor):
+        """
+        Hace que el siguiente uso reemplace `executor`, si sigue siendo el actual.
+        """
+        with self._lock:
+            if executor is self._executor:
+                self._broken = True
+
+    def start(self):
+        """
+        Arranca los workers en segundo plano, sin esperar a que estén listos.
+
+        Returns:
+            list: Los futuros de las tareas de arranque.
+        """
+        return [self.submit(_ping) for _ in range(self.max_workers)]
+
+    def warmup(self, timeout=None):
+        """
+        Arranca los workers y espera a que todos estén inicializados.
+
+        Args:
+            timeout (float, optional): El tiempo máximo de espera en segundos.
+        """
+        wait(self.start(), timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Detiene los workers, cancelando las tareas que aún no empezaron.
+
+        Args:
+            wait (bool, optional): Si se espera a que terminen las tareas en curso.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Devuelve el pool compartido del proceso, creándolo con la configuración actual.
+
+    Returns:
+        WorkerPool: El pool compartido.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+def configure(max_workers=None, chunksize=None, max_tasks_per_child=None, start_method=None):
+    """
+    Cambia la configuración del pool compartido.
+
+    El pool actual (si existe) se detiene; el siguiente uso arranca uno nuevo con la
+    configuración actualizada. Los argumentos omitidos conservan su valor actual.
+    """
+    global _pool
+    updates = {
+        "max_workers": max_workers,
+        "chunksize": chunksize,
+        "max_tasks_per_child": max_tasks_per_child,
+        "start_method": start_method,
+    }
+    settings.update({name: value for name, value in updates.items() if value is not None})
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def shutdown():
+    """
+    Detiene el pool compartido, si está en marcha.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+atexit.register(shutdown)
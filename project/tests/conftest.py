@@ -0,0 +1,19 @@
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    """Eight distinct images plus an unreadable file in the middle."""
+    paths = []
+    for index in range(8):
+        path = tmp_path / f"image_{index}.png"
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        cv2.circle(image, (32, 32), 4 + 3 * index, (255, 255, 255), -1)
+        cv2.imwrite(str(path), image)
+        paths.append(path)
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    paths.insert(4, broken)
+    return paths
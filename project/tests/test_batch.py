@@ -0,0 +1,120 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+from project.src import batch
+from project.src import ml
+from project.src import workers
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2, chunksize=2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def photo_tree(tmp_path):
+    """A nested directory of images, with an unreadable image and a non-image file."""
+    root = tmp_path / "photos"
+    for index, relative in enumerate(["a.png", "b.jpg", "trip/c.png", "trip/day2/d.png"]):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        image = np.zeros((48, 64, 3), dtype=np.uint8)
+        cv2.circle(image, (32, 24), 5 + 4 * index, (255, 255, 255), -1)
+        cv2.imwrite(str(path), image)
+    (root / "trip" / "broken.png").write_bytes(b"not an image")
+    (root / "notes.txt").write_text("not an image either")
+    return root
+
+
+def manifest_entries(output):
+    with open(output / batch.MANIFEST_NAME, encoding="utf-8") as reader:
+        return [json.loads(line) for line in reader]
+
+
+def test_iter_image_paths_walks_tree_lazily(photo_tree):
+    """Tests the recursive, sorted walk and the glob sources."""
+    found = [str(relative) for _, relative in batch.iter_image_paths([photo_tree])]
+    assert found == ["a.png", "b.jpg", "trip/broken.png", "trip/c.png", "trip/day2/d.png"]
+
+    pattern = str(photo_tree / "**" / "*.png")
+    found = sorted(str(relative) for _, relative in batch.iter_image_paths([pattern]))
+    assert found == ["a.png", "trip/broken.png", "trip/c.png", "trip/day2/d.png"]
+
+
+def test_run_batch_writes_tree_and_manifest(pool, photo_tree, tmp_path):
+    """Tests the output layout, the error capture and the summary."""
+    output = tmp_path / "output"
+
+    summary = batch.run_batch([photo_tree], output, ["Sobel"], classify=False, pool=pool)
+
+    assert summary["processed"] == 4 and summary["failed"] == 1 and summary["skipped"] == 0
+    assert (output / "trip" / "day2" / "d.png").exists()
+    assert (output / "b.jpg").exists()
+    entries = {entry["path"]: entry for entry in manifest_entries(output)}
+    assert len(entries) == 5
+    assert "error" in entries[str(photo_tree / "trip" / "broken.png")]
+
+
+def test_run_batch_resumes_interrupted_run(pool, photo_tree, tmp_path):
+    """Tests that finished images are skipped and that failures can be retried."""
+    output = tmp_path / "output"
+    output.mkdir()
+    # An interrupted run: two images finished, the last line cut short
+    with open(output / batch.MANIFEST_NAME, "w", encoding="utf-8") as writer:
+        for name in ["a.png", "trip/broken.png"]:
+            error = "unreadable" if "broken" in name else None
+            writer.write(json.dumps({"path": str(photo_tree / name), "error": error}) + "\n")
+        writer.write('{"path": "')
+
+    summary = batch.run_batch([photo_tree], output, [], classify=False, pool=pool)
+
+    assert summary == {**summary, "processed": 3, "failed": 0, "skipped": 2}
+    assert not (output / "a.png").exists()
+
+    summary = batch.run_batch(
+        [photo_tree], output, [], classify=False, retry_failed=True, pool=pool
+    )
+    assert summary == {**summary, "processed": 0, "failed": 1, "skipped": 4}
+
+
+def test_manifest_matches_paths_however_they_are_given(pool, photo_tree, tmp_path):
+    """Tests that a run resumes when its source is spelled differently."""
+    output = tmp_path / "output"
+
+    summary = batch.run_batch([photo_tree / ".." / "photos"], output, [], classify=False, pool=pool)
+    assert summary["processed"] == 4
+
+    summary = batch.run_batch([photo_tree], output, [], classify=False, pool=pool)
+    assert summary == {**summary, "processed": 0, "failed": 0, "skipped": 5}
+    assert all(".." not in entry["path"] for entry in manifest_entries(output))
+
+def test_run_batch_sorts_by_classification(pool, photo_tree, tmp_path, monkeypatch):
+    """Tests the output/<classification>/ layout."""
+    monkeypatch.setattr(
+        ml,
+        "classify_batch",
+        lambda images, store=None, names=None: [
+            [ml.LABELS[0] if image.mean() > 5 else ml.LABELS[2]] for image in images
+        ],
+    )
+    output = tmp_path / "output"
+
+    summary = batch.run_batch([photo_tree], output, [], pool=pool)
+
+    assert summary["processed"] == 4
+    written = sorted(p.relative_to(output).as_posix() for p in output.rglob("*.*g"))
+    assert all(path.split("/")[0] in {"person", "abstract drawing"} for path in written)
+    labels = {entry.get("classification") for entry in manifest_entries(output)}
+    assert labels <= {ml.LABELS[0], ml.LABELS[2], None}
+
+
+def test_main_rejects_unknown_filter(photo_tree, tmp_path, capsys):
+    """Tests that the CLI validates the filter names before starting."""
+    with pytest.raises(SystemExit):
+        batch.main([str(photo_tree), "--output", str(tmp_path / "out"), "--filters", "Blur"])
+    assert "Blur" in capsys.readouterr().err
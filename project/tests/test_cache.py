@@ -0,0 +1,213 @@
+import time
+
+import numpy as np
+import pytest
+from project.src import cache
+from project.src import filters
+
+
+def test_key_is_content_addressed():
+    """Tests that equal arrays share a key and different pixels do not."""
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    same = image.copy()
+    other = image.copy()
+    other[0, 0, 0] = 1
+
+    key = filters.apply_sobel.key_for(image)
+    assert key == filters.apply_sobel.key_for(same)
+    assert key != filters.apply_sobel.key_for(other)
+
+    # The key never embeds the raw pixel buffer
+    assert len(key) < 200
+
+
+def test_key_includes_shape_and_dtype():
+    """Tests that arrays with the same bytes but different geometry do not collide."""
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    keys = {
+        filters.apply_sharpen.key_for(image),
+        filters.apply_sharpen.key_for(image.reshape(6, 4, 3)),
+        filters.apply_sharpen.key_for(image.view(np.int8)),
+    }
+    assert len(keys) == 3
+
+
+def test_key_normalizes_defaults_and_keeps_params_readable():
+    """Tests that default arguments are bound and small params stay readable."""
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    implicit = filters.apply_gaussian_blur.key_for(image)
+    explicit = filters.apply_gaussian_blur.key_for(image, kernel_size=(5, 5))
+
+    assert implicit == explicit
+    assert "kernel_size=(5, 5)" in implicit
+    assert implicit.startswith("filters.apply_gaussian_blur@")
+
+
+def test_version_tag_invalidates_entries():
+    """Tests that changing a function's version changes its keys."""
+
+    def identity(image):
+        return image
+
+    image = np.zeros((2, 2), dtype=np.uint8)
+    v1 = cache.memoize(version="1")(identity)
+    v2 = cache.memoize(version="2")(identity)
+
+    assert v1.key_for(image) != v2.key_for(image)
+    assert "@1(" in v1.key_for(image)
+
+
+def test_memoize_round_trip():
+    """Tests that a memoized call returns the stored result on the second call."""
+    calls = []
+
+    @cache.memoize(version="test")
+    def count_calls(value, k=5):
+        calls.append(value)
+        return value * k
+
+    token = np.random.default_rng().integers(0, 2**31)
+    assert count_calls(token) == token * 5
+    assert count_calls(token, k=5) == token * 5
+    assert len(calls) == 1
+    cache.cache.delete(count_calls.key_for(token))
+
+
+@pytest.fixture
+def small_cache(tmp_path):
+    """Points the cache at a temporary, 1 MiB directory for the duration of a test."""
+    previous = dict(cache.settings)
+    cache.configure(directory=str(tmp_path), size_limit=2**20, max_entry_size=2**19)
+    yield cache
+    cache.configure(**previous)
+
+
+def test_size_limit_evicts_and_counts(small_cache):
+    """Tests that the cache stays under its size limit and records evictions."""
+
+    @cache.memoize(version="test")
+    def make_block(seed):
+        return np.full((256, 512), seed % 256, dtype=np.uint8)  # 128 KiB
+
+    for seed in range(20):
+        make_block(seed)
+
+    assert cache.cache.volume() <= 2**20
+    stats = cache.read_stats()[cache.function_name(make_block)]
+    assert stats["misses"] == 20
+    assert stats["evictions"] > 0
+
+
+def test_expire_removes_entries_past_their_ttl(small_cache):
+    """Tests that expired entries are removed and counted as evictions of their function."""
+    cache.configure(eviction_policy="ttl", ttl=0.05)
+
+    @cache.memoize(version="test")
+    def make_row(seed):
+        return np.arange(seed, seed + 16, dtype=np.int64)
+
+    make_row(1)
+    make_row(2)
+    time.sleep(0.1)
+
+    assert cache.expire() == 2
+    assert len(cache.cache) == 0
+    assert cache.read_stats()[cache.function_name(make_row)]["evictions"] == 2
+
+
+def test_max_entry_size_skips_large_results(small_cache):
+    """Tests that results bigger than max_entry_size are returned but not stored."""
+
+    @cache.memoize(version="test")
+    def make_large():
+        return np.zeros(2**20, dtype=np.uint8)
+
+    assert make_large().nbytes == 2**20
+    assert make_large.key_for() not in cache.cache
+    assert cache.read_stats()[cache.function_name(make_large)]["skipped"] == 1
+
+
+def test_hits_and_prune(small_cache):
+    """Tests hit and bytes-served counters and pruning the entries of one function."""
+
+    @cache.memoize(version="test")
+    def make_row(seed):
+        return np.arange(seed, seed + 16, dtype=np.int64)
+
+    make_row(1)
+    make_row(1)
+    make_row(2)
+    name = cache.function_name(make_row)
+    stats = cache.read_stats()[name]
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["bytes_served"] == 16 * 8
+
+    assert cache.prune(name) == 2
+    assert len(cache.cache) == 0
+
+
+def test_clear_stale_removes_old_versions(small_cache):
+    """Tests that clear_stale drops entries of versions that are no longer current."""
+
+    def payload(seed):
+        return seed
+
+    old = cache.memoize(version="1")(payload)
+    old(7)
+    new = cache.memoize(version="2")(payload)
+    new(7)
+
+    assert cache.clear_stale() == 1
+    assert new.key_for(7) in cache.cache
+    assert old.key_for(7) not in cache.cache
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    """Tests that the memory tier evicts least recently used entries by size."""
+    tier = cache.MemoryTier(max_bytes=300)
+    for name in ("a", "b", "c"):
+        tier.put(name, cache._freeze(np.zeros(100, dtype=np.uint8)))
+    tier.get("a")
+    tier.put("d", cache._freeze(np.zeros(100, dtype=np.uint8)))
+
+    assert "a" in tier and "b" not in tier
+    assert tier.nbytes == 300
+
+    # Entries bigger than the whole tier are never stored
+    tier.put("e", np.zeros(301, dtype=np.uint8))
+    assert "e" not in tier
+
+
+def test_memory_tier_serves_hits_without_disk(small_cache):
+    """Tests that repeated calls are served from memory and return independent copies."""
+
+    @cache.memoize(version="test")
+    def make_image(seed):
+        return np.full((32, 32, 3), seed, dtype=np.uint8)
+
+    first = make_image(3)
+    cache.cache.clear()
+    second = make_image(3)
+    second[:] = 0
+    third = make_image(3)
+
+    assert (first == 3).all() and (third == 3).all()
+    stats = cache.read_stats()[cache.function_name(make_image)]
+    assert (stats["misses"], stats["memory_hits"]) == (1, 2)
+
+
+def test_disk_hits_are_promoted_and_arrays_skip_pickle(small_cache):
+    """Tests that disk hits are promoted to memory and arrays round-trip as .npy."""
+
+    @cache.memoize(version="test")
+    def make_image(seed):
+        return np.full((64, 256, 3), seed, dtype=np.uint8)
+
+    expected = make_image(5)
+    cache.memory.clear()
+
+    assert (make_image(5) == expected).all()
+    assert make_image.key_for(5) in cache.memory
+    assert list(cache.cache._sql("SELECT DISTINCT mode FROM Cache")) == [
+        (cache.MODE_NDARRAY,)
+    ]
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from pathlib import Path
+from project.src import chain
+from project.src import fast_filters
+from project.src import filters
+from project.src import io_utils
+
+# Define the paths for the test image and golden images
+TEST_IMAGE_PATH = Path("project/data/test_image.png")
+COLOR_TEST_IMAGE_PATH = Path("project/data/color_test_image.png")
+GOLDEN_IMAGE_DIR = Path("project/data/golden_images")
+
+GOLDEN_IMAGES = {
+    "Sobel": "sobel.png",
+    "Canny": "canny.png",
+    "Gaussian Blur": "gaussian_blur.png",
+    "Sharpen": "sharpen.png",
+}
+
+SEQUENTIAL = {
+    "Sobel": filters.apply_sobel,
+    "Canny": filters.apply_canny,
+    "Gaussian Blur": filters.apply_gaussian_blur,
+    "Sharpen": filters.apply_sharpen,
+}
+
+
+@pytest.mark.parametrize("filter_name", sorted(GOLDEN_IMAGES))
+def test_single_filter_matches_golden_image(filter_name):
+    """Tests that a one-filter chain is pixel-identical to its golden image."""
+    image = io_utils.load_image(TEST_IMAGE_PATH)
+    golden_image = io_utils.load_image(GOLDEN_IMAGE_DIR / GOLDEN_IMAGES[filter_name])
+
+    assert (chain.run_plan(image, chain.plan([filter_name])) == golden_image).all()
+
+
+@pytest.mark.parametrize(
+    "filter_names",
+    [
+        ["Sobel", "Gaussian Blur"],
+        ["Gaussian Blur", "Canny", "Sharpen"],
+        ["Sharpen", "Sobel", "Canny", "Gaussian Blur"],
+        ["Canny", "Sobel", "Sharpen", "Gaussian Blur", "Sobel"],
+    ],
+)
+def test_chain_matches_sequential_filters(filter_names):
+    """Tests that fused chains are pixel-identical to applying each filter in turn."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    expected = image
+    for filter_name in filter_names:
+        expected = SEQUENTIAL[filter_name](expected)
+
+    assert (chain.apply_chain(image, filter_names) == expected).all()
+
+
+def test_plan_removes_redundant_conversions():
+    """Tests that the chain stays in gray once a filter produces a gray image."""
+    steps = chain.plan(["Sobel", "Canny", "Gaussian Blur", "Random Hue Shift"])
+
+    # One conversion in, one out, and the hue shift of a gray image is dropped
+    names = [getattr(step, "name", step) for step in steps]
+    assert names == ["to_gray", "Sobel", "Canny", "Gaussian Blur", "to_bgr"]
+    assert chain.is_deterministic(steps)
+
+
+def test_random_chain_is_not_cached():
+    """Tests that chains with a random filter keep running the filter."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    steps = chain.plan(["Gaussian Blur", "Random Hue Shift"])
+
+    assert not chain.is_deterministic(steps)
+    assert chain.apply_chain(image, ["Gaussian Blur", "Random Hue Shift"]).shape == image.shape
+
+
+def test_unknown_filter_is_rejected():
+    """Tests that the planner rejects filters it does not know."""
+    with pytest.raises(ValueError):
+        chain.plan(["Sobel", "Emboss"])
+
+
+@pytest.mark.parametrize("filter_name", sorted(GOLDEN_IMAGES))
+def test_fast_backend_matches_golden_image_within_tolerance(filter_name):
+    """Tests the fast backend against the golden images, within its documented tolerance."""
+    image = io_utils.load_image(TEST_IMAGE_PATH)
+    golden_image = io_utils.load_image(GOLDEN_IMAGE_DIR / GOLDEN_IMAGES[filter_name])
+
+    result = chain.run_plan(image, chain.plan([filter_name]), backend="fast")
+
+    difference = np.abs(result.astype(np.int16) - golden_image)
+    assert difference.max() <= fast_filters.TOLERANCE
+
+
+def test_fast_hue_shift_matches_exact_backend():
+    """Tests that the lookup-table hue shift equals the HSV arithmetic, for every shift."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    steps = chain.plan(["Random Hue Shift"])
+    for seed in range(20):
+        np.random.seed(seed)
+        exact = chain.run_plan(image, steps, backend="exact")
+        np.random.seed(seed)
+        assert (chain.run_plan(image, steps, backend="fast") == exact).all()
+        np.random.seed(seed)
+        assert (filters.apply_random_hue_shift(image) == exact).all()
+
+
+def test_fast_sobel_on_flat_image():
+    """Tests that a flat image has no edges (instead of dividing by zero)."""
+    image = np.full((32, 32, 3), 90, dtype=np.uint8)
+
+    assert not chain.run_plan(image, chain.plan(["Sobel"]), backend="fast").any()
+
+
+def test_backend_is_part_of_the_cache_key():
+    """Tests that both backends can be used on the same image without mixing results."""
+    image = io_utils.load_image(TEST_IMAGE_PATH)
+    exact = chain.apply_chain(image, ["Sobel"], backend="exact")
+    fast = chain.apply_chain(image, ["Sobel"], backend="fast")
+
+    assert (exact == chain.run_plan(image, chain.plan(["Sobel"]), backend="exact")).all()
+    assert (fast == chain.run_plan(image, chain.plan(["Sobel"]), backend="fast")).all()
+    with pytest.raises(ValueError):
+        chain.apply_chain(image, ["Sobel"], backend="turbo")
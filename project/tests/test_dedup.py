@@ -0,0 +1,150 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+from project.src import batch
+from project.src import dedup
+from project.src import workers
+from project.profiling.common import near_duplicates, synthetic_photo
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2, chunksize=2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def burst(tmp_path):
+    """Three distinct photos, each followed by its near-duplicate variants, plus a broken file."""
+    paths = []
+    for seed in range(3):
+        original = synthetic_photo(320, 240, seed)
+        for number, image in enumerate([original] + near_duplicates(original)):
+            path = tmp_path / f"photo_{seed}_{number}.png"
+            cv2.imwrite(str(path), image)
+            paths.append(path)
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    paths.insert(7, broken)
+    return paths
+
+
+@pytest.mark.parametrize("method", dedup.HASH_METHODS)
+def test_hashes_separate_duplicates_from_distinct_photos(method):
+    """Tests that variants of a photo hash close together and distinct photos far apart."""
+    hash_images = dedup._HASHES[method]
+    groups = []
+    for seed in range(6):
+        original = synthetic_photo(320, 240, seed)
+        variants = [original] + near_duplicates(original)
+        groups.append([int(value) for value in hash_images(variants)])
+
+    for group in groups:
+        assert max(dedup.hamming(group[0], value) for value in group) <= 10
+    for first, second in zip(groups, groups[1:]):
+        assert dedup.hamming(first[0], second[0]) > 16
+
+
+@pytest.mark.parametrize("radius", [0, 4, 10])
+def test_multi_index_matches_brute_force(radius):
+    """Tests the multi-index search against comparing every pair."""
+    rng = np.random.default_rng(0)
+    # Clustered keys, so that searches find several neighbours
+    centers = rng.integers(0, 2**63, 20, dtype=np.uint64)
+    flips = rng.integers(0, 64, (400, 6))
+    keys = [int(centers[i % 20]) ^ sum(1 << int(bit) for bit in flips[i]) for i in range(400)]
+    index = dedup.MultiIndex(radius)
+    for value, key in enumerate(keys):
+        index.add(key, value)
+
+    assert len(index) == 400
+    for query in keys[:50] + [int(key) ^ 0b1011 for key in keys[50:60]]:
+        expected = sorted(
+            (dedup.hamming(query, key), value)
+            for value, key in enumerate(keys)
+            if dedup.hamming(query, key) <= radius
+        )
+        assert index.search(query) == expected
+
+
+def test_clusters_and_stats(burst):
+    """Tests the groups, their representatives and the per-run statistics."""
+    deduplicator = dedup.Deduplicator(threshold=8)
+
+    groups = deduplicator.clusters(burst)
+
+    assert [7] in groups
+    assert sorted(len(group) for group in groups) == [1, 5, 5, 5]
+    for group in groups:
+        # Every member comes from the same original photo
+        assert len({burst[i].stem[:7] for i in group}) == 1
+        assert group[0] == min(group)
+    assert deduplicator.stats["duplicates"] == 12 and deduplicator.stats["unique"] == 4
+    assert deduplicator.stats["hashed"] == 15 and deduplicator.stats["from_index"] == 0
+
+    assert len(dedup.Deduplicator(threshold=0).clusters(burst)) > 4
+    assert dedup.find_duplicates(burst, threshold=8)[0][0] == burst[0]
+
+
+def test_index_persists_hashes(burst, tmp_path):
+    """Tests that a second run reuses the saved hashes and that a changed file is rehashed."""
+    index_path = tmp_path / "index" / "hashes.json"
+    first = dedup.Deduplicator(threshold=8, index=str(index_path))
+    expected = first.clusters(burst)
+    assert first.stats["hashed"] == 15
+
+    second = dedup.Deduplicator(threshold=8, index=str(index_path))
+    assert second.clusters(burst) == expected
+    assert second.stats["hashed"] == 0 and second.stats["from_index"] == 15
+
+    cv2.imwrite(str(burst[0]), synthetic_photo(320, 240, 99))
+    os.utime(burst[0], ns=(0, 0))
+    third = dedup.Deduplicator(threshold=8, index=dedup.HashIndex(index_path))
+    third.clusters(burst)
+    assert third.stats["hashed"] == 1
+    readable = burst[:7] + burst[8:]
+    assert set(json.loads(index_path.read_text())) == {str(path) for path in readable}
+
+
+def test_invalid_settings_are_rejected():
+    """Tests the validation of the method and the threshold."""
+    with pytest.raises(ValueError):
+        dedup.Deduplicator(method="ahash")
+    with pytest.raises(ValueError):
+        dedup.Deduplicator(threshold=64)
+
+
+def test_iter_pipeline_fans_results_out(pool, burst):
+    """Tests that only representatives are processed and every member gets their result."""
+    deduplicator = dedup.Deduplicator(threshold=8)
+
+    results = list(deduplicator.iter_pipeline(burst, ["Sobel"], False, pool=pool))
+
+    assert sorted(result.index for result in results) == list(range(len(burst)))
+    by_index = {result.index: result for result in results}
+    for index, result in by_index.items():
+        assert result.path == burst[index]
+        assert result.image is by_index[deduplicator.representative[index]].image
+    assert sum(result.error is not None for result in results) == 1
+
+
+def test_run_batch_marks_duplicates(pool, burst, tmp_path):
+    """Tests the batch integration: every image is written, duplicates are marked."""
+    output = tmp_path / "output"
+
+    summary = batch.run_batch(
+        burst, output, ["Sharpen"], classify=False, pool=pool, dedup_threshold=8
+    )
+
+    assert summary["processed"] == 15 and summary["failed"] == 1
+    assert summary["dedup"]["duplicates"] == 12
+    with open(output / batch.MANIFEST_NAME, encoding="utf-8") as reader:
+        entries = {entry["path"]: entry for entry in map(json.loads, reader)}
+    assert entries[str(burst[1])]["duplicate_of"] == str(burst[0])
+    assert "duplicate_of" not in entries[str(burst[0])]
+    assert (output / burst[1].name).exists()
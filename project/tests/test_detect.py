@@ -1,8 +1,10 @@
 import cv2
+import numpy as np
 import pytest
 from pathlib import Path
 from project.src import detect
 from project.src import io_utils
+from project.tests.faces import recall, synthetic_faces
 
 # Define the paths for the test image and golden images
 TEST_IMAGE_PATH = Path("project/data/test_image.png")
@@ -25,3 +27,124 @@ def test_get_dominant_colors():
     # We expect two dominant colors: black and white
     # Note: The order is not guaranteed
     assert ([0, 0, 0] in colors) and ([255, 255, 255] in colors)
+    # Without a mode, the result is the exact one
+    assert (colors == detect.get_dominant_colors.__wrapped__(image, k=2, mode="exact")).all()
+
+
+COLOR_TEST_IMAGE_PATH = Path("project/data/color_test_image.png")
+
+
+def blob_image(seed=1):
+    """A smooth, photo-like image: blurred noise upscaled to 640x360."""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (36, 64, 3), dtype=np.uint8)
+    return cv2.resize(cv2.GaussianBlur(noise, (0, 0), 3), (640, 360))
+
+
+def quantization_error(image, colors):
+    """Mean squared distance from every pixel to its nearest dominant color."""
+    pixels = image.reshape(-1, 1, 3).astype(np.float32)
+    distances = ((pixels - colors[None].astype(np.float32)) ** 2).sum(axis=2)
+    return distances.min(axis=1).mean()
+
+
+@pytest.mark.parametrize("mode", ["sample", "histogram"])
+def test_fast_dominant_colors_match_exact_result(mode):
+    """Tests the fast modes against exact k-means on the color test image."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    exact = detect.get_dominant_colors.__wrapped__(image, k=2, mode="exact")
+
+    fast = detect.get_dominant_colors.__wrapped__(image, k=2, mode=mode, sample_size=500)
+
+    assert sorted(map(tuple, fast)) == sorted(map(tuple, exact))
+
+
+@pytest.mark.parametrize("mode", ["sample", "histogram"])
+def test_fast_dominant_colors_are_accurate(mode):
+    """Tests that the fast modes quantize a photo-like image about as well as exact k-means."""
+    image = blob_image()
+    exact = detect.get_dominant_colors.__wrapped__(image, k=5, mode="exact")
+
+    fast = detect.get_dominant_colors.__wrapped__(image, k=5, mode=mode)
+
+    assert quantization_error(image, fast) <= 1.1 * quantization_error(image, exact)
+
+
+def test_dominant_colors_are_deterministic():
+    """Tests that repeated calls give the same colors, so the result can be cached."""
+    image = blob_image(seed=2)
+    for mode in detect.COLOR_MODES:
+        first = detect.get_dominant_colors.__wrapped__(image, k=4, mode=mode)
+        assert (detect.get_dominant_colors.__wrapped__(image, k=4, mode=mode) == first).all()
+
+
+def test_dominant_colors_batch_matches_single_calls():
+    """Tests that the batch variant returns one result per image, in order."""
+    images = [blob_image(seed) for seed in range(3)]
+
+    colors = detect.get_dominant_colors_batch(images, k=3, max_workers=2)
+
+    for image, result in zip(images, colors):
+        assert (result == detect.get_dominant_colors(image, k=3)).all()
+
+
+def test_dominant_colors_rejects_bad_options():
+    """Tests the validation of the mode and of the histogram size."""
+    image = blob_image()
+    with pytest.raises(ValueError):
+        detect.get_dominant_colors.__wrapped__(image, mode="fast")
+    with pytest.raises(ValueError):
+        detect.get_dominant_colors.__wrapped__(image, mode="histogram", bins=30)
+
+
+@pytest.fixture(scope="module")
+def face_photo():
+    return synthetic_faces(1600, 1200, [70, 110, 160, 220, 300], seed=3)
+
+
+def test_detect_faces_does_not_modify_input(face_photo):
+    """Tests that boxes are returned as data and only a copy is annotated."""
+    image, truth = face_photo
+    original = image.copy()
+
+    annotated, faces = detect.detect_faces(image)
+
+    assert (image == original).all()
+    assert faces.dtype == np.int32 and faces.shape == (len(truth), 4)
+    assert (annotated != image).any()
+
+
+@pytest.mark.parametrize("max_side", [1024, 640])
+def test_downsampled_detection_keeps_recall(face_photo, max_side):
+    """Tests that a reduced working resolution finds the faces of the full-size run."""
+    image, truth = face_photo
+    full = detect.find_faces(image)
+
+    reduced = detect.find_faces(image, max_side=max_side)
+
+    assert recall(full, truth) == 1.0
+    assert recall(reduced, truth) >= recall(full, truth)
+
+
+def test_face_size_limits(face_photo):
+    """Tests that min_size and max_size are expressed in original pixels."""
+    image, truth = face_photo
+
+    faces = detect.find_faces(image, max_side=800, min_size=190, max_size=260)
+
+    assert ((faces[:, 2] >= 190) & (faces[:, 2] <= 260)).all()
+    assert recall(faces, truth[truth[:, 2] == 220]) == 1.0
+    assert recall(faces, truth[truth[:, 2] <= 110]) == 0.0
+
+
+def test_detect_faces_batch_matches_single_calls(face_photo):
+    """Tests the batch API, including grayscale inputs and repeated sizes."""
+    image, _ = face_photo
+    images = [image, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), image[:600, :800]]
+
+    batch = detect.detect_faces_batch(images, max_side=640)
+
+    for single, faces in zip(images, batch):
+        assert (faces == detect.find_faces.__wrapped__(single, max_side=640)).all()
+    with pytest.raises(TypeError):
+        detect.detect_faces(image, min_neighbours=3)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from project.src import embeddings
+
+
+def unit_vectors(count, dim=32, seed=0, centers=None):
+    """Random unit vectors, scattered around `centers` random directions if given."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    if centers:
+        directions = rng.normal(size=(centers, dim)).astype(np.float32)
+        vectors = directions[rng.integers(0, centers, count)] * 3 + vectors
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_store_appends_and_reopens(tmp_path):
+    """Tests incremental appends, the digest de-duplication and reopening from disk."""
+    vectors = unit_vectors(10)
+    store = embeddings.EmbeddingStore(tmp_path / "store", model="clip")
+    assert len(store) == 0 and store.search(vectors[0]) == []
+
+    assert store.add([f"d{i}" for i in range(6)], vectors[:6], [f"{i}.png" for i in range(6)]) == 6
+    # Already stored and repeated digests are skipped
+    assert store.add(["d5", "d6", "d6"], vectors[5:8], ["x", "6.png", "y"]) == 1
+
+    reopened = embeddings.EmbeddingStore(tmp_path / "store")
+    assert len(reopened) == 7 and reopened.model == "clip"
+    assert reopened.names == [f"{i}.png" for i in range(7)]
+    assert "d6" in reopened and "d7" not in reopened
+    assert isinstance(reopened.matrix, np.memmap) and reopened.matrix.dtype == np.float16
+    np.testing.assert_allclose(reopened.get("d3"), vectors[3], atol=1e-3)
+    with pytest.raises(ValueError):
+        embeddings.EmbeddingStore(tmp_path / "store", model="other")
+    with pytest.raises(ValueError):
+        reopened.add(["z"], unit_vectors(1, dim=8))
+
+
+def test_interrupted_append_is_dropped(tmp_path):
+    """Tests that a row without its id line, or a cut id line, is ignored and overwritten."""
+    vectors = unit_vectors(4)
+    store = embeddings.EmbeddingStore(tmp_path)
+    store.add(["a", "b"], vectors[:2])
+    # An append cut short: a vector without its id line and half a line
+    with open(tmp_path / embeddings.VECTORS_NAME, "ab") as writer:
+        writer.write(vectors[2].astype(np.float16).tobytes())
+    with open(tmp_path / embeddings.IDS_NAME, "ab") as writer:
+        writer.write(b"c\tpart")
+
+    store = embeddings.EmbeddingStore(tmp_path)
+    assert store.digests == ["a", "b"]
+    store.add(["d"], vectors[3:])
+
+    store = embeddings.EmbeddingStore(tmp_path)
+    assert store.digests == ["a", "b", "d"]
+    np.testing.assert_allclose(store.get("d"), vectors[3], atol=1e-3)
+
+
+def test_exact_and_approximate_search(tmp_path):
+    """Tests the top-k search against brute force, and the recall of the approximate index."""
+    vectors = unit_vectors(3000, centers=40)
+    store = embeddings.EmbeddingStore(tmp_path)
+    store.add([str(i) for i in range(len(vectors))], vectors)
+    queries = unit_vectors(20, seed=1, centers=40)
+    expected = np.argsort(-(queries @ store.matrix.astype(np.float32).T), axis=1)[:, :10]
+
+    results = store.search(queries, k=10, approximate=False)
+    assert [[int(name) for name, _ in result] for result in results] == expected.tolist()
+    single = store.search(queries[0], k=3, approximate=False)
+    assert [name for name, _ in single] == [name for name, _ in results[0][:3]]
+    assert single[0][1] >= single[1][1] >= single[2][1]
+
+    approximate = store.search(queries, k=10, approximate=True, probes=8)
+    found = [{int(name) for name, _ in result} for result in approximate]
+    recall = np.mean([len(hits & set(row)) / 10 for hits, row in zip(found, expected)])
+    assert recall > 0.9
+
+    # Rows appended after training are searchable without retraining
+    store.add(["new"], queries[:1])
+    assert store.search(queries[0], k=1, approximate=True)[0][0] == "new"
+
+
+def test_classify_relabels_every_row(tmp_path):
+    """Tests zero-shot re-labelling against a new label set from the stored vectors."""
+    vectors = unit_vectors(50)
+    store = embeddings.EmbeddingStore(tmp_path)
+    store.add([str(i) for i in range(50)], vectors)
+    text = unit_vectors(3, seed=2)
+
+    labels = store.classify(text, ["x", "y", "z"])
+
+    expected = (store.matrix.astype(np.float32) @ text.T).argmax(axis=1)
+    assert labels == [["x", "y", "z"][index] for index in expected]
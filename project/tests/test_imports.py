@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+HEAVY_MODULES = ("torch", "transformers", "sklearn")
+
+# The repository root, where the `project` package is importable from
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def environment(**variables):
+    """The caller's environment without PHOTOLAB_CACHE_DIR, with `project` importable."""
+    env = {name: value for name, value in os.environ.items() if name != "PHOTOLAB_CACHE_DIR"}
+    return {**env, "PYTHONPATH": str(ROOT), **variables}
+
+
+@pytest.mark.parametrize(
+    "module", ["project.src.pipeline", "project.src.ml", "project.src.detect"]
+)
+def test_import_is_lazy(module, tmp_path):
+    """Tests that importing a module loads no model and does not open the cache."""
+    code = (
+        "import sys\n"
+        f"import {module}\n"
+        "from project.src import cache, detect\n"
+        f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])\n"
+        "print(cache.cache is None, detect._face_cascade is None)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=environment(PHOTOLAB_CACHE_DIR=str(tmp_path / "cache")),
+    )
+
+    assert output.stdout.splitlines() == ["[]", "True True"]
+    assert not (tmp_path / "cache").exists()
+
+
+def test_cache_directory_does_not_depend_on_working_directory(tmp_path):
+    """Tests that the default cache location is anchored to the project."""
+    code = "from project.src import cache; print(cache.settings['directory'])"
+    root, elsewhere = (
+        subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=cwd,
+            env=environment(),
+        ).stdout
+        for cwd in (ROOT, tmp_path)
+    )
+
+    assert root == elsewhere
+    assert root.strip().endswith("project/cache")
@@ -0,0 +1,111 @@
+import json
+
+import numpy as np
+import pytest
+from project.src import cache
+from project.src import instrument
+from project.src import pipeline
+from project.src import workers
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2, chunksize=2)
+    yield pool
+    pool.shutdown()
+
+
+@cache.memoize
+def double(value):
+    return value * 2
+
+
+def test_disabled_stages_record_nothing():
+    """Tests that outside a recording stages are the shared no-op object."""
+    stage = instrument.stage("decode", bytes_in=10)
+
+    assert stage is instrument._NULL_STAGE
+    with stage as span:
+        span.bytes_out = 20
+    instrument.cache_event(hit=True)
+    assert not instrument.is_recording()
+
+
+def test_nested_stages_and_cache_events():
+    """Tests the parents, the cache counters and the summary of nested stages."""
+    spans = []
+    token = np.random.default_rng().integers(0, 2**62)
+    with instrument.recording(spans, image=3):
+        with instrument.stage("filters", bytes_in=100) as span:
+            double(token)
+            double(token)
+            span.bytes_out = 50
+        with instrument.stage("faces", image=4):
+            pass
+
+    by_stage = {}
+    for item in spans:
+        by_stage.setdefault(item.stage, []).append(item)
+    (filters,) = by_stage["filters"]
+    assert (filters.image, filters.parent) == (3, None)
+    assert (filters.bytes_in, filters.bytes_out) == (100, 50)
+    assert (filters.cache_hits, filters.cache_misses) == (1, 1)
+    assert [item.parent for item in by_stage["cache_lookup"]] == ["filters", "filters"]
+    assert by_stage["faces"][0].image == 4
+    assert len(by_stage["cache_store"]) == 1
+
+    report = instrument.Report()
+    report.extend(spans)
+    summary = {row["stage"]: row for row in report.summary()}
+    assert summary["cache_lookup"]["count"] == 2
+    top_level = [row for row in summary.values() if row["parent"] is None]
+    assert sum(row["share"] for row in top_level) == pytest.approx(1)
+    assert "cache_lookup" in report.format()
+
+
+def test_pipeline_report_covers_every_stage(pool, image_paths):
+    """Tests that worker stages come back with the results and are aggregated in the parent."""
+    report = instrument.Report()
+
+    results = list(
+        pipeline.iter_pipeline(
+            image_paths, ["Sobel"], True, pool=pool, preview_size=16, report=report
+        )
+    )
+
+    summary = {row["stage"]: row for row in report.summary()}
+    readable = len(image_paths) - 1
+    assert summary["decode"]["count"] == len(image_paths)
+    for stage in ("preview", "filters", "faces"):
+        assert summary[stage]["count"] == readable
+    assert summary["queue"]["count"] == len(image_paths)
+    assert summary["transfer"]["count"] == -(-len(image_paths) // pool.chunksize)
+    assert summary["transfer"]["bytes_in"] >= sum(
+        result.image.nbytes for result in results if result.error is None
+    )
+    assert summary["filters"]["cache_hits"] + summary["filters"]["cache_misses"] == readable
+    for result in results:
+        assert {item.image for item in result.spans} == {result.index}
+        assert all(item.wall >= 0 and item.cpu >= 0 for item in result.spans)
+
+    plain = list(pipeline.iter_pipeline(image_paths, ["Sobel"], False, pool=pool))
+    assert all(result.spans is None for result in plain)
+
+
+def test_exports(tmp_path):
+    """Tests the JSON and Chrome trace exports."""
+    report = instrument.Report()
+    with instrument.recording(report, image=0):
+        with instrument.stage("decode"):
+            pass
+    report.append(instrument.span(None, "transfer", 1.5, 0.25, bytes_in=64))
+
+    saved = json.loads(report.to_json())
+    assert [row["stage"] for row in saved["summary"]] == ["decode", "transfer"]
+    assert saved["spans"][1]["bytes_in"] == 64
+
+    report.to_chrome_trace(tmp_path / "trace.json")
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [event["ph"] for event in events] == ["X", "X"]
+    assert events[1]["ts"] == 1.5e6 and events[1]["dur"] == 0.25e6 and events[1]["tid"] == 0
@@ -0,0 +1,90 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from project.src import io_utils
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """A 640x480 JPEG with some structure."""
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.rectangle(image, (100, 80), (540, 400), (40, 160, 220), -1)
+    cv2.circle(image, (320, 240), 120, (255, 255, 255), -1)
+    path = tmp_path / "photo.jpg"
+    cv2.imwrite(str(path), image)
+    return path
+
+
+def test_load_image_reduced_decode(photo):
+    """Tests the decode at 1/2, 1/4 and 1/8 of the resolution."""
+    for reduce in (1, 2, 4, 8):
+        assert io_utils.load_image(photo, reduce).shape == (480 // reduce, 640 // reduce, 3)
+    with pytest.raises(ValueError):
+        io_utils.load_image(photo, 3)
+
+
+def test_load_preview_picks_smallest_sufficient_reduction(photo):
+    """Tests that the preview keeps a short side of at least `min_side`."""
+    assert io_utils.load_preview(photo, 224).shape == (240, 320, 3)
+    assert io_utils.load_preview(photo, 100).shape == (120, 160, 3)
+    assert io_utils.load_preview(photo, 1000).shape == (480, 640, 3)
+    assert io_utils.make_preview(io_utils.load_image(photo), 240).shape == (240, 320, 3)
+
+
+def test_encode_params_follow_settings(monkeypatch):
+    """Tests the per-format encode parameters."""
+    monkeypatch.setitem(io_utils.settings, "jpeg_quality", 80)
+    monkeypatch.setitem(io_utils.settings, "png_compression", None)
+
+    assert io_utils.encode_params("a/b.JPG") == [cv2.IMWRITE_JPEG_QUALITY, 80]
+    assert io_utils.encode_params("a/b.png") == []
+    assert io_utils.encode_params("a/b.bmp") == []
+
+
+def test_encode_and_decode_in_memory(photo):
+    """Tests the in-memory round trip used for uploads."""
+    image = io_utils.load_image(photo)
+
+    data = io_utils.encode_image(image, "png")
+
+    np.testing.assert_array_equal(io_utils.decode_image(data), image)
+    assert io_utils.decode_image(b"") is None
+    assert io_utils.decode_image(b"not an image") is None
+    with pytest.raises(ValueError):
+        io_utils.encode_image(image, ".nope")
+
+
+def test_image_writer_writes_everything_on_flush(tmp_path):
+    """Tests the background writes, the directory creation and the failures."""
+    image = np.full((32, 32, 3), 128, dtype=np.uint8)
+    with io_utils.ImageWriter(max_workers=2, max_pending=3) as writer:
+        futures = [writer.write(image, tmp_path / "out" / f"{i}.png") for i in range(10)]
+        writer.write(image, tmp_path / "bad.unknown-extension")
+        failures = writer.flush()
+
+        assert all(future.done() for future in futures)
+        assert len(failures) == 1 and isinstance(failures[0], Exception)
+        assert len(list((tmp_path / "out").iterdir())) == 10
+        assert writer.flush() == []
+
+
+def test_image_writer_bounds_pending_images(tmp_path, monkeypatch):
+    """Tests that `write` blocks while the queue is full."""
+    release = threading.Event()
+    monkeypatch.setattr(io_utils, "_write", lambda *args: release.wait())
+    writer = io_utils.ImageWriter(max_workers=1, max_pending=2)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    writer.write(image, tmp_path / "a.png")
+    writer.write(image, tmp_path / "b.png")
+
+    blocked = threading.Thread(target=writer.write, args=(image, tmp_path / "c.png"))
+    blocked.start()
+    blocked.join(timeout=0.2)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+    writer.close()
@@ -0,0 +1,179 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from transformers import (
+    CLIPConfig,
+    CLIPImageProcessor,
+    CLIPModel,
+    CLIPProcessor,
+    CLIPTokenizer,
+)
+
+from project.src import embeddings
+from project.src import ml
+
+
+@pytest.fixture(scope="module")
+def tiny_clip(tmp_path_factory):
+    """A randomly initialised, tiny CLIP model with a character-level tokenizer."""
+    directory = tmp_path_factory.mktemp("tiny_clip")
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    for char in "abcdefghijklmnopqrstuvwxyz":
+        vocab[char] = len(vocab)
+        vocab[char + "</w>"] = len(vocab)
+    (directory / "vocab.json").write_text(json.dumps(vocab))
+    (directory / "merges.txt").write_text("#version: 0.2\n")
+    tokenizer = CLIPTokenizer(
+        vocab_file=str(directory / "vocab.json"), merges_file=str(directory / "merges.txt")
+    )
+    image_processor = CLIPImageProcessor(
+        size={"shortest_edge": 32}, crop_size={"height": 32, "width": 32}
+    )
+    processor = CLIPProcessor(image_processor=image_processor, tokenizer=tokenizer)
+
+    layers = dict(hidden_size=32, intermediate_size=37, num_hidden_layers=2, num_attention_heads=4)
+    config = CLIPConfig(
+        text_config=dict(vocab_size=len(vocab), bos_token_id=0, eos_token_id=1, **layers),
+        vision_config=dict(image_size=32, patch_size=8, **layers),
+        projection_dim=16,
+    )
+    torch.manual_seed(0)
+    return CLIPModel(config).eval(), processor
+
+
+def random_images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (40, 48, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def full_forward(model, processor, labels, images):
+    """The original single-pass classification, used as the reference."""
+    inputs = processor(
+        text=labels,
+        images=[Image.fromarray(image) for image in images],
+        return_tensors="pt",
+        padding=True,
+    )
+    with torch.no_grad():
+        return model(**inputs).logits_per_image.softmax(dim=1).numpy()
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 16])
+def test_classifier_matches_full_forward(tiny_clip, batch_size):
+    """Tests that micro-batched inference matches one forward pass over everything."""
+    model, processor = tiny_clip
+    images = random_images(7)
+    classifier = ml.ClipClassifier(model, processor, batch_size=batch_size)
+
+    expected = full_forward(model, processor, ml.LABELS, images)
+
+    np.testing.assert_allclose(classifier.predict(images), expected, rtol=1e-4, atol=1e-6)
+    assert classifier.classify(images) == [ml.LABELS[i] for i in expected.argmax(axis=1)]
+
+
+def test_image_embeddings_are_cached(tiny_clip, monkeypatch):
+    """Tests that re-classifying the same images does not run the vision tower."""
+    model, processor = tiny_clip
+    images = random_images(4)
+    classifier = ml.ClipClassifier(model, processor, batch_size=2)
+    calls = []
+    forward = model.get_image_features
+    monkeypatch.setattr(
+        model, "get_image_features", lambda **kwargs: calls.append(1) or forward(**kwargs)
+    )
+
+    first = classifier.predict(images + [images[0].copy()])
+    assert len(calls) == 2
+    second = classifier.predict(images)
+
+    assert len(calls) == 2
+    np.testing.assert_array_equal(first[:4], second)
+
+
+def test_set_labels_reuses_model_and_embeddings(tiny_clip):
+    """Tests swapping the label set without recomputing image embeddings."""
+    model, processor = tiny_clip
+    images = random_images(3)
+    classifier = ml.ClipClassifier(model, processor)
+    classifier.classify(images)
+    cached = len(classifier.embeddings)
+
+    classifier.set_labels(["a cat", "a dog"])
+
+    assert classifier.text_embeddings.shape[0] == 2
+    assert len(classifier.embeddings) == cached
+    assert set(classifier.classify(images)) <= {"a cat", "a dog"}
+    np.testing.assert_allclose(
+        classifier.predict(images),
+        full_forward(model, processor, ["a cat", "a dog"], images),
+        rtol=1e-4,
+        atol=1e-6,
+    )
+    with pytest.raises(ValueError):
+        classifier.set_labels([])
+
+
+def test_model_loads_on_first_classification(tiny_clip, monkeypatch):
+    """Tests that the shared classifier is only built when it is first needed."""
+    loads = []
+    monkeypatch.setattr(ml, "_classifier", None)
+    monkeypatch.setattr(ml, "load_model", lambda: loads.append(1) or tiny_clip)
+    assert not ml.is_loaded()
+
+    labels = ml.classify_batch(random_images(2))
+    ml.classify_batch(random_images(2, seed=1))
+
+    assert len(loads) == 1
+    assert ml.is_loaded()
+    assert all(len(label) == 1 and label[0] in ml.LABELS for label in labels)
+
+
+@pytest.mark.parametrize("backend", ["int8", "torchscript"])
+def test_backends_agree_with_fp32(tiny_clip, backend):
+    """Tests that the optimized backends give the fp32 embeddings and top-1 labels."""
+    model, processor = tiny_clip
+    images = random_images(16, seed=2)
+    reference = ml.ClipClassifier(model, processor, cache_size=0)
+    optimized = ml.ClipClassifier(model, processor, cache_size=0, backend=backend)
+
+    expected = reference.embed_images(images)
+    embeddings = optimized.embed_images(images)
+
+    assert embeddings.dtype == np.float32 and embeddings.shape == expected.shape
+    if backend == "torchscript":
+        np.testing.assert_allclose(embeddings, expected, rtol=1e-4, atol=1e-5)
+    else:
+        assert (embeddings * expected).sum(axis=1).min() > 0.99
+    agreement = np.mean(
+        np.array(optimized.classify(images)) == np.array(reference.classify(images))
+    )
+    assert agreement >= 0.9
+    # The model itself is left untouched in fp32
+    assert isinstance(model.visual_projection, torch.nn.Linear)
+
+
+def test_unknown_backend(tiny_clip):
+    """Tests that an unknown backend is rejected."""
+    with pytest.raises(ValueError):
+        ml.ClipClassifier(*tiny_clip, backend="tpu")
+
+
+def test_classify_batch_stores_embeddings(tiny_clip, monkeypatch, tmp_path):
+    """Tests that stored embeddings re-label the images like the model does."""
+    monkeypatch.setattr(ml, "_classifier", ml.ClipClassifier(*tiny_clip))
+    store = embeddings.EmbeddingStore(tmp_path)
+    images = random_images(5, seed=3)
+
+    labels = ml.classify_batch(images, store=store, names=[f"{i}.png" for i in range(5)])
+    ml.classify_batch(images[:2], store=store)
+
+    assert len(store) == 5 and store.names[4] == "4.png"
+    assert store.classify(ml._classifier.text_embeddings, ml.LABELS) == [
+        label for (label,) in labels
+    ]
+    new_labels = ["a cat", "a dog"]
+    relabelled = store.classify(ml._classifier.embed_texts(new_labels), new_labels)
+    assert relabelled == ml.ClipClassifier(*tiny_clip, labels=new_labels).classify(images)
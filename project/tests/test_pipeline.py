@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+from pathlib import Path
+from project.src import io_utils
+from project.src import pipeline
+from project.src import workers
+
+# Define the paths for the test image and golden images
+TEST_IMAGE_PATH = Path("project/data/test_image.png")
+GOLDEN_IMAGE_DIR = Path("project/data/golden_images")
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2, chunksize=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_iter_pipeline_preserves_order_and_captures_errors(pool, image_paths):
+    """Tests ordered results and per-item error capture."""
+    results = list(
+        pipeline.iter_pipeline(image_paths, ["Sobel"], False, max_in_flight=4, pool=pool)
+    )
+
+    assert [r.index for r in results] == list(range(len(image_paths)))
+    assert [r.path for r in results] == image_paths
+    assert isinstance(results[4].error, ValueError) and results[4].image is None
+    assert all(r.error is None for i, r in enumerate(results) if i != 4)
+
+
+def test_iter_pipeline_completion_order_yields_every_item(pool, image_paths):
+    """Tests that unordered mode yields each item exactly once."""
+    results = pipeline.iter_pipeline(
+        iter(image_paths), ["Canny"], True, ordered=False, pool=pool
+    )
+    assert sorted(r.index for r in results) == list(range(len(image_paths)))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_iter_pipeline_bounds_paths_pulled_ahead(pool, image_paths, ordered):
+    """Tests that a lazy source is read at most `max_in_flight` paths ahead of the consumer."""
+    taken = []
+
+    def source():
+        for path in image_paths * 3:
+            taken.append(path)
+            yield path
+
+    results = pipeline.iter_pipeline(
+        source(), ["Sobel"], False, ordered=ordered, max_in_flight=4, pool=pool
+    )
+    assert taken == []  # nothing is read before the first result is asked for
+    ahead = []
+    for done, _ in enumerate(results, 1):
+        ahead.append(len(taken) - done)
+        time.sleep(0.005)
+
+    assert len(ahead) == len(taken) == 3 * len(image_paths)
+    assert max(ahead) <= 4
+
+
+def test_pipeline_output_matches_golden_image(pool):
+    """Tests that images processed in the pool match the golden images."""
+    (result,) = pipeline.iter_pipeline([TEST_IMAGE_PATH], ["Sobel"], False, pool=pool)
+    golden_image = io_utils.load_image(GOLDEN_IMAGE_DIR / "sobel.png")
+
+    assert (result.image == golden_image).all()
+
+
+def test_pool_is_reused_across_batches(pool, image_paths):
+    """Tests that consecutive batches run on the same worker processes."""
+    pool.warmup()
+    first = set(pool.executor._processes)
+    list(pipeline.iter_pipeline(image_paths, [], False, pool=pool))
+    second = set(pool.executor._processes)
+
+    assert first == second and len(first) == pool.max_workers
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    """Tests that a pool whose worker died is rebuilt on the next submission."""
+    pool = workers.WorkerPool(max_workers=1)
+    try:
+        with pytest.raises(workers.BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+        assert pool.submit(os.getpid).result() != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_iter_pipeline_returns_previews_from_the_same_decode(pool, image_paths):
+    """Tests the optional reduced preview of each original image."""
+    results = list(pipeline.iter_pipeline(image_paths, ["Sobel"], False, pool=pool, preview_size=16))
+
+    assert results[4].preview is None
+    for result in results[:4] + results[5:]:
+        assert result.preview.shape == (16, 16, 3)
+        original = io_utils.load_image(result.path)
+        assert (result.preview == io_utils.make_preview(original, 16)).all()
+    (result,) = pipeline.iter_pipeline(image_paths[:1], [], False, pool=pool)
+    assert result.preview is None
@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+import pytest
+from pathlib import Path
+from project.src import chain
+from project.src import filters
+from project.src import io_utils
+from project.src import registry
+from project.src import tiling
+
+COLOR_TEST_IMAGE_PATH = Path("project/data/color_test_image.png")
+
+
+@pytest.fixture
+def invert():
+    """A cheap, tileable filter registered for the duration of a test."""
+
+    def operation(src, dst, ws, amount=255):
+        cv2.subtract(amount, src, dst=dst)
+
+    spec = registry.register(
+        registry.FilterSpec(
+            "Invert",
+            operation,
+            (registry.Parameter("amount", int, 255, 0, 255),),
+            cost=registry.PIXEL,
+            tileable=True,
+            halo=lambda params: 0,
+        )
+    )
+    yield spec
+    del registry.FILTERS["Invert"]
+
+
+def test_resolve_applies_defaults_and_validates():
+    """Tests the normalized steps and the parameter validation."""
+    assert registry.resolve("Canny") == registry.resolve(("Canny", {"low_threshold": 100}))
+    assert registry.resolve(("Sobel", {"ksize": 3})).params == (("ksize", 3),)
+
+    with pytest.raises(ValueError, match="ksize"):
+        registry.resolve(("Sobel", {"ksize": 4}))
+    with pytest.raises(ValueError, match="sigma"):
+        registry.resolve(("Gaussian Blur", {"sigma": 2}))
+    with pytest.raises(ValueError, match="low_threshold"):
+        registry.resolve(("Canny", {"low_threshold": "50"}))
+    with pytest.raises(ValueError, match="Emboss, Blur"):
+        registry.resolve_all(["Sobel", "Emboss", "Blur"])
+
+
+def test_parse_command_line_filters():
+    """Tests the `Nombre:parámetro=valor` syntax of src.batch."""
+    assert registry.parse("Sharpen") == ("Sharpen", {})
+    assert registry.parse("Canny:low_threshold=50, high_threshold=150") == (
+        "Canny",
+        {"low_threshold": 50, "high_threshold": 150},
+    )
+    with pytest.raises(ValueError):
+        registry.parse("Canny:low=50")
+    with pytest.raises(ValueError):
+        registry.parse("Canny:low_threshold=fifty")
+
+
+@pytest.mark.parametrize(
+    "filter_name, params, function",
+    [
+        ("Sobel", {"ksize": 3}, lambda image: filters.apply_sobel(image, ksize=3)),
+        (
+            "Canny",
+            {"low_threshold": 300, "high_threshold": 600},
+            lambda image: filters.apply_canny(image, 300, 600),
+        ),
+        (
+            "Gaussian Blur",
+            {"kernel_size": 9},
+            lambda image: filters.apply_gaussian_blur(image, (9, 9)),
+        ),
+    ],
+)
+def test_parameters_reach_chain_and_tiles(filter_name, params, function):
+    """Tests that non-default parameters give the same result fused, tiled and alone."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    expected = function(image)
+
+    assert not (expected == chain.apply_chain(image, [filter_name])).all()
+    assert (chain.apply_chain(image, [(filter_name, params)]) == expected).all()
+    assert (tiling.apply_tiled(image, (filter_name, params), tile_size=32) == expected).all()
+
+
+def test_registered_filter_runs_everywhere(invert):
+    """Tests that a plugin filter is planned, cached, tiled and scheduled from its declaration."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    selected = [("Invert", {"amount": 200}), "Gaussian Blur"]
+    expected = filters.apply_gaussian_blur(cv2.subtract(200, image))
+
+    steps = chain.plan(selected)
+    assert chain.is_deterministic(steps) and not registry.is_cheap(steps)
+    assert registry.is_cheap(chain.plan(["Invert"]))
+    assert (chain.apply_chain(image, selected) == expected).all()
+    assert (tiling.apply_chain_tiled(image, selected, tile_size=40) == expected).all()
+    assert "Invert" in registry.names()
+
+
+def test_untileable_filter_is_rejected():
+    """Tests that filters not declared tileable are never tiled."""
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    assert not tiling.should_tile(image, ["Random Hue Shift"])
+    with pytest.raises(ValueError):
+        tiling.apply_tiled(image, "Random Hue Shift")
+    with pytest.raises(ValueError):
+        registry.register(registry.FilterSpec("Sobel", None))
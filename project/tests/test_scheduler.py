@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+from project.src import scheduler
+
+
+def test_stages_follow_dependencies():
+    """Tests that each stage gets the values of its dependencies, with batching."""
+    batches = []
+
+    def label(batch):
+        batches.append(len(batch))
+        return [f"label{inputs[scheduler.SOURCE]}" for _, inputs in batch]
+
+    stages = scheduler.Scheduler()
+    stages.add("double", lambda key, inputs: inputs[scheduler.SOURCE] * 2, workers=2)
+    stages.add("label", label, batch_size=4, max_wait=0.2)
+    stages.add(
+        "save",
+        lambda key, inputs: (key, inputs["double"], inputs["label"]),
+        after=("double", "label"),
+    )
+
+    outcomes = {outcome.key: outcome for outcome in stages.run((i, i) for i in range(10))}
+
+    assert sorted(outcomes) == list(range(10))
+    for key, outcome in outcomes.items():
+        assert outcome.error is None
+        assert outcome.values["save"] == (key, 2 * key, f"label{key}")
+    assert sum(batches) == 10 and max(batches) <= 4
+    assert stages.stats["label"]["items"] == 10
+    assert stages.stats["label"]["calls"] == len(batches)
+
+
+def test_independent_stages_overlap():
+    """Tests that the batch takes about as long as its slowest stage, not the sum."""
+
+    def source():
+        for index in range(8):
+            time.sleep(0.02)
+            yield index, index
+
+    def slow(seconds):
+        return lambda key, inputs: time.sleep(seconds)
+
+    stages = scheduler.Scheduler()
+    stages.add("filters", slow(0.02))
+    stages.add("classify", lambda batch: time.sleep(0.04) or [None] * len(batch), batch_size=4)
+    stages.add("save", slow(0.02), after=("filters", "classify"))
+
+    start = time.perf_counter()
+    assert len(list(stages.run(source()))) == 8
+    elapsed = time.perf_counter() - start
+
+    sequential = 8 * 0.02 * 3 + 2 * 0.04
+    assert elapsed < 0.75 * sequential
+    assert all(stats["busy_s"] > 0 for stats in stages.stats.values())
+
+
+def test_stream_stages_run_beside_the_other_branches():
+    """Tests a stage computed outside the scheduler, in its own order and time."""
+    released = threading.Event()
+    labelled = []
+
+    def filtered():
+        # Nothing is filtered until every item went through the other branch
+        released.wait(5)
+        for key in (3, 1, 0):
+            yield key, f"image{key}"
+        yield 2, OSError("unreadable")
+
+    def label(key, inputs):
+        labelled.append(key)
+        if len(labelled) == 5:
+            released.set()
+        return inputs[scheduler.SOURCE].upper()
+
+    stages = scheduler.Scheduler()
+    stages.add_stream("filters", filtered())
+    stages.add("label", label)
+    stages.add(
+        "save",
+        lambda key, inputs: (inputs["filters"], inputs["label"]),
+        after=("filters", "label"),
+    )
+
+    outcomes = {outcome.key: outcome for outcome in stages.run((i, f"e{i}") for i in range(5))}
+
+    assert released.is_set() and sorted(labelled) == [0, 1, 2, 3, 4]
+    assert outcomes[3].values["save"] == ("image3", "E3")
+    assert outcomes[2].stage == "filters" and isinstance(outcomes[2].error, OSError)
+    # Key 4 never came out of the stream
+    assert outcomes[4].stage == "filters" and isinstance(outcomes[4].error, ValueError)
+    assert stages.stats["filters"]["items"] == 3
+
+
+def test_failures_skip_the_remaining_stages():
+    """Tests errors from a stage, from the source values and from the source itself."""
+    calls = []
+
+    def check(key, inputs):
+        if key == 2:
+            raise ValueError("bad")
+        return key
+
+    stages = scheduler.Scheduler()
+    stages.add("check", check)
+    stages.add("save", lambda key, inputs: calls.append(key), after=("check",))
+    source = [(0, 0), (1, OSError("unreadable")), (2, 2), (3, 3)]
+
+    outcomes = {outcome.key: outcome for outcome in stages.run(source)}
+
+    assert outcomes[1].stage == scheduler.SOURCE and isinstance(outcomes[1].error, OSError)
+    assert outcomes[2].stage == "check" and str(outcomes[2].error) == "bad"
+    assert outcomes[0].error is None and outcomes[3].error is None
+    assert sorted(calls) == [0, 3]
+
+    def broken():
+        yield 0, 0
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError):
+        list(stages.run(broken()))
+    assert not any(thread.name.startswith("photolab-") for thread in threading.enumerate())
+
+
+def test_batches_with_missing_values_fail():
+    """Tests that a batched stage returning too few values fails its items."""
+    stages = scheduler.Scheduler()
+    stages.add("short", lambda batch: [1] * (len(batch) - 1), batch_size=4)
+
+    outcomes = list(stages.run((i, i) for i in range(4)))
+
+    assert sorted(outcome.key for outcome in outcomes) == [0, 1, 2, 3]
+    assert all(isinstance(outcome.error, ValueError) for outcome in outcomes)
+    assert all(outcome.stage == "short" for outcome in outcomes)
+
+
+def test_full_queues_hold_back_the_source():
+    """Tests the backpressure of a slow stage on the items taken from the source."""
+    taken = []
+
+    def source():
+        for index in range(30):
+            taken.append(index)
+            yield index, index
+
+    stages = scheduler.Scheduler()
+    stages.add("slow", lambda key, inputs: time.sleep(0.005), queue_size=2)
+    ahead = [len(taken) - done for done, _ in enumerate(stages.run(source()), 1)]
+
+    # Queued, being processed, handed over and the one the source is trying to deliver
+    assert max(ahead) <= 2 + 1 + 2 + 1
+    assert len(ahead) == 30
+
+
+def test_add_validates_the_graph():
+    """Tests that stages need known, earlier dependencies and unique names."""
+    stages = scheduler.Scheduler()
+    stages.add("a", lambda key, inputs: None)
+    with pytest.raises(ValueError):
+        stages.add("a", lambda key, inputs: None)
+    with pytest.raises(ValueError):
+        stages.add("b", lambda key, inputs: None, after=("c",))
+    with pytest.raises(ValueError):
+        stages.add(scheduler.SOURCE, lambda key, inputs: None)
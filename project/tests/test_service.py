@@ -0,0 +1,196 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+from project.src import ml, service, workers
+
+
+@pytest.fixture(scope="module")
+def server():
+    """A service on a free port, with a one-worker pool and a stand-in classifier."""
+    pool = workers.WorkerPool(max_workers=1)
+    batches = []
+
+    def classify(previews):
+        batches.append(len(previews))
+        return [ml.LABELS[0] if preview.mean() > 20 else ml.LABELS[3] for preview in previews]
+
+    app = service.Service(pool, classify=classify, max_wait=0.01)
+    port = app.start_in_thread("127.0.0.1", 0)
+    yield app, port, batches
+    app.stop()
+    pool.shutdown()
+
+
+@pytest.fixture
+def photo():
+    image = np.zeros((120, 160, 3), dtype=np.uint8)
+    cv2.rectangle(image, (40, 30), (120, 90), (0, 128, 255), -1)
+    return image
+
+
+def request(port, method, target, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request(method, target, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def test_process_upload_and_path(server, photo, tmp_path):
+    """Tests uploads, paths, the encoded response, the saved output and classification."""
+    _, port, batches = server
+    upload = cv2.imencode(".png", photo)[1].tobytes()
+
+    status, headers, body = request(
+        port, "POST", "/process?filters=Sobel&filters=Canny:low_threshold=50&format=png", upload
+    )
+    assert status == 200 and headers["Content-Type"] == "image/png"
+    assert cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR).shape == (120, 160, 3)
+    assert json.loads(headers["X-PhotoLab-Result"])["label"] is None
+
+    path = tmp_path / "photo.png"
+    cv2.imwrite(str(path), photo)
+    output = tmp_path / "out.jpg"
+    payload = {"path": str(path), "filters": ["Gaussian Blur"], "colors": 2, "output": str(output)}
+    status, _, body = request(
+        port,
+        "POST",
+        "/classify",
+        json.dumps(payload),
+        {"Content-Type": "application/json"},
+    )
+    result = json.loads(body)
+    assert status == 200 and output.exists() and result["output"] == str(output)
+    assert (result["width"], result["height"], len(result["colors"])) == (160, 120, 2)
+    assert result["label"] == ml.LABELS[0] and result["category"] == "person"
+    assert batches == [1]
+
+
+def test_bad_requests(server, tmp_path):
+    """Tests the error responses, which keep the service running."""
+    _, port, _ = server
+    assert request(port, "POST", "/process?filters=Nope", b"x")[0] == 400
+    assert request(port, "POST", "/process")[0] == 400
+    assert request(port, "POST", "/process", b"not an image")[0] == 400
+    assert request(port, "POST", f"/process?path={tmp_path / 'missing.png'}")[0] == 400
+    assert request(port, "GET", "/process")[0] == 405
+    assert request(port, "GET", "/nowhere")[0] == 404
+    assert request(port, "GET", "/health")[0] == 200
+
+
+def test_full_queues_answer_429(server, photo):
+    """Tests the backpressure responses and the metrics that count them."""
+    app, port, _ = server
+    upload = cv2.imencode(".png", photo)[1].tobytes()
+    app.pending = app.max_pending
+    try:
+        status, headers, _ = request(port, "POST", "/process", upload)
+    finally:
+        app.pending = 0
+    assert status == 429 and headers["Retry-After"] == "1"
+
+    assert request(port, "POST", "/process", upload)[0] == 200
+    status, _, body = request(port, "GET", "/metrics")
+    metrics = json.loads(body)
+    process = metrics["requests"]["/process"]
+    assert process["rejected"] >= 1 and process["p99_ms"] >= process["p50_ms"] > 0
+    assert metrics["queues"]["pool_limit"] == app.max_pending
+    assert metrics["queues"]["pool_pending"] == 0
+
+
+def test_classification_slots_are_reserved_before_the_pool(server, photo, tmp_path):
+    """Tests that classification is refused up front and that failures free the slot."""
+    app, port, _ = server
+    upload = cv2.imencode(".png", photo)[1].tobytes()
+    app.classifying = app.batcher.queue_size
+    try:
+        assert request(port, "POST", "/process?classify=1", upload)[0] == 429
+        assert request(port, "POST", "/process", upload)[0] == 200
+    finally:
+        app.classifying = 0
+
+    assert request(port, "POST", f"/process?classify=1&path={tmp_path / 'missing.png'}")[0] == 400
+    assert request(port, "POST", "/process?classify=1", upload)[0] == 200
+    queues = json.loads(request(port, "GET", "/metrics")[2])["queues"]
+    assert queues["classify_reserved"] == 0 and queues["pool_pending"] == 0
+
+
+def test_micro_batches():
+    """Tests that concurrent calls share batches, up to the size and the deadline."""
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        if 13 in items:
+            raise ValueError("unlucky")
+        return [2 * item for item in items]
+
+    async def scenario():
+        batcher = service.MicroBatcher(double, batch_size=4, max_wait=0.05, queue_size=16)
+        batcher.start()
+        try:
+            results = await asyncio.gather(*(batcher.submit(item) for item in range(10)))
+            start = time.perf_counter()
+            late = await batcher.submit(100)
+            waited = time.perf_counter() - start
+            with pytest.raises(ValueError):
+                await batcher.submit(13)
+            return results, late, waited, dict(batcher.stats)
+        finally:
+            await batcher.close()
+
+    results, late, waited, stats = asyncio.run(scenario())
+
+    assert results == [2 * item for item in range(10)] and late == 200
+    assert sizes[:3] == [4, 4, 2] and sizes[3] == 1
+    assert 0.04 <= waited < 1
+    assert stats["batches"] == 5 and stats["max_size"] == 4
+
+    release = threading.Event()
+
+    async def overflow():
+        batcher = service.MicroBatcher(lambda items: release.wait() and items, 1, 0, 1)
+        batcher.start()
+        try:
+            running = asyncio.ensure_future(batcher.submit(1))
+            while not batcher.in_flight:
+                await asyncio.sleep(0.001)
+            waiting = asyncio.ensure_future(batcher.submit(2))
+            await asyncio.sleep(0)
+            with pytest.raises(service.Busy):
+                await batcher.submit(3)
+            release.set()
+            return await running, await waiting
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(overflow()) == (1, 2)
+
+
+def test_micro_batches_with_missing_results_fail():
+    """Tests that a batch function returning too few results fails every request."""
+
+    async def scenario():
+        batcher = service.MicroBatcher(lambda items: items[:-1], 4, 0.05, 16)
+        batcher.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    *(batcher.submit(item) for item in range(3)), return_exceptions=True
+                ),
+                5,
+            )
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(scenario())
+
+    assert len(results) == 3 and all(isinstance(result, ValueError) for result in results)
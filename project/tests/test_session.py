@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import pytest
+from project.src import dedup, ml, session, workers
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2, chunksize=2)
+    yield pool
+    pool.shutdown()
+
+
+def encoded(seed, size=(480, 640)):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, size + (3,), dtype=np.uint8)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def test_uploads_are_stored_once(tmp_path):
+    """Tests that a file is written and thumbnailed once, and found again by content or key."""
+    state = session.Session(tmp_path)
+    data = encoded(0)
+
+    first = state.add("a.png", data, key="upload-1")
+    first.path.unlink()
+    again = state.add("a.png", data, key="upload-1")
+    renamed = state.add("copy of a.png", data)
+
+    assert again is first and renamed is first
+    assert not first.path.exists()  # not rewritten
+    assert max(first.thumbnail.shape[:2]) == session.THUMBNAIL_SIZE
+    # A known key skips hashing the content
+    assert state.add("a.png", b"", key="upload-1") is first
+
+    other = state.add("a.png", encoded(1))
+    assert other.digest != first.digest and other.path != first.path
+    assert state.add("broken.png", b"not an image").thumbnail is None
+
+
+def test_only_new_combinations_are_pending(tmp_path):
+    """Tests that results are kept per (image, filter chain) and labels per image."""
+    state = session.Session(tmp_path)
+    files = [state.add(f"{i}.png", encoded(i)) for i in range(3)]
+    sobel = state.chain_key([("Sobel", {"ksize": 5})], False, "exact")
+    assert sobel == state.chain_key(["Sobel"], False, "exact")
+
+    assert state.pending(files, sobel) == files
+    processed = state.record(files[0], sobel, np.zeros((1080, 1920, 3), np.uint8), 1, "out.png")
+    state.record(files[1], sobel, np.zeros((10, 10, 3), np.uint8), False)
+    state.labels[files[0].digest] = "a photo of a cat"
+
+    assert state.pending(files, sobel) == [files[2]]
+    assert state.result(files[0], sobel) is processed
+    assert processed.faces_detected is True and processed.output == "out.png"
+    assert max(processed.thumbnail.shape[:2]) == session.RESULT_THUMBNAIL_SIZE
+    assert state.pending(files, state.chain_key(["Sobel"], True, "exact")) == files
+    assert state.unlabeled(files) == files[1:]
+
+
+def test_process_classifies_one_image_per_group(tmp_path, pool, monkeypatch):
+    """Tests that near-duplicates share the filtering and the CLIP pass of their group."""
+    classified = []
+
+    def classify_batch(images, store=None, names=None):
+        classified.extend(images)
+        return [[ml.LABELS[0]] for _ in images]
+
+    monkeypatch.setattr(ml, "classify_batch", classify_batch)
+    state = session.Session(tmp_path / "uploads")
+    files = []
+    for seed in range(2):
+        noise = np.random.default_rng(seed).integers(0, 256, (240, 320, 3), np.uint8)
+        image = cv2.GaussianBlur(noise, (31, 31), 0)
+        for shift in range(3):
+            # Slightly brighter copies of the same photo
+            data = cv2.imencode(".png", cv2.add(image, (shift, shift, shift, 0)))[1].tobytes()
+            files.append(state.add(f"{seed}_{shift}.png", data))
+    key = state.chain_key(["Sobel"], False, "exact")
+
+    results = {
+        entry.name: processed
+        for entry, processed in state.process(
+            files, key, ["Sobel"], False, tmp_path / "output", dedup.Deduplicator(8), pool=pool
+        )
+    }
+
+    assert len(classified) == 2
+    assert sorted(results) == sorted(entry.name for entry in files)
+    assert all(isinstance(processed, session.Processed) for processed in results.values())
+    assert state.unlabeled(files) == [] and state.pending(files, key) == []
+    category = ml.category(ml.LABELS[0])
+    assert all((tmp_path / "output" / category / entry.name).exists() for entry in files)
+
+    # Everything is labelled already: nothing goes through CLIP again
+    other = state.chain_key(["Sharpen"], False, "exact")
+    results = list(state.process(files, other, ["Sharpen"], False, tmp_path / "again", pool=pool))
+    assert len(results) == 6
+    assert len(classified) == 2
@@ -0,0 +1,57 @@
+import json
+
+from project.profiling import suite
+
+
+def results(**values):
+    metrics = {}
+    for name, value in values.items():
+        better = "higher" if name.startswith("throughput") else "lower"
+        unit = "img/s" if better == "higher" else "ms"
+        metrics[name] = {"value": value, "unit": unit, "better": better}
+    return {"machine": suite.machine_info(), "metrics": metrics}
+
+
+def test_compare_flags_regressions_in_both_directions():
+    """Tests that slower timings and lower throughput past the threshold are regressions."""
+    baseline = results(slow=10.0, fast=10.0, noise=0.02, same=5.0, throughput=20.0)
+    current = results(slow=12.0, fast=7.0, noise=0.04, same=5.2, throughput=15.0, new=1.0)
+
+    status = {row["metric"]: row["status"] for row in suite.compare(baseline, current, 0.15)}
+
+    assert status == {
+        "slow": "REGRESSION",
+        "fast": "improved",
+        "noise": "ok",
+        "same": "ok",
+        "throughput": "REGRESSION",
+    }
+    assert suite.compare(baseline, current, 0.5)[0]["status"] == "ok"
+
+
+def test_run_and_compare_command(tmp_path, capsys):
+    """Tests a small run end to end: the JSON file, the machine info and the exit codes."""
+    output = tmp_path / "results.json"
+
+    arguments = ["--sections", "filters", "--resolutions", "VGA", "--repeat", "1"]
+    assert suite.main(["run", *arguments, "--output", str(output)]) == 0
+    saved = json.loads(output.read_text())
+    assert saved["machine"]["cpu_count"] and saved["config"]["sections"] == ["filters"]
+    assert set(saved["metrics"]) == {f"filters/{name}/VGA" for name in suite.FILTER_FUNCTIONS}
+
+    faster = json.loads(output.read_text())
+    for metric in faster["metrics"].values():
+        metric["value"] /= 10
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(faster))
+    assert suite.main(["compare", str(baseline), str(output), "--min-delta-ms", "0"]) == 1
+    assert suite.main(["compare", str(output), str(output)]) == 0
+
+    # A metric of the baseline that was not measured this time
+    partial = json.loads(output.read_text())
+    partial["metrics"].popitem()
+    current = tmp_path / "partial.json"
+    current.write_text(json.dumps(partial))
+    assert suite.main(["compare", str(output), str(current)]) == 1
+    assert suite.main(["compare", str(output), str(current), "--allow-missing"]) == 0
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,123 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from pathlib import Path
+from project.src import filters
+from project.src import gen
+from project.src import io_utils
+from project.src import pipeline
+from project.src import tiling
+
+COLOR_TEST_IMAGE_PATH = Path("project/data/color_test_image.png")
+
+SEQUENTIAL = {
+    "Sobel": filters.apply_sobel,
+    "Canny": filters.apply_canny,
+    "Gaussian Blur": filters.apply_gaussian_blur,
+    "Sharpen": filters.apply_sharpen,
+}
+
+
+def random_image(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("tile_size", [17, 64, 100])
+@pytest.mark.parametrize("filter_name", sorted(SEQUENTIAL))
+def test_tiled_filter_matches_full_image(filter_name, tile_size):
+    """Tests that tiled output is pixel-identical, including tiles cut at the edges."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    expected = SEQUENTIAL[filter_name].__wrapped__(image)
+
+    tiled = tiling.apply_tiled(image, filter_name, tile_size=tile_size, max_workers=4)
+
+    assert (tiled == expected).all()
+
+
+@pytest.mark.parametrize("filter_name", sorted(SEQUENTIAL))
+def test_tiled_filter_matches_full_image_on_noise(filter_name):
+    """Tests a non-divisible image size with strong gradients in every tile."""
+    image = random_image(301, 457)
+
+    tiled = tiling.apply_tiled(image, filter_name, tile_size=50)
+
+    assert (tiled == SEQUENTIAL[filter_name].__wrapped__(image)).all()
+
+
+def test_canny_hysteresis_crosses_tiles():
+    """Tests that a weak edge is kept when its strong part lies in another tile."""
+    image = np.zeros((64, 256, 3), dtype=np.uint8)
+    # A horizontal edge whose contrast fades from strong (left) to weak (right)
+    image[32:, :, :] = np.linspace(255, 40, 256, dtype=np.uint8)[None, :, None]
+    expected = filters.apply_canny.__wrapped__(image)
+
+    tiled = tiling.apply_tiled(image, "Canny", tile_size=16)
+
+    assert expected[:, 200:].any()
+    assert (tiled == expected).all()
+
+
+
+def test_tiled_canny_keeps_no_full_size_maps():
+    """Tests that tiled Canny allocates little more than its output, with no full-size maps."""
+    image = random_image(1024, 1024)
+    pixels = image.shape[0] * image.shape[1]
+
+    tracemalloc.start()
+    try:
+        edges = tiling.apply_tiled(image, "Canny", tile_size=128, max_workers=1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert (edges == filters.apply_canny.__wrapped__(image)).all()
+    # The output (3 bytes per pixel) plus less than one byte per pixel of work; full-size
+    # weak, strong and label maps would take 6
+    assert peak - edges.nbytes < pixels
+
+def test_chain_tiled_matches_sequential_filters():
+    """Tests that a tiled chain matches applying each filter in turn."""
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+    filter_names = ["Gaussian Blur", "Sharpen", "Sobel", "Canny"]
+    expected = image
+    for filter_name in filter_names:
+        expected = SEQUENTIAL[filter_name].__wrapped__(expected)
+
+    assert (tiling.apply_chain_tiled(image, filter_names, tile_size=40) == expected).all()
+
+
+def test_tile_windows_cover_image_in_tiles_order():
+    """Tests that the cores of the windows are exactly the tiles of `gen.tiles`."""
+    image = random_image(70, 45)
+
+    windows = list(gen.tile_windows(70, 45, 20, 30, halo=3))
+    tiles = list(gen.tiles(image, 20, 30))
+
+    assert len(windows) == len(tiles)
+    for (window, core), tile in zip(windows, tiles):
+        assert (image[window][core] == tile).all()
+
+
+def test_should_tile(monkeypatch):
+    """Tests the pixel threshold and that untileable filters disable tiling."""
+    monkeypatch.setitem(tiling.settings, "threshold", 100)
+    image = random_image(20, 20)
+
+    assert tiling.should_tile(image, ["Sobel", "Sharpen"])
+    assert not tiling.should_tile(image, ["Sobel", "Random Hue Shift"])
+    assert not tiling.should_tile(image, [])
+    assert not tiling.should_tile(random_image(5, 5), ["Sobel"])
+    with pytest.raises(ValueError):
+        tiling.apply_tiled(image, "Random Hue Shift")
+
+
+def test_process_image_uses_tiles_above_threshold(monkeypatch):
+    """Tests that the pipeline result is unchanged when the tiled path is taken."""
+    monkeypatch.setitem(tiling.settings, "threshold", 0)
+    monkeypatch.setitem(tiling.settings, "tile_size", 64)
+    image = io_utils.load_image(COLOR_TEST_IMAGE_PATH)
+
+    processed, _ = pipeline.process_image(COLOR_TEST_IMAGE_PATH, ["Sobel"], False)
+
+    assert (processed == filters.apply_sobel.__wrapped__(image)).all()
@@ -0,0 +1,71 @@
+import os
+import time
+import numpy as np
+import pytest
+from project.src import pipeline
+from project.src import transport
+from project.src import workers
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """A small persistent pool shared by the tests in this module."""
+    pool = workers.WorkerPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("mode", ["shm", "mmap"])
+def test_export_import_round_trip(mode):
+    """Tests that an exported image comes back intact and its file is released."""
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    shared = transport.export_image(
+        image, transport.directory_for(mode), transport.owner_prefix()
+    )
+    received = transport.import_image(shared)
+
+    assert (received == image).all() and received.dtype == image.dtype
+    assert not os.path.exists(shared.path)
+
+    # The view stays usable (and writable) after the file is gone
+    received[0, 0] = 7
+    assert (received[0, 0] == 7).all()
+
+
+@pytest.mark.parametrize("mode", ["shm", "mmap"])
+def test_pipeline_transport_matches_copy(pool, image_paths, mode):
+    """Tests that shared-memory results equal copied results and leave no files."""
+    copied = list(pipeline.iter_pipeline(image_paths, ["Sharpen"], True, pool=pool))
+    shared = list(
+        pipeline.iter_pipeline(
+            image_paths, ["Sharpen"], True, pool=pool, transport_mode=mode
+        )
+    )
+
+    for a, b in zip(copied, shared):
+        assert (a.error is None) == (b.error is None)
+        if a.error is None:
+            assert (a.image == b.image).all()
+    assert transport.sweep() == 0
+
+
+def test_abandoned_batch_leaves_no_files(pool, image_paths):
+    """Tests that results nobody consumed are discarded when a batch is closed early."""
+    results = pipeline.iter_pipeline(
+        image_paths, ["Sharpen"], False, pool=pool, transport_mode="shm"
+    )
+    next(results)
+    results.close()
+
+    # Tasks that were already running are discarded as soon as they finish
+    directory = transport.directory_for("shm")
+    deadline = time.monotonic() + 10
+    while list(directory.glob(f"{transport.owner_prefix()}*")):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_unknown_transport_is_rejected():
+    """Tests that an invalid transport name raises a clear error."""
+    with pytest.raises(ValueError):
+        transport.directory_for("carrier-pigeon")
@@ -0,0 +1,89 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from project.src import video
+from project.tests.faces import synthetic_faces
+
+
+@pytest.fixture(scope="module")
+def face_frame():
+    image, _ = synthetic_faces(320, 240, [96], seed=1)
+    return image
+
+
+@pytest.fixture
+def clip(tmp_path, face_frame):
+    """A 24-frame synthetic clip with a face moving to the right."""
+    path = tmp_path / "clip.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 24, (320, 240))
+    for index in range(24):
+        writer.write(np.roll(face_frame, 2 * index, axis=1))
+    writer.release()
+    return path
+
+
+def test_frames_keep_order_and_carry_boxes(face_frame):
+    """Tests the ordered delivery, the detection stride and the carried face boxes."""
+    frames = []
+    for index in range(10):
+        frame = face_frame.copy()
+        frame[0, 0] = index  # marks the frame
+        frames.append(frame)
+
+    results = list(video.process_frames(frames, [], True, detect_every=3, workers=4))
+
+    assert [frame.index for frame in results] == list(range(10))
+    assert [int(frame.image[0, 0, 0]) for frame in results] == list(range(10))
+    assert [frame.detected for frame in results] == [i % 3 == 0 for i in range(10)]
+    assert all(len(frame.faces) == 1 for frame in results)
+    for frame in results:
+        detected = results[frame.index - frame.index % 3]
+        np.testing.assert_array_equal(frame.faces, detected.faces)
+    # The boxes are drawn on a copy
+    assert not np.array_equal(results[1].image, frames[1])
+    assert np.array_equal(frames[1][1:], face_frame[1:])
+
+
+def test_frames_in_memory_are_bounded(face_frame):
+    """Tests that the stream is consumed lazily, with a bounded number of frames in flight."""
+    produced = []
+
+    def stream():
+        for index in range(40):
+            produced.append(index)
+            yield face_frame
+
+    ahead = []
+    for frame in video.process_frames(stream(), ["Sobel"], workers=2, in_flight=3):
+        ahead.append(len(produced) - frame.index)
+    assert max(ahead) <= 3
+    assert len(ahead) == 40
+
+
+def test_process_video(clip, tmp_path):
+    """Tests the re-encoded output, the frame step and the summary."""
+    output = tmp_path / "out.avi"
+
+    summary = video.process_video(
+        clip, output, ["Gaussian Blur"], True, step=2, detect_every=2, codec="MJPG"
+    )
+
+    assert summary["frames"] == 12 and summary["detected"] == 6
+    assert summary["with_faces"] == 12 and summary["fps"] > 0
+    info = video.video_info(output)
+    assert (info.frames, info.width, info.height) == (12, 320, 240)
+    assert info.fps == pytest.approx(12)
+    with pytest.raises(ValueError):
+        video.process_video(tmp_path / "missing.avi", output)
+
+
+def test_reader_stops_when_closed(clip):
+    """Tests that closing the frame stream early stops the reader thread."""
+    frames = video.read_frames(clip, queue_size=2)
+    first = next(frames)
+    frames.close()
+
+    assert first.shape == (240, 320, 3)
+    assert not any(thread.name == "photolab-video-reader" for thread in threading.enumerate())